@@ -0,0 +1,585 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                     A* Agenda-Based Parser                      ##
+#####################################################################
+
+
+#####################################################################
+# File:                           AStarParser.py                    #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import heapq
+import math
+import sys
+import time
+import nltk
+from CompiledGrammar import CompiledGrammar
+from ParseResult import ParseResult
+from SpanFeasibility import SpanFeasibility
+
+# Log probability of something impossible:
+IMPOSSIBLE = float("-inf")
+
+
+# Computes the same Viterbi parse as ProbCKYParser, but instead of filling the
+# whole chart it takes the edges (nonterminal over a span) from a priority
+# agenda, best first (Klein & Manning's A* parsing). The priority of an edge is
+# its inside probability times an estimate of its outside probability, i.e.
+# of the best way to complete it to a parse of the whole sentence. The
+# estimates never underestimate the real outside probability, so the first
+# time the start symbol over the whole sentence is popped, its tree is the
+# most probable one and the parser stops right there. Edges with an outside
+# estimate of 0 are never pushed at all. If several trees are equally
+# probable, the parser may return a different one of them than ProbCKYParser.
+#
+# heuristic = outside estimate that is precomputed from the grammar:
+#   "span" (default): best outside probability of a nonterminal for the
+#            number of words on its left and right, with every word
+#            replaced by the best word (context summary estimate, needs NumPy)
+#   "grammar": best outside probability of a nonterminal, ignoring the
+#            sentence (cheap, but much less informed)
+#   "none": no estimate at all (uniform cost search, Knuth's algorithm)
+#
+# unary_closure, lexicon and feasibility have the same meaning as for
+# ProbCKYParser. Unit rules are used directly, the agenda takes care of
+# finding the best chains.
+#
+# After every parse, edges_pushed and edges_popped hold the number of edges
+# put on and taken from the agenda (the exhaustive chart of ProbCKYParser
+# contains every edge that can be built over the sentence).
+class AStarParser(object):
+
+    HEURISTICS = ("span", "grammar", "none")
+
+    def __init__(self, grammar, heuristic="span", unary_closure=False, lexicon=None, feasibility=True):
+        if isinstance(grammar, CompiledGrammar):
+            self.grammar = grammar
+        else:
+            self.grammar = CompiledGrammar.from_grammar(grammar)
+        self.words = []
+
+        if lexicon is not None:
+            self.grammar.attach_lexicon(lexicon)
+
+        self.feasibility = None
+        if feasibility:
+            self.feasibility = SpanFeasibility(self.grammar)
+
+        # Unit rules (child -> list of (lhs, probability)) are only used with
+        # the unary closure, like in ProbCKYParser:
+        self.unary = self.grammar.unary if unary_closure else {}
+
+        # Binary rules indexed by their right child first (right -> left ->
+        # list of (lhs, probability)), for edges that are popped as right child:
+        self.binary_by_right = {}
+        for left, by_right in self.grammar.binary.iteritems():
+            for right, rule_list in by_right.iteritems():
+                self.binary_by_right.setdefault(right, {})[left] = rule_list
+
+        if heuristic == "span":
+            self.estimates = SpanOutsideEstimates(self.grammar, self.unary)
+        elif heuristic == "grammar":
+            self.estimates = GrammarOutsideEstimates(self.grammar, self.unary)
+        elif heuristic == "none":
+            self.estimates = NoOutsideEstimates(self.grammar)
+        else:
+            raise ValueError("Unknown A* heuristic: {0}".format(heuristic))
+        self.heuristic = heuristic
+
+        # Statistics of the last parse:
+        self.edges_pushed = 0
+        self.edges_popped = 0
+
+
+#####################################################################
+#                           A* Parse                                #
+#####################################################################
+
+    # Parses an input sentence and returns the most likely parse as
+    # ParseResult (see ParseResult.py), which can be used like a pair of the
+    # tree and its probability, or None if there is no parse. Has the same
+    # name as the method of ProbCKYParser, so that both parsers can be used
+    # the same way (e.g. by BatchParsing).
+    def prob_cky_parse(self, words):
+        self.words = words
+        self.edges_pushed = 0
+        self.edges_popped = 0
+
+        n = len(words)
+        if n == 0:
+            self.parse_failed()
+            return None
+
+        # Outside estimates for every number of words left (i) and right (r)
+        # of an edge: outside[i][r][nonterminal] (log probabilities):
+        outside = self.estimates.tables(n)
+
+        # Best known inside probability and backpointer of every edge (lhs,
+        # i, j), where the edge covers the words i to j-1. A backpointer is
+        # None for a leaf, (child,) for a unit rule and (k, left, right) for
+        # a binary rule with partition k:
+        best = {}
+        backs = {}
+        # Edges that were popped, i.e. whose best probability is final:
+        finished = set()
+        # Finished edges by their start and their end position: for every
+        # position a dictionary that maps a lhs to the list of (other end,
+        # probability) pairs:
+        starting_at = [{} for position in range(n+1)]
+        ending_at = [{} for position in range(n+1)]
+
+        agenda = []
+
+        # Pushes an edge if it is new or better than before:
+        def discover(lhs, i, j, prob, back):
+            edge = (lhs, i, j)
+            if prob <= 0 or edge in finished or prob <= best.get(edge, 0.0):
+                return
+            estimate = outside[i][n-j][lhs]
+            if estimate == IMPOSSIBLE:
+                return
+            if self.feasibility is not None and not (lhs in self.feasibility.left_set(i) and lhs in self.feasibility.right_set(n-j)):
+                return
+            best[edge] = prob
+            backs[edge] = back
+            heapq.heappush(agenda, (-(math.log(prob) + estimate), edge, prob))
+            self.edges_pushed += 1
+
+        # Lexical rules:
+        for i in range(n):
+            for lhs, prob in self.grammar.lexical_rules(words[i]):
+                discover(lhs, i, i+1, prob, None)
+
+        goal = (self.grammar.start, 0, n)
+        binary = self.grammar.binary
+        binary_by_right = self.binary_by_right
+        unary = self.unary
+
+        while agenda:
+            priority, edge, prob = heapq.heappop(agenda)
+            # Outdated entry of an edge that was pushed again with a better
+            # probability (or already popped):
+            if edge in finished or prob < best[edge]:
+                continue
+            finished.add(edge)
+            self.edges_popped += 1
+
+            # The first complete parse that is popped is the best one:
+            if edge == goal:
+                return ParseResult(self.extract_derivation(goal, backs), words, prob)
+
+            lhs, i, j = edge
+            starting_at[i].setdefault(lhs, []).append((j, prob))
+            ending_at[j].setdefault(lhs, []).append((i, prob))
+
+            # The edge as left child of all finished edges to its right:
+            by_right = binary.get(lhs)
+            if by_right:
+                for right, rule_list, neighbours in matching(by_right, starting_at[j]):
+                    for end, right_prob in neighbours:
+                        for parent, rule_prob in rule_list:
+                            discover(parent, i, end, rule_prob * prob * right_prob, (j, lhs, right))
+
+            # The edge as right child of all finished edges to its left:
+            by_left = binary_by_right.get(lhs)
+            if by_left:
+                for left, rule_list, neighbours in matching(by_left, ending_at[i]):
+                    for begin, left_prob in neighbours:
+                        for parent, rule_prob in rule_list:
+                            discover(parent, begin, j, rule_prob * left_prob * prob, (i, left, lhs))
+
+            # Unit rules over the edge:
+            for parent, rule_prob in unary.get(lhs, ()):
+                discover(parent, i, j, rule_prob * prob, (lhs,))
+
+        # The agenda ran empty without reaching the start symbol:
+        self.parse_failed()
+        return None
+
+
+#####################################################################
+#                           Parse Failed                            #
+#####################################################################
+
+    def parse_failed(self):
+        print "PARSING ERROR: Sentence not in language. \n"
+
+
+#####################################################################
+#                       Extract Derivation                          #
+#####################################################################
+
+    # Returns the derivation of an edge as list of (label, start, end, number
+    # of children) in preorder (see ParseResult.py). The nodes are read from
+    # the backpointers of the parse with an explicit stack instead of
+    # recursion.
+    def extract_derivation(self, edge, backs):
+        nonterminals = self.grammar.nonterminals
+        nodes = []
+        stack = [edge]
+
+        while stack:
+            edge = stack.pop()
+            lhs, i, j = edge
+            back = backs[edge]
+
+            # Leaf node. The input word is at position i:
+            if back is None:
+                nodes.append((nonterminals[lhs], i, j, 0))
+
+            # Unit rule: the child covers the same span
+            elif len(back) == 1:
+                nodes.append((nonterminals[lhs], i, j, 1))
+                stack.append((back[0], i, j))
+
+            # Binary rule. The second child is pushed first, so the first one
+            # comes next in the list:
+            else:
+                k, left, right = back
+                nodes.append((nonterminals[lhs], i, j, 2))
+                stack.append((right, k, j))
+                stack.append((left, i, k))
+
+        return nodes
+
+
+#####################################################################
+#                         Matching Siblings                         #
+#####################################################################
+
+# Generator over all sibling nonterminals that have rules (in a dictionary
+# sibling -> rule list) and finished edges (in a dictionary sibling -> list of
+# edges). Yields (sibling, rule list, edges) and looks up the entries of the
+# smaller dictionary in the larger one.
+def matching(rules, finished):
+    if len(rules) <= len(finished):
+        for sibling, rule_list in rules.iteritems():
+            edges = finished.get(sibling)
+            if edges:
+                yield (sibling, rule_list, edges)
+    else:
+        for sibling, edges in finished.iteritems():
+            rule_list = rules.get(sibling)
+            if rule_list:
+                yield (sibling, rule_list, edges)
+
+
+#####################################################################
+#                        Outside Estimates                          #
+#####################################################################
+
+# All estimates are log probabilities that are at least as high as the best
+# outside probability of a nonterminal in any sentence with the given number
+# of words left and right of it. Each class offers tables(n), which returns
+# outside[i][r] = list of the estimates of all nonterminals for every i + r < n.
+
+# No information at all: every edge has the estimate 1.
+class NoOutsideEstimates(object):
+
+    def __init__(self, grammar):
+        self.row = [0.0] * len(grammar.nonterminals)
+
+    def tables(self, n):
+        return [[self.row] * n for i in range(n)]
+
+
+# Best outside probability of every nonterminal in any context, with the
+# siblings replaced by the best inside probability they can reach over any
+# yield. Does not depend on the number of words.
+class GrammarOutsideEstimates(object):
+
+    def __init__(self, grammar, unary):
+        num_nts = len(grammar.nonterminals)
+        best_inside = best_inside_probabilities(grammar, unary)
+
+        # Best-first search downwards from the start symbol. All factors are
+        # at most 1, so a nonterminal has its best outside probability when it
+        # is popped first:
+        outside = [0.0] * num_nts
+        outside[grammar.start] = 1.0
+        agenda = [(-1.0, grammar.start)]
+        done = set()
+
+        children_of = {}
+        for left, by_right in grammar.binary.iteritems():
+            for right, rule_list in by_right.iteritems():
+                for lhs, prob in rule_list:
+                    children_of.setdefault(lhs, []).append((left, prob * best_inside[right]))
+                    children_of.setdefault(lhs, []).append((right, prob * best_inside[left]))
+        for child, rule_list in unary.iteritems():
+            for lhs, prob in rule_list:
+                children_of.setdefault(lhs, []).append((child, prob))
+
+        while agenda:
+            neg_prob, nt = heapq.heappop(agenda)
+            if nt in done:
+                continue
+            done.add(nt)
+            for child, factor in children_of.get(nt, ()):
+                prob = -neg_prob * factor
+                if prob > outside[child]:
+                    outside[child] = prob
+                    heapq.heappush(agenda, (-prob, child))
+
+        self.row = [math.log(prob) if prob > 0 else IMPOSSIBLE for prob in outside]
+
+    def tables(self, n):
+        return [[self.row] * n for i in range(n)]
+
+
+# Context summary estimate "SX": best outside probability of every nonterminal
+# with exactly l words on its left and r words on its right, where the words
+# are not known, i.e. every sibling gets the best inside probability for its
+# number of words. Computed with NumPy for all rules at once and kept for all
+# sentences, only the tables for longer sentences are added when needed.
+class SpanOutsideEstimates(object):
+
+    def __init__(self, grammar, unary):
+        # Only import NumPy if it is actually needed:
+        import numpy
+        self.numpy = numpy
+        self.num_nts = len(grammar.nonterminals)
+        self.start = grammar.start
+
+        rules = []
+        for left, by_right in grammar.binary.iteritems():
+            for right, rule_list in by_right.iteritems():
+                for lhs, prob in rule_list:
+                    if prob > 0:
+                        rules.append((lhs, left, right, math.log(prob)))
+
+        # The rules sorted by their lhs, their left and their right child, so
+        # that the best value per nonterminal is a segmented reduction:
+        self.by_lhs = self.rule_arrays(sorted(rules, key=lambda rule: rule[0]), 0)
+        self.by_left = self.rule_arrays(sorted(rules, key=lambda rule: rule[1]), 1)
+        self.by_right = self.rule_arrays(sorted(rules, key=lambda rule: rule[2]), 2)
+
+        # Viterbi closure of the unit rules as arrays of (ancestor, child, log
+        # probability of the best chain):
+        closure = []
+        if unary:
+            if grammar.closure is None:
+                grammar.unary_closure()
+            for child, ancestors in grammar.closure.iteritems():
+                for ancestor, prob in ancestors:
+                    closure.append((ancestor, child, math.log(prob)))
+        # Sorted by ancestor for the way up and by child for the way down:
+        self.closure_up = self.closure_arrays(sorted(closure), 0)
+        self.closure_down = self.closure_arrays(sorted(closure, key=lambda pair: pair[1]), 1)
+
+        # inside[k] = best inside log probability of every nonterminal over k
+        # words (index 0 is unused). Preterminals get their best lexical rule,
+        # with an external lexicon every possible PoS tag gets probability 1:
+        lexical = numpy.full(self.num_nts, -numpy.inf)
+        for rule_list in grammar.lexical.itervalues():
+            for lhs, prob in rule_list:
+                if prob > 0:
+                    lexical[lhs] = max(lexical[lhs], math.log(prob))
+        if getattr(grammar, "lexicon", None) is not None:
+            has_rules = set(rule[0] for rule in rules)
+            for ancestors in unary.itervalues():
+                has_rules.update(lhs for lhs, prob in ancestors)
+            for nt in range(self.num_nts):
+                if nt not in has_rules:
+                    lexical[nt] = 0.0
+        self.inside = [None, self.close_upwards(lexical)]
+
+        # outside[(l, r)] = estimate array, as_lists[(l, r)] = the same as list:
+        self.outside = {}
+        self.as_lists = {}
+
+    # Returns the log probabilities and child arrays of the sorted rules and
+    # the segments of equal values in the given column:
+    def rule_arrays(self, rules, column):
+        numpy = self.numpy
+        lhs = numpy.array([rule[0] for rule in rules], dtype=numpy.int32)
+        left = numpy.array([rule[1] for rule in rules], dtype=numpy.int32)
+        right = numpy.array([rule[2] for rule in rules], dtype=numpy.int32)
+        logp = numpy.array([rule[3] for rule in rules], dtype=numpy.float64)
+
+        keys = (lhs, left, right)[column]
+        if len(rules) > 0:
+            starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+        else:
+            starts = numpy.zeros(0, dtype=numpy.int64)
+        return (lhs, left, right, logp, starts, keys[starts])
+
+    # Returns an array with the maximum of values per segment of a sorted rule
+    # array, at the position of the segment's nonterminal:
+    def reduce_segments(self, values, starts, targets):
+        numpy = self.numpy
+        result = numpy.full(self.num_nts, -numpy.inf)
+        if len(starts) > 0:
+            result[targets] = numpy.maximum.reduceat(values, starts)
+        return result
+
+    # Returns the source and log probability arrays of the sorted closure pairs
+    # and the segments of equal targets (column 0 = ancestor, 1 = child):
+    def closure_arrays(self, closure, column):
+        numpy = self.numpy
+        targets = numpy.array([pair[column] for pair in closure], dtype=numpy.int32)
+        sources = numpy.array([pair[1-column] for pair in closure], dtype=numpy.int32)
+        logp = numpy.array([pair[2] for pair in closure], dtype=numpy.float64)
+        if len(closure) > 0:
+            starts = numpy.flatnonzero(numpy.r_[True, targets[1:] != targets[:-1]])
+        else:
+            starts = numpy.zeros(0, dtype=numpy.int64)
+        return (sources, logp, starts, targets[starts])
+
+    # Applies the closure of the unit rules to values, either from a child up
+    # to its ancestors (inside values) or down from an ancestor (outside values).
+    # The closure already contains the best chains, so one step is enough:
+    def close(self, values, closure):
+        sources, logp, starts, targets = closure
+        if len(starts) > 0:
+            values[targets] = self.numpy.maximum(values[targets], self.numpy.maximum.reduceat(values[sources] + logp, starts))
+        return values
+
+    def close_upwards(self, values):
+        return self.close(values, self.closure_up)
+
+    def close_downwards(self, values):
+        return self.close(values, self.closure_down)
+
+    # Best inside log probabilities over k words (computed up to k if needed):
+    def inside_for(self, k):
+        numpy = self.numpy
+        lhs, left, right, logp, starts, targets = self.by_lhs
+        while len(self.inside) <= k:
+            length = len(self.inside)
+            if len(logp) > 0:
+                # All partitions at once, then the best partition per rule:
+                scores = numpy.array([logp + self.inside[m][left] + self.inside[length-m][right]
+                                      for m in range(1, length)]).max(axis=0)
+                values = self.reduce_segments(scores, starts, targets)
+            else:
+                values = numpy.full(self.num_nts, -numpy.inf)
+            self.inside.append(self.close_upwards(values))
+        return self.inside[k]
+
+    # Computes the estimates for l words on the left and r words on the right.
+    # The ones for all smaller contexts have to exist already.
+    def compute(self, l, r):
+        numpy = self.numpy
+        if l == 0 and r == 0:
+            values = numpy.full(self.num_nts, -numpy.inf)
+            values[self.start] = 0.0
+            return self.close_downwards(values)
+
+        values = numpy.full(self.num_nts, -numpy.inf)
+
+        # As left child of a rule, the right sibling covers k of the r words:
+        if r > 0:
+            lhs, left, right, logp, starts, targets = self.by_left
+            if len(logp) > 0:
+                scores = numpy.array([self.outside[(l, r-k)][lhs] + logp + self.inside_for(k)[right]
+                                      for k in range(1, r+1)]).max(axis=0)
+                values = numpy.maximum(values, self.reduce_segments(scores, starts, targets))
+
+        # As right child, the left sibling covers k of the l words:
+        if l > 0:
+            lhs, left, right, logp, starts, targets = self.by_right
+            if len(logp) > 0:
+                scores = numpy.array([self.outside[(l-k, r)][lhs] + logp + self.inside_for(k)[left]
+                                      for k in range(1, l+1)]).max(axis=0)
+                values = numpy.maximum(values, self.reduce_segments(scores, starts, targets))
+
+        return self.close_downwards(values)
+
+    def tables(self, n):
+        # Smaller contexts first:
+        for context in range(n):
+            for l in range(context+1):
+                r = context - l
+                if (l, r) not in self.outside:
+                    self.outside[(l, r)] = self.compute(l, r)
+                    self.as_lists[(l, r)] = self.outside[(l, r)].tolist()
+
+        return [[self.as_lists[(i, r)] if i + r < n else None for r in range(n)] for i in range(n)]
+
+
+#####################################################################
+#                          Helper Functions                         #
+#####################################################################
+
+# Returns the best inside probability every nonterminal can reach over any
+# yield. The values only increase, so we repeat until nothing changes anymore.
+# With an external lexicon, every nonterminal without rules of its own may be
+# a PoS tag and gets probability 1.
+def best_inside_probabilities(grammar, unary):
+    best_inside = [0.0] * len(grammar.nonterminals)
+    for rule_list in grammar.lexical.itervalues():
+        for lhs, prob in rule_list:
+            best_inside[lhs] = max(best_inside[lhs], prob)
+
+    rules = []
+    for left, by_right in grammar.binary.iteritems():
+        for right, rule_list in by_right.iteritems():
+            for lhs, prob in rule_list:
+                rules.append((lhs, prob, left, right))
+    for child, rule_list in unary.iteritems():
+        for lhs, prob in rule_list:
+            rules.append((lhs, prob, child, None))
+
+    if getattr(grammar, "lexicon", None) is not None:
+        has_rules = set(rule[0] for rule in rules)
+        for nt in range(len(best_inside)):
+            if nt not in has_rules:
+                best_inside[nt] = 1.0
+
+    changed = True
+    while changed:
+        changed = False
+        for lhs, prob, left, right in rules:
+            value = prob * best_inside[left]
+            if right is not None:
+                value *= best_inside[right]
+            if value > best_inside[lhs]:
+                best_inside[lhs] = value
+                changed = True
+
+    return best_inside
+
+
+#####################################################################
+#                           Main Script                             #
+#####################################################################
+
+# Parses every sentence with the A* parser and with the exhaustive CKY parser
+# and compares the trees and the number of edges.
+# Command line arguments:
+# [0]: AStarParser.py
+# [1]: grammar file (in CNF)
+# [2]: file with input sentences
+# [3]: optional heuristic (span, grammar or none)
+if __name__ == "__main__":
+    if len(sys.argv) in (3, 4) and sys.argv[3:] in ([], ["span"], ["grammar"], ["none"]):
+        import CKYProbabilisticParser
+        grammar = nltk.data.load("file:{0}".format(sys.argv[1]), 'pcfg')
+        heuristic = sys.argv[3] if len(sys.argv) == 4 else "span"
+        astar = AStarParser(grammar, heuristic)
+        cky = CKYProbabilisticParser.ProbCKYParser(grammar)
+
+        input_file = open(sys.argv[2], 'r')
+        for line in input_file:
+            words = line.split()
+            start_time = time.time()
+            result = astar.prob_cky_parse(words)
+            astar_seconds = time.time() - start_time
+            start_time = time.time()
+            expected = cky.prob_cky_parse(words)
+            cky_seconds = time.time() - start_time
+            entries = cky.chart.memory_usage()["entries"] if expected is not None else 0
+
+            same = (result is None and expected is None) or (result is not None and expected is not None and
+                                                             result[0] == expected[0] and result[1] == expected[1])
+            print "{0} words: {1} pushed, {2} popped, {3} CKY chart entries, {4:.3f} s vs {5:.3f} s, {6}".format(
+                len(words), astar.edges_pushed, astar.edges_popped, entries, astar_seconds, cky_seconds,
+                "same parse" if same else "DIFFERENT PARSE")
+        input_file.close()
+    else:
+        print "USAGE: python AStarParser.py pcfg input_file [heuristic] \n"
+        print "pcfg = A probabilistic context free grammar in CNF. \n"
+        print "input_file = File that contains one sentence per line. \n"
+        print "heuristic = Outside estimate of the A* parser: span (default), grammar or none. \n"
@@ -0,0 +1,209 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                  Multi-Process Batch Parsing                    ##
+#####################################################################
+
+
+#####################################################################
+# File:                           BatchParsing.py                   #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import multiprocessing
+import os
+import time
+
+# Parser of the current worker process and the number of parses per sentence
+# (set by init_worker):
+worker_parser = None
+worker_k_best = None
+
+
+#####################################################################
+#                          Worker Functions                         #
+#####################################################################
+
+# Called once in every worker process. The parser (and with it the already
+# converted grammar) is handed over once per worker instead of once per sentence.
+# If k_best is given, every result is the list of the k_best most likely
+# (tree, probability) pairs instead of the best pair.
+def init_worker(parser, k_best=None):
+    global worker_parser, worker_k_best
+    worker_parser = parser
+    worker_k_best = k_best
+
+
+# Parses one sentence inside a worker. Takes a pair of the sentence index and
+# the sentence and returns the index, the result, the worker's process id,
+# the time spent on parsing, the parse statistics of the sentence (None if
+# the parser does not collect them, see ParseStats.py) and the number of
+# chart entries pruning removed (for the result cache, see parse_window).
+def parse_job(job):
+    index, words = job
+    start_time = time.time()
+    if worker_k_best is not None:
+        result = worker_parser.k_best_parse(words, worker_k_best)
+    else:
+        result = worker_parser.prob_cky_parse(words)
+    return (index, result, os.getpid(), time.time() - start_time, getattr(worker_parser, "stats", None),
+            getattr(worker_parser, "pruned_entries", 0))
+
+
+#####################################################################
+#                           Parse Batch                             #
+#####################################################################
+
+# Parses a list of sentences (each one a list of words) with a pool of worker
+# processes. The longest sentences are dispatched first, so that the slowest
+# ones do not end up last. Returns a pair of the results in the original input
+# order and the statistics per worker (see print_worker_stats). k_best is
+# handed over to the workers (see init_worker). If parse_stats is given (a
+# ParseStats object), the parse statistics of all sentences are added to it.
+def parse_batch(parser, sentences, workers=1, k_best=None, parse_stats=None):
+
+    # Maps a process id to [number of sentences, number of words, parsing time]:
+    stats = {}
+
+    if workers > 1:
+        pool = create_pool(parser, workers, k_best)
+        try:
+            results = parse_window(pool, sentences, stats, parser, k_best, parse_stats)
+        finally:
+            pool.close()
+            pool.join()
+
+    else:
+        # No pool necessary for a single worker, so we simply parse in input order:
+        init_worker(parser, k_best)
+        results = [None] * len(sentences)
+        for index in range(len(sentences)):
+            index, result, pid, elapsed, sentence_stats, pruned_entries = parse_job((index, sentences[index]))
+            results[index] = result
+            add_stats(stats, pid, len(sentences[index]), elapsed, parse_stats, sentence_stats)
+
+    return (results, stats)
+
+
+#####################################################################
+#                           Parse Window                            #
+#####################################################################
+
+# Parses a list of sentences with an existing pool, longest sentence first.
+# Returns the results in the original order and adds to the statistics. If
+# the parser has a result cache, the sentences in the cache are not sent to
+# the workers, a sentence that occurs several times in the window is only
+# parsed once and the new results are added to the cache.
+def parse_window(pool, sentences, stats, parser=None, k_best=None, parse_stats=None):
+    cache = getattr(parser, "result_cache", None) if k_best is None else None
+    order = sorted(range(len(sentences)), key=lambda index: len(sentences[index]), reverse=True)
+
+    results = [None] * len(sentences)
+    jobs = []
+    # Maps the words of every sentence that is sent to the workers to the
+    # indices of all its occurrences:
+    occurrences = {}
+    for index in order:
+        if cache is not None:
+            found, results[index] = parser.cached_result(sentences[index])
+            if found:
+                continue
+            words = tuple(sentences[index])
+            if words in occurrences:
+                occurrences[words].append(index)
+                continue
+            occurrences[words] = [index]
+        jobs.append((index, sentences[index]))
+
+    for index, result, pid, elapsed, sentence_stats, pruned_entries in pool.imap_unordered(parse_job, jobs, 1):
+        results[index] = result
+        if cache is not None:
+            parser.store_result(sentences[index], result, pruned_entries)
+            for other in occurrences[tuple(sentences[index])]:
+                results[other] = result
+        add_stats(stats, pid, len(sentences[index]), elapsed, parse_stats, sentence_stats)
+    return results
+
+
+# Creates the pool of worker processes. The workers get the parser without
+# its result cache, the cache is only used by this process (see parse_window),
+# so that all results end up in one cache.
+def create_pool(parser, workers, k_best=None):
+    cache = getattr(parser, "result_cache", None)
+    if cache is not None:
+        parser.result_cache = None
+    try:
+        return multiprocessing.Pool(workers, init_worker, (parser, k_best))
+    finally:
+        if cache is not None:
+            parser.result_cache = cache
+
+
+#####################################################################
+#                           Parse Stream                            #
+#####################################################################
+
+# Generator that parses sentences as they come in (sentences can be any
+# iterable, e.g. a file that is read line by line) and yields the results
+# in input order. With one worker every result is available as soon as its
+# sentence is parsed. With more workers the sentences are parsed in windows
+# of the given size (default: four sentences per worker), so memory stays
+# bounded no matter how long the input is. parse_stats is the same as for
+# parse_batch.
+def parse_stream(parser, sentences, workers=1, window=None, stats=None, k_best=None, parse_stats=None):
+    if stats is None:
+        stats = {}
+
+    if workers <= 1:
+        init_worker(parser, k_best)
+        for words in sentences:
+            index, result, pid, elapsed, sentence_stats, pruned_entries = parse_job((0, words))
+            add_stats(stats, pid, len(words), elapsed, parse_stats, sentence_stats)
+            yield result
+        return
+
+    if window is None:
+        window = workers * 4
+
+    pool = create_pool(parser, workers, k_best)
+    try:
+        batch = []
+        for words in sentences:
+            batch.append(words)
+            if len(batch) == window:
+                for result in parse_window(pool, batch, stats, parser, k_best, parse_stats):
+                    yield result
+                batch = []
+
+        if batch:
+            for result in parse_window(pool, batch, stats, parser, k_best, parse_stats):
+                yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+#####################################################################
+#                            Statistics                             #
+#####################################################################
+
+# Adds one parsed sentence to the statistics of a worker and its parse
+# statistics (if there are any) to parse_stats:
+def add_stats(stats, pid, words, elapsed, parse_stats=None, sentence_stats=None):
+    if pid not in stats:
+        stats[pid] = [0, 0, 0.0]
+    stats[pid][0] += 1
+    stats[pid][1] += words
+    stats[pid][2] += elapsed
+    if parse_stats is not None and sentence_stats is not None:
+        parse_stats.add(sentence_stats)
+
+
+# Prints the number of sentences and words and the throughput of every worker:
+def print_worker_stats(stats):
+    print "WORKER STATISTICS:"
+    for number, pid in enumerate(sorted(stats)):
+        sentences, words, seconds = stats[pid]
+        sentences_per_second = sentences / seconds if seconds > 0 else 0.0
+        words_per_second = words / seconds if seconds > 0 else 0.0
+        print "Worker {0} (pid {1}): {2} sentences, {3} words, {4:.2f} s, {5:.2f} sentences/s, {6:.2f} words/s".format(
+            number + 1, pid, sentences, words, seconds, sentences_per_second, words_per_second)
@@ -0,0 +1,415 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                        Benchmark Suite                          ##
+#####################################################################
+
+
+#####################################################################
+# File:                           Benchmark.py                      #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+# Reproducible benchmarks for the parser, the CNF conversion and the BitPar
+# grammar preprocessing. All grammars and sentences are generated from fixed
+# random seeds, so the suite runs offline and every run measures exactly the
+# same work. Every case runs in its own process, so that its peak memory can
+# be measured. The results are written as JSON, and the results of an earlier
+# revision can be compared with the current ones (--compare).
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import nltk.grammar
+import BitparLexicon
+import CNFConversion
+import CKYProbabilisticParser
+import PCFGLoader
+import preprocess_bitpar_grammar
+from CompiledGrammar import CompiledGrammar
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak memory is not measured there:
+    resource = None
+
+# Has to be increased whenever the cases change, so that results of different
+# suites are not compared:
+SUITE_VERSION = 1
+
+# Directory of the repository (small_grammar.txt, bitpar_lexicon):
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+#####################################################################
+#                       Synthetic Grammars                          #
+#####################################################################
+
+# Returns a random grammar as start symbol and list of (lhs, rhs, probability)
+# triples (the format of PCFGLoader). Every nonterminal N<i> gets
+# rules_per_nt rules: the given shares of them are unit rules and ternary
+# rules, the rest binary rules. Every one of the num_words words W<i> is
+# produced by lexical_ambiguity preterminals. If in_cnf is False, some
+# ternary rules also contain a terminal (which the conversion has to separate).
+def synthetic_grammar(seed, num_nts, num_words, rules_per_nt=4, unary_share=0.0, ternary_share=0.0,
+                      lexical_ambiguity=1, in_cnf=True):
+    rng = random.Random(seed)
+    nonterminals = [nltk.grammar.Nonterminal("N{0}".format(i)) for i in range(num_nts)]
+    words = ["w{0}".format(i) for i in range(num_words)]
+
+    rhs_lists = dict((nt, set()) for nt in nonterminals)
+    for lhs in nonterminals:
+        while len(rhs_lists[lhs]) < rules_per_nt:
+            kind = rng.random()
+            if kind < unary_share:
+                rhs = (rng.choice(nonterminals),)
+                if rhs[0] == lhs:
+                    continue
+            elif kind < unary_share + ternary_share:
+                rhs = tuple(rng.choice(nonterminals) for i in range(3))
+                if not in_cnf and rng.random() < 0.5:
+                    rhs = (rhs[0], rng.choice(words), rhs[2])
+            else:
+                rhs = (rng.choice(nonterminals), rng.choice(nonterminals))
+            rhs_lists[lhs].add(rhs)
+
+    # Every word gets lexical_ambiguity different preterminals:
+    for word in words:
+        for lhs in rng.sample(nonterminals, min(lexical_ambiguity, num_nts)):
+            rhs_lists[lhs].add((word,))
+
+    rules = []
+    for lhs in nonterminals:
+        rhs_list = sorted(rhs_lists[lhs])
+        weights = [rng.random() + 0.1 for rhs in rhs_list]
+        total = sum(weights)
+        for rhs, weight in zip(rhs_list, weights):
+            rules.append((lhs, rhs, weight / total))
+
+    return (nonterminals[0], rules)
+
+
+# Returns num_sentences random sentences of the given length over the words
+# of a synthetic grammar:
+def synthetic_sentences(seed, num_words, length, num_sentences):
+    rng = random.Random(seed)
+    return [["w{0}".format(rng.randrange(num_words)) for i in range(length)] for sentence in range(num_sentences)]
+
+
+# Writes a random BitPar grammar (frequency lhs rhs...) whose preterminals are
+# the PoS tags of the given list:
+def write_bitpar_grammar(path, seed, num_nts, num_rules, tags):
+    rng = random.Random(seed)
+    symbols = ["N{0}".format(i) for i in range(num_nts)]
+    grammar_file = open(path, 'w')
+    for rule in range(num_rules):
+        lhs = symbols[rule % num_nts]
+        rhs = [rng.choice(symbols) if rng.random() < 0.5 else rng.choice(tags) for i in range(rng.randint(1, 4))]
+        grammar_file.write("{0}\t{1} {2}\n".format(rng.randint(1, 50), lhs, " ".join(rhs)))
+    grammar_file.close()
+
+
+#####################################################################
+#                          Measurements                             #
+#####################################################################
+
+# Peak resident memory of the current process in KB (None if unknown):
+def peak_memory_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes:
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+
+# Counts the chart cells the parser filled for the last sentence and the
+# rule applications it made (every binary rule whose children were both in
+# the chart). The child cells are final before a cell is filled, so counting
+# on the finished chart gives exactly the work of the parser.
+def count_chart_work(parser, n):
+    rows = parser.chart.rows
+    binary = parser.grammar.binary
+    cells = n
+    applications = 0
+
+    for span in range(2, n+1):
+        for i in range(n-span+1):
+            if parser.feasibility is not None and not parser.feasibility.cell_possible(i, n-i-span):
+                continue
+            cells += 1
+            for k in range(1, span):
+                nts1 = rows[k-1][i].scores
+                nts2 = rows[span-k-1][i+k].scores
+                if not nts2:
+                    continue
+                for nt1 in nts1:
+                    by_right = binary.get(nt1)
+                    if by_right is None:
+                        continue
+                    for nt2 in nts2:
+                        rules = by_right.get(nt2)
+                        if rules:
+                            applications += len(rules)
+
+    return (cells, applications)
+
+
+# Runs a benchmark case in a new Python process and returns its result
+# dictionary with the peak memory of that process added. A forked process
+# would inherit the peak memory of the suite, so the script itself is started
+# again (see run_case).
+def run_isolated(case, arguments):
+    command = [sys.executable, os.path.abspath(__file__), "--run-case", case, json.dumps(arguments)]
+    output = subprocess.Popen(command, stdout=subprocess.PIPE).communicate()[0]
+    # The result is the last line of the output:
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Runs a case inside the benchmark process (see run_isolated) and prints its
+# result as JSON:
+def run_case(case, arguments):
+    result = CASES[case](*arguments)
+    result["peak_memory_kb"] = peak_memory_kb()
+    print json.dumps(result)
+
+
+#####################################################################
+#                         Benchmark Cases                           #
+#####################################################################
+
+# Parses sentences of one length with a synthetic CNF grammar:
+def parse_case(num_nts, rules_per_nt, length, num_sentences, seed):
+    num_words = num_nts * 2
+    start, rules = synthetic_grammar(seed, num_nts, num_words, rules_per_nt, lexical_ambiguity=max(3, num_nts // 5))
+    grammar = CompiledGrammar(start, rules)
+    parser = CKYProbabilisticParser.ProbCKYParser(grammar)
+    sentences = synthetic_sentences(seed, num_words, length, num_sentences)
+
+    seconds = 0.0
+    cells = applications = parses = 0
+    stdout = sys.stdout
+    for words in sentences:
+        # The parser prints a message for every sentence without a parse:
+        sys.stdout = open(os.devnull, 'w')
+        start_time = time.time()
+        result = parser.prob_cky_parse(words)
+        seconds += time.time() - start_time
+        sys.stdout.close()
+        sys.stdout = stdout
+
+        sentence_cells, sentence_applications = count_chart_work(parser, len(words))
+        cells += sentence_cells
+        applications += sentence_applications
+        parses += result is not None
+
+    return {
+        "seconds": seconds,
+        "sentences": num_sentences,
+        "parses": parses,
+        "cells": cells,
+        "rule_applications": applications,
+        "cells_per_second": cells / seconds if seconds > 0 else 0.0,
+        "rule_applications_per_second": applications / seconds if seconds > 0 else 0.0,
+    }
+
+
+# Converts a grammar file to CNF (read with PCFGLoader, like main.py):
+def conversion_file_case(path):
+    start, rules = PCFGLoader.PCFGLoader().read(path)
+    return conversion_result(start, rules)
+
+
+# Converts a synthetic grammar with unit rules, ternary rules, terminals in
+# longer rules and ambiguous words:
+def conversion_synthetic_case(num_nts, unary_share, ternary_share, lexical_ambiguity, seed):
+    start, rules = synthetic_grammar(seed, num_nts, num_nts, rules_per_nt=4, unary_share=unary_share,
+                                     ternary_share=ternary_share, lexical_ambiguity=lexical_ambiguity, in_cnf=False)
+    return conversion_result(start, rules)
+
+
+# Runs CNF_Conversion and returns its time and the number of rules:
+def conversion_result(start, rules):
+    grammar = PCFGLoader.to_weighted_grammar(start, rules)
+    start_time = time.time()
+    cnf_instance = CNFConversion.CNF_Conversion(grammar)
+    seconds = time.time() - start_time
+    converted = len(cnf_instance.get_grammar().productions())
+    return {
+        "seconds": seconds,
+        "input_rules": len(rules),
+        "output_rules": converted,
+        "rules_per_second": len(rules) / seconds if seconds > 0 else 0.0,
+    }
+
+
+# Preprocesses a synthetic BitPar grammar with the shipped lexicon (the same
+# steps as the main script of preprocess_bitpar_grammar.py) and indexes the
+# lexicon:
+def preprocess_case(num_nts, num_rules, threshold, seed):
+    lexicon_path = os.path.join(BASE_DIR, "bitpar_lexicon")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        tags = sorted(set(token for line in open(lexicon_path) for token in line.split()[1::2]))
+        grammar_path = os.path.join(temp_dir, "grammar")
+        write_bitpar_grammar(grammar_path, seed, num_nts, num_rules, tags)
+
+        start_time = time.time()
+        grammar_rules = preprocess_bitpar_grammar.read_grammar(grammar_path, threshold)
+        lexical_rules = preprocess_bitpar_grammar.read_lexicon(lexicon_path)
+        start_symbol, lhs_to_rules = preprocess_bitpar_grammar.normalize_rules(grammar_rules, threshold)
+        found_symbols = preprocess_bitpar_grammar.find_symbols_top_down(start_symbol, lhs_to_rules, lexical_rules)
+        written = preprocess_bitpar_grammar.write_grammar(os.path.join(temp_dir, "output"), found_symbols,
+                                                          lhs_to_rules, lexical_rules)
+        seconds = time.time() - start_time
+
+        start_time = time.time()
+        indexed = BitparLexicon.build_index(lexicon_path, os.path.join(temp_dir, "lexicon.idx"))
+        index_seconds = time.time() - start_time
+    finally:
+        shutil.rmtree(temp_dir)
+
+    return {
+        "seconds": seconds,
+        "grammar_rules": num_rules,
+        "written_rules": written,
+        "rules_per_second": written / seconds if seconds > 0 else 0.0,
+        "index_seconds": index_seconds,
+        "indexed_lines": indexed,
+    }
+
+
+# All cases by name (the functions are looked up in the benchmark process):
+CASES = {
+    "parse": parse_case,
+    "conversion_file": conversion_file_case,
+    "conversion_synthetic": conversion_synthetic_case,
+    "preprocess": preprocess_case,
+}
+
+
+# Returns the list of (name, case, arguments) of the whole suite. quick
+# selects a smaller suite for a fast check.
+def suite(quick=False):
+    benchmarks = []
+
+    # Grammar sizes as (nonterminals, binary rules per nonterminal):
+    grammar_sizes = ((10, 20), (40, 60)) if quick else ((10, 20), (40, 60), (100, 120))
+    lengths = (5, 10) if quick else (5, 10, 15, 20)
+    for num_nts, rules_per_nt in grammar_sizes:
+        for length in lengths:
+            benchmarks.append(("parse/nts={0}/length={1}".format(num_nts, length), "parse",
+                               (num_nts, rules_per_nt, length, 3, 1)))
+
+    benchmarks.append(("conversion/small_grammar", "conversion_file", (os.path.join(BASE_DIR, "small_grammar.txt"),)))
+    for name, unary_share, ternary_share, lexical_ambiguity in (("unary", 0.3, 0.0, 1),
+                                                                ("ternary", 0.0, 0.5, 1),
+                                                                ("lexical", 0.0, 0.0, 4),
+                                                                ("mixed", 0.2, 0.3, 3)):
+        num_nts = 20 if quick else 60
+        benchmarks.append(("conversion/{0}/nts={1}".format(name, num_nts), "conversion_synthetic",
+                           (num_nts, unary_share, ternary_share, lexical_ambiguity, 2)))
+
+    num_rules = 2000 if quick else 20000
+    benchmarks.append(("preprocess/rules={0}".format(num_rules), "preprocess", (200, num_rules, 1, 3)))
+
+    return benchmarks
+
+
+#####################################################################
+#                        Run and Compare                            #
+#####################################################################
+
+# Runs the suite and returns the JSON document with all results:
+def run_suite(quick=False, only=None):
+    results = {}
+    for name, case, arguments in suite(quick):
+        if only is not None and only not in name:
+            continue
+        print "{0} ...".format(name),
+        sys.stdout.flush()
+        results[name] = run_isolated(case, arguments)
+        print "{0:.3f} s".format(results[name]["seconds"])
+
+    return {
+        "suite_version": SUITE_VERSION,
+        "quick": quick,
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+
+
+# Returns the current git commit of the repository (None outside of git):
+def git_revision():
+    try:
+        output = subprocess.Popen(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE).communicate()[0]
+    except OSError:
+        return None
+    return output.strip() or None
+
+
+# Prints the time of every case in both documents and the ratio (new / old):
+def compare(old, new):
+    if old.get("suite_version") != new.get("suite_version") or old.get("quick") != new.get("quick"):
+        print "WARNING: The results come from different suites. \n"
+    print "{0:<40} {1:>10} {2:>10} {3:>8}".format("case", "old [s]", "new [s]", "ratio")
+    for name in sorted(new["results"]):
+        if name not in old["results"]:
+            continue
+        old_seconds = old["results"][name]["seconds"]
+        new_seconds = new["results"][name]["seconds"]
+        ratio = new_seconds / old_seconds if old_seconds > 0 else float("inf")
+        print "{0:<40} {1:>10.3f} {2:>10.3f} {3:>8.2f}".format(name, old_seconds, new_seconds, ratio)
+
+
+#####################################################################
+#                           Main Script                             #
+#####################################################################
+
+# Options:
+# --quick: smaller suite
+# --only: run only the cases whose name contains the given text
+# --output: JSON file for the results (default: benchmark_results.json)
+# --compare: JSON file of an earlier run to compare the results with
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(add_help=False)
+    arg_parser.add_argument("--quick", action="store_true")
+    arg_parser.add_argument("--only")
+    arg_parser.add_argument("--output", default="benchmark_results.json")
+    arg_parser.add_argument("--compare")
+    # Used by run_isolated for a single case:
+    arg_parser.add_argument("--run-case", nargs=2)
+    arguments, unknown = arg_parser.parse_known_args()
+
+    if arguments.run_case is not None:
+        run_case(arguments.run_case[0], json.loads(arguments.run_case[1]))
+    elif not unknown:
+        document = run_suite(arguments.quick, arguments.only)
+
+        output_file = open(arguments.output, 'w')
+        json.dump(document, output_file, indent=2, sort_keys=True)
+        output_file.close()
+        print "Results written to {0}".format(arguments.output)
+
+        if arguments.compare is not None:
+            compare_file = open(arguments.compare, 'r')
+            compare(json.load(compare_file), document)
+            compare_file.close()
+    else:
+        print "USAGE: python Benchmark.py [--quick] [--only TEXT] [--output FILE] [--compare FILE] \n"
+        print "--quick = Run a smaller suite. \n"
+        print "--only TEXT = Run only the cases whose name contains TEXT (e.g. parse or conversion). \n"
+        print "--output FILE = JSON file for the results (default: benchmark_results.json). \n"
+        print "--compare FILE = JSON file of an earlier run (e.g. of another revision). The times of both runs "
+        print "are printed side by side. \n"
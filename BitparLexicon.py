@@ -0,0 +1,208 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                  Indexed BitPar Lexicon Provider                ##
+#####################################################################
+
+
+#####################################################################
+# File:                           BitparLexicon.py                  #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import marshal
+import mmap
+import os
+import struct
+import sys
+
+# Magic string at the beginning of every index file:
+INDEX_MAGIC = "BPLXIDX1"
+# File extension of the index (stored next to the lexicon):
+INDEX_EXTENSION = ".idx"
+# Header: magic, number of lines, size and modification time of the lexicon:
+_HEADER = struct.Struct("<8sQQd")
+# One offset per lexicon line:
+_OFFSET = struct.Struct("<Q")
+
+
+# Gives the parser the lexical rules of a BitPar lexicon (one line per word:
+# word, then pairs of PoS tag and frequency) without reading the whole
+# lexicon into memory. An index file stores the offsets of all lines sorted by
+# their word and the overall frequency of every PoS tag. Lexicon and index are
+# memory-mapped, a word is found by binary search over the offsets and its
+# rules are only computed when it is looked up for the first time.
+class BitparLexicon(object):
+
+    # Takes the path of the lexicon. The index is built if it is missing or
+    # older than the lexicon.
+    def __init__(self, lexicon_path, index_path=None):
+        if index_path is None:
+            index_path = lexicon_path + INDEX_EXTENSION
+        self.lexicon_path = lexicon_path
+        self.index_path = index_path
+
+        if not index_is_current(lexicon_path, index_path):
+            build_index(lexicon_path, index_path)
+
+        self.lexicon_file = open(lexicon_path, 'rb')
+        self.lexicon_map = mmap.mmap(self.lexicon_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index_file = open(index_path, 'rb')
+        self.index_map = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.size, lexicon_size, lexicon_mtime = _HEADER.unpack_from(self.index_map, 0)
+        # Overall frequency of every PoS tag (behind the offsets):
+        totals_start = _HEADER.size + self.size * _OFFSET.size
+        self.pos_totals = marshal.loads(self.index_map[totals_start:])
+
+        # Maps every word that was looked up to its list of (PoS tag, probability):
+        self.cache = {}
+
+        # Statistics:
+        self.lookups = 0
+        self.cache_hits = 0
+
+
+#####################################################################
+#                             Lookup                                #
+#####################################################################
+
+    # Returns the list of (PoS tag, probability) pairs of a word, that is all
+    # lexical rules PoS -> word. Unknown words get an empty list.
+    def lookup(self, word):
+        self.lookups += 1
+        rules = self.cache.get(word)
+        if rules is not None:
+            self.cache_hits += 1
+            return rules
+
+        frequencies = {}
+        position = self.find(word)
+        while position < self.size:
+            tokens = self.line(position).split()
+            if tokens[0] != word:
+                break
+            for i in range(1, len(tokens) - 1, 2):
+                frequencies[tokens[i]] = frequencies.get(tokens[i], 0) + int(tokens[i+1])
+            position += 1
+
+        rules = [(pos, frequency / float(self.pos_totals[pos])) for pos, frequency in frequencies.iteritems()]
+        self.cache[word] = rules
+        return rules
+
+    # Binary search: returns the position of the first line (in index order)
+    # whose word is not smaller than the given word.
+    def find(self, word):
+        low = 0
+        high = self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.word_at(middle) < word:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Returns the line at the given position of the index:
+    def line(self, position):
+        offset = _OFFSET.unpack_from(self.index_map, _HEADER.size + position * _OFFSET.size)[0]
+        end = self.lexicon_map.find("\n", offset)
+        if end == -1:
+            end = len(self.lexicon_map)
+        return self.lexicon_map[offset:end]
+
+    # Returns the word of the line at the given position of the index:
+    def word_at(self, position):
+        return self.line(position).split(None, 1)[0]
+
+
+#####################################################################
+#                              Close                                #
+#####################################################################
+
+    def close(self):
+        self.lexicon_map.close()
+        self.lexicon_file.close()
+        self.index_map.close()
+        self.index_file.close()
+
+
+#####################################################################
+#                           Build Index                             #
+#####################################################################
+
+# Reads the lexicon once and writes the index file: the header, the offsets of
+# all non-empty lines sorted by their word and the marshalled dictionary of
+# the overall PoS frequencies. Returns the number of indexed lines.
+def build_index(lexicon_path, index_path=None):
+    if index_path is None:
+        index_path = lexicon_path + INDEX_EXTENSION
+
+    entries = []
+    pos_totals = {}
+
+    lexicon_file = open(lexicon_path, 'rb')
+    offset = 0
+    for line in lexicon_file:
+        tokens = line.split()
+        if tokens:
+            # len of tokens has to be at least three (word, PoS tag and frequency)
+            assert len(tokens) >= 3
+            entries.append((tokens[0], offset))
+            for i in range(1, len(tokens) - 1, 2):
+                pos_totals[tokens[i]] = pos_totals.get(tokens[i], 0) + int(tokens[i+1])
+        offset += len(line)
+    lexicon_file.close()
+
+    # Sorting by word (and offset, so that the lines of a word keep their order):
+    entries.sort()
+    stat = os.stat(lexicon_path)
+
+    # Written to a temporary file first, so that a reader never sees half an index:
+    temp_path = "{0}.{1}.tmp".format(index_path, os.getpid())
+    index_file = open(temp_path, 'wb')
+    index_file.write(_HEADER.pack(INDEX_MAGIC, len(entries), stat.st_size, stat.st_mtime))
+    index_file.write(struct.pack("<{0}Q".format(len(entries)), *[entry[1] for entry in entries]))
+    index_file.write(marshal.dumps(pos_totals))
+    index_file.close()
+    os.rename(temp_path, index_path)
+
+    return len(entries)
+
+
+# Returns True if the index file exists and belongs to the current lexicon:
+def index_is_current(lexicon_path, index_path):
+    try:
+        index_file = open(index_path, 'rb')
+        header = index_file.read(_HEADER.size)
+        index_file.close()
+        stat = os.stat(lexicon_path)
+    except (IOError, OSError):
+        return False
+
+    if len(header) != _HEADER.size:
+        return False
+    magic, size, lexicon_size, lexicon_mtime = _HEADER.unpack(header)
+    return magic == INDEX_MAGIC and lexicon_size == stat.st_size and lexicon_mtime == stat.st_mtime
+
+
+#####################################################################
+#                           Main Script                             #
+#####################################################################
+
+# Command line arguments:
+# [0]: BitparLexicon.py
+# [1]: lexicon file
+# [2...]: optional words to look up
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        count = build_index(sys.argv[1])
+        print "Indexed {0} lines of {1}".format(count, sys.argv[1])
+
+        lexicon = BitparLexicon(sys.argv[1])
+        for word in sys.argv[2:]:
+            print word, lexicon.lookup(word)
+        lexicon.close()
+    else:
+        print "USAGE: python BitparLexicon.py lexicon_file [word ...] \n"
+        print "lexicon_file = BitPar lexicon file. The index is written to lexicon_file.idx \n"
+        print "word = Words whose lexical rules are printed. \n"
@@ -21,151 +21,705 @@
 #                 2) its tree representations                       #
 #####################################################################
 
+import hashlib
+import os
+import time
 import nltk.grammar
-from nltk.tree import Tree
+from CompiledGrammar import CompiledGrammar
+from Chart import Chart
+from SpanFeasibility import SpanFeasibility
+from KBestExtractor import KBestExtractor
+from ParseStats import ParseStats
+from ParseResult import ParseResult, build_tree
 
 # Represents a probabilistic CKY parser that computes the most probable parse 
 # tree for an input sentence. Takes the grammar as constructor argument. To
 # compute the trees for an input, the class function prob_cky_parse(words) that 
 # takes the input as argument is called inside the main function.    
+# The chart engine can be chosen per parser: "python" (default) fills the
+# chart with plain dictionaries, "numpy" uses dense arrays and applies all
+# binary rules of a span at once (see VectorizedCKY.py, requires NumPy).
+#
+# Optional pruning (all disabled by default):
+# beam_size = keep only the K most probable entries of every chart cell
+# beam_threshold = drop every entry whose probability is lower than
+#                  beam_threshold times the best probability of its cell
+# max_span_labels = keep only the M best distinct nonterminals per span length
+#
+# Optional coarse-to-fine parsing (see CoarseToFine.py):
+# coarse_threshold = run a cheap pass with a projected grammar first and only
+#                    fill (span, label) pairs whose coarse posterior reaches
+#                    the threshold (0 keeps the exact Viterbi parse)
+# projection = function that maps a fine label to its coarse label
+#
+# unary_closure = keep the unary rules of the grammar (instead of removing them
+#                 with CNF_Conversion) and apply their precomputed closure to
+#                 every chart cell after the binary step. The unary nodes are
+#                 part of the resulting trees. Only for the python engine.
+#
+# lexicon = external lexicon (e.g. BitparLexicon) that provides the lexical
+#           rules of the input words on demand (see CompiledGrammar.attach_lexicon)
+#
+# feasibility = drop chart entries whose nonterminal cannot have as many words
+#               on its left and right as the cell leaves, and skip cells in which
+#               no nonterminal fits (see SpanFeasibility.py). Never changes the
+#               resulting parse, enabled by default.
+#
+# result_cache = ResultCache (see ResultCache.py) that keeps the results of
+#                parsed sentences, so that repeated sentences are not parsed again
+#
+# stats = count the work of every parse and time its phases (see ParseStats.py).
+#         The statistics of the last parse are in self.stats. Only for the
+#         python engine.
+#
+# lazy_results = return a ParseResult (see ParseResult.py) instead of the pair
+#                of tree and probability. Its tree is only built when it is
+#                asked for, the bracket string and the spans without any tree.
 class ProbCKYParser(object):
-    def __init__(self, grammar):
-        self.grammar = grammar
-        self.matrix = []
+    def __init__(self, grammar, engine="python", beam_size=None, beam_threshold=None, max_span_labels=None,
+                 coarse_threshold=None, projection=None, unary_closure=False, lexicon=None, feasibility=True,
+                 result_cache=None, stats=False, lazy_results=False):
+        # The parser works on the integer-indexed version of the grammar. An
+        # already compiled grammar can be passed in directly:
+        if isinstance(grammar, CompiledGrammar):
+            self.grammar = grammar
+        else:
+            self.grammar = CompiledGrammar.from_grammar(grammar)
+        # Triangular chart, reused for all sentences (see Chart.py):
+        self.chart = Chart(len(self.grammar.nonterminals))
+        self.words = []
+
+        if lexicon is not None:
+            self.grammar.attach_lexicon(lexicon)
+
+        # Span-length feasibility, computed once per grammar. The number of
+        # cells of the last sentence that were skipped because of it:
+        self.feasibility = None
+        if feasibility:
+            self.feasibility = SpanFeasibility(self.grammar)
+        self.skipped_cells = 0
+
+        # Unary closure table (child -> list of (ancestor, chain probability)):
+        self.closure = None
+        if unary_closure:
+            if engine != "python":
+                raise ValueError("The unary closure is only supported by the python engine")
+            self.closure = self.grammar.unary_closure()
+
+        # Pruning options:
+        if beam_threshold is not None and not 0 <= beam_threshold <= 1:
+            raise ValueError("beam_threshold has to be between 0 and 1")
+        self.beam_size = beam_size
+        self.beam_threshold = beam_threshold
+        self.max_span_labels = max_span_labels
+        self.pruning = beam_size is not None or beam_threshold is not None
+
+        # Number of entries removed by pruning during the last parse, whether
+        # the last parse failed although pruning was active and the overall
+        # number of such failures (for tuning the pruning options):
+        self.pruned_entries = 0
+        self.pruning_failure = False
+        self.pruning_failures = 0
+
+        self.coarse = None
+        if coarse_threshold is not None:
+            import CoarseToFine
+            self.coarse = CoarseToFine.CoarseToFine(self.grammar, coarse_threshold, projection, unary_closure, lexicon)
+
+        self.engine = engine
+        self.vectorized = None
+        if engine == "numpy":
+            # Only import NumPy if it is actually needed:
+            import VectorizedCKY
+            self.vectorized = VectorizedCKY.VectorizedCKY(self.grammar, beam_size, beam_threshold, max_span_labels,
+                                                          self.coarse.projection if self.coarse else None,
+                                                          self.feasibility)
+        elif engine != "python":
+            raise ValueError("Unknown parsing engine: {0}".format(engine))
+
+        self.k_best_extractor = None
+
+        # Statistics of the last parse (None if they are not collected or the
+        # result came from the result cache):
+        if stats and engine != "python":
+            raise ValueError("Parse statistics are only supported by the python engine")
+        self.collect_stats = stats
+        self.stats = None
+
+        # The fingerprint is computed when the cache is used for the first time:
+        self.result_cache = result_cache
+        self.lazy_results = lazy_results
+        self.options = (engine, beam_size, beam_threshold, max_span_labels, coarse_threshold,
+                        getattr(projection, "__name__", None), unary_closure, lazy_results)
+        self.grammar_fingerprint = None
 
 
 #####################################################################
 #                     Probabilistic CKY Parse                       #
 #####################################################################
 
-    # Parses an input sentence and returns the most likely tree for it.
+    # Parses an input sentence and returns the most likely tree for it. With
+    # a result cache, sentences that were already parsed are taken from there.
     def prob_cky_parse(self, words):
+        if self.result_cache is None:
+            return self.parse_sentence(words)
+
+        found, result = self.cached_result(words)
+        if found:
+            return result
+
+        result = self.parse_sentence(words)
+        self.store_result(words, result, self.pruned_entries)
+        return result
+
+    # Parses an input sentence without looking at the result cache.
+    def parse_sentence(self, words):
+
+        self.pruned_entries = 0
+        self.pruning_failure = False
+        self.skipped_cells = 0
+        stats = self.stats = ParseStats() if self.collect_stats else None
+
+        # Coarse-to-fine: the coarse pass decides which (span, label) pairs
+        # the fine pass may fill. If even the coarse grammar cannot parse the
+        # sentence, the fine grammar cannot either.
+        allowed = None
+        if self.coarse is not None:
+            allowed = self.coarse.allowed_labels(words)
+            if allowed is None:
+                # The sentence counts in the statistics like any other failure:
+                if stats is not None:
+                    self.finish_stats(stats, len(words))
+                self.parse_failed()
+                return None
+            # Labels removed by a positive threshold count as pruned entries:
+            if self.coarse.threshold > 0:
+                self.pruned_entries += self.coarse.candidates - self.coarse.kept
+
+        # Let the vectorized engine do the work if it was chosen:
+        if self.vectorized is not None:
+            result = self.vectorized.parse(words, allowed)
+            self.pruned_entries += self.vectorized.pruned_entries
+            self.skipped_cells = self.vectorized.skipped_cells
+            if result is None:
+                self.parse_failed()
+            elif not self.lazy_results:
+                result = (result.tree(), result.probability)
+            return result
+
+        self.fill_chart(words, allowed)
 
         # Length of input sentence:
         n = len(words)
-        # Create an array as basis for matrix:
-        self.matrix = []
-        
-        # Starting at cell [0][0], create matrix and fill each cell with a dictionary.
-        for i in range(n):
-            # Create another array:
-            row = []
-            for j in range(n):
-                # Append the empty dictionaries to this other array first:
-                row.append({})
-            # Then append this array to the already existing array to create the two-dimensional matrix: 
-            self.matrix.append(row)
+        rows = self.chart.rows
+
+        if stats is not None:
+            self.count_chart_entries(stats, n)
+            start_time = time.time()
+
+        # Now we construct the syntax tree top-down. Starting at the cell
+        # that spans the whole sentence which is the root node of the tree:
+        if n > 0 and self.grammar.start in rows[n-1][0].scores:
+            # Probability of whole tree:
+            tree_probability = rows[n-1][0].scores[self.grammar.start]
+            # The derivation is read from the backpointers, the tree is only
+            # built from it if the result is not lazy:
+            parse_result = ParseResult(self.extract_derivation(0, n, self.grammar.start), words, tree_probability)
+            result = parse_result
+            if not self.lazy_results:
+                result = (parse_result.tree(), tree_probability)
+
+            if stats is not None:
+                stats.tree_seconds = time.time() - start_time
+                stats.tree_nodes = len(parse_result.nodes)
+                self.finish_stats(stats, n)
+                
+            # Return the syntax tree and its probability:
+            return result
+             
+        else:
+            # Else: The start symbol is not in the root cell. That means there
+            # is no possible parse for the input sentence.
+            if stats is not None:
+                self.finish_stats(stats, n)
+            self.parse_failed()
+
+
+#####################################################################
+#                       Incremental Parsing                         #
+#####################################################################
+
+    # Incremental parsing: the words of a sentence are added one at a time
+    # with add_word, which only fills the cells of the spans that end at the
+    # new word. prefix_parse returns the best parse of the words so far at any
+    # point. The right context of a cell is not known while the sentence
+    # grows, so the feasibility check only uses the left context. Pruning per
+    # cell is supported, coarse-to-fine, max_span_labels and the numpy engine
+    # are not.
+
+    # Starts a new sentence:
+    def begin_sentence(self):
+        if self.vectorized is not None or self.coarse is not None or self.max_span_labels is not None:
+            raise ValueError("Incremental parsing does not support the numpy engine, coarse-to-fine parsing and max_span_labels")
+        self.words = []
+        self.chart.reset(0)
+        self.pruned_entries = 0
+        self.pruning_failure = False
+        self.skipped_cells = 0
+        # Incremental parsing collects no statistics:
+        self.stats = None
+
+    # Adds the next word of the sentence and fills the new column of the
+    # chart, the shortest spans first:
+    def add_word(self, word):
+        self.words.append(word)
+        self.chart.extend()
+        n = len(self.words)
+
+        self.fill_lexical_cell(n-1, word, None)
+        for j in range(2, n+1):
+            self.fill_cell(n-j, j, None)
+
+    # Returns the most likely parse of the words added so far, or None if
+    # they are no sentence (yet). Like parse_sentence, the result is a
+    # ParseResult with lazy_results and a pair of tree and probability
+    # otherwise.
+    def prefix_parse(self):
+        n = len(self.words)
+        start = self.grammar.start
+        if n == 0 or start not in self.chart.rows[n-1][0].scores:
+            return None
+
+        tree_probability = self.chart.rows[n-1][0].scores[start]
+        parse_result = ParseResult(self.extract_derivation(0, n, start), self.words, tree_probability)
+        if self.lazy_results:
+            return parse_result
+        return (parse_result.tree(), tree_probability)
+
+
+#####################################################################
+#                          Result Cache                             #
+#####################################################################
+
+    # Returns a hash of the grammar and of all options that change the
+    # results of the parser (the key of the result cache):
+    def fingerprint(self):
+        if self.grammar_fingerprint is None:
+            parts = [self.grammar.fingerprint(), repr(self.options)]
+            lexicon = self.grammar.lexicon
+            if lexicon is not None:
+                stat = os.stat(lexicon.lexicon_path)
+                parts.append(repr((os.path.abspath(lexicon.lexicon_path), stat.st_size, stat.st_mtime)))
+            self.grammar_fingerprint = hashlib.sha1("\n".join(parts)).hexdigest()
+        return self.grammar_fingerprint
+
+    # Returns a pair of a flag whether the sentence is in the result cache and
+    # its result. A failed parse is reported again, like the first time.
+    def cached_result(self, words):
+        found, value = self.result_cache.get(self.fingerprint(), words)
+        if not found:
+            return (False, None)
+
+        result, pruned_entries = value
+        self.pruned_entries = pruned_entries
+        self.pruning_failure = False
+        self.skipped_cells = 0
+        self.stats = None
+        if result is None:
+            self.parse_failed()
+        return (True, result)
+
+    # Adds the result of a sentence (and the number of entries pruning
+    # removed while parsing it) to the result cache:
+    def store_result(self, words, result, pruned_entries=0):
+        self.result_cache.put(self.fingerprint(), words, (result, pruned_entries))
+
+
+#####################################################################
+#                          K-Best Parse                             #
+#####################################################################
+
+    # Parses an input sentence and returns the list of its k most likely
+    # parses as ParseResults, most probable first (see KBestExtractor.py).
+    # The list is empty if there is no parse. Only for the python engine.
+    def k_best_parse(self, words, k):
+        if self.vectorized is not None:
+            raise ValueError("k-best parsing is only supported by the python engine")
+
+        # The chart is needed, so the result cache cannot be used:
+        if self.parse_sentence(words) is None:
+            return []
+
+        # The rule indices of the extractor are built on first use:
+        if self.k_best_extractor is None:
+            self.k_best_extractor = KBestExtractor(self.grammar, self.closure)
+        return self.k_best_extractor.k_best(self.chart, words, k)
+
+
+#####################################################################
+#                            Fill Chart                             #
+#####################################################################
+
+    # Fills the chart for an input sentence (python engine). If allowed is
+    # given, allowed[span-1][i] is the set of coarse labels (see
+    # CoarseToFine.py) that may be entered into the cell of span length span
+    # starting at i, or None if the cell may not be used at all.
+    def fill_chart(self, words, allowed=None):
+
+        # Length of input sentence:
+        n = len(words)
+        self.words = words
+
+        # Maps fine nonterminal ids to coarse label ids:
+        projection = self.coarse.projection if allowed is not None else None
+
+        feasibility = self.feasibility
+
+        stats = self.stats
+        if stats is not None:
+            start_time = time.time()
+
+        # Prepare the triangular chart. Its cells are only allocated when the
+        # sentence is longer than every sentence before:
+        chart = self.chart
+        chart.reset(n)
+
+        # Every cell maps a nonterminal id to its best probability (cell.scores)
+        # and to a packed backpointer (cell.backs) that stores the partition of
+        # the span and both children.
         
         # For each terminal symbol in input words: 
         for i in range(n):
-            # For every terminal add nonterminal respectively:
-            for prod in self.grammar.productions(rhs=words[i]):
-                # Create quadruple consisting of the word, two zeros and its probability
-                # (I added the two zeros to avoid indexing errors later on)
-                self.matrix[i][0][prod.lhs()] = (words[i],0,0,prod.prob())      
+            allowed_cell = allowed[0][i] if allowed is not None else None
+            self.fill_lexical_cell(i, words[i], n-i-1, allowed_cell, projection)
+        if self.max_span_labels is not None and n > 0:
+            self.pruned_entries += self.prune_span(1, n)
+
+        if stats is not None:
+            stats.cells_visited += n
+            stats.lexical_seconds = time.time() - start_time
+            start_time = time.time()
                 
         for j in range(2, n+1):                            # j: span length
             for i in range(n-j+1):                         # i: start of span
-                for k in range(1, j):                      # k: partition of span
-                    
-                    nts1 = self.matrix[i][k-1]             # nts1: first nonterminal symbol
-                    nts2 = self.matrix[i+k][j-k-1]         # nts2: second nonterminal symbol
-                    
-                    # For all nonterminals in nts1:
-                    for nt1 in nts1:
-                        # productions: rule where nts1 is on the right side of the production
-                        productions = self.grammar.productions(rhs=nt1)
-                        
-                        # for all above declared production rules:
-                        for production in productions:
-                            if len(production.rhs()) == 2:
-                            # If nts2 is in the second position on the right side of the production
-                            # (counting starts from zero, therefore position[0] = first position, [1] = second position etc.)
-                                if production.rhs()[1] in nts2:
-                                    # Create quadruple consisting of both nonterminals, span and a zero
-                                    self.matrix[i][j-1][production.lhs()] = (nt1, production.rhs()[1], k, 0)
-                                   
-                                    # For all nonterminals in nts2:
-                                    for nt2 in nts2:
-                                        # Probability of first nonterminal on right hand side of production:
-                                        nt1_probability = self.matrix[i][k-1][nt1][3]
-                                        # Probability of second nonterminal on right hand side of production:
-                                        nt2_probability = self.matrix[i+k][j-k-1][nt2][3]
-                                        
-                                        # The probability of a subtree is computed by multiplying production rule probability,
-                                        # probability of first nonterminal and second nonterminal:
-                                        subtree_prob = production.prob() * nt1_probability * nt2_probability
-                                        
-                                        # If the subtree probability exceeds the probability value already stored in corresponding
-                                        # matrix cell (which only contains a zero at the beginning), then store the new, larger probability. 
-                                        if subtree_prob > self.matrix[i][j-1][production.lhs()][3]:
-                                            old_tuple = self.matrix[i][j-1][production.lhs()] 
-                                            # Creating a new tuple to change the stored probability because tuples are immutable:
-                                            new_tuple = (old_tuple[0], old_tuple[1], old_tuple[2], subtree_prob)
-                                            
-                                            # Replace old tuple and write new tuple in correspondent matrix cell:
-                                            self.matrix[i][j-1][production.lhs()] = new_tuple     
-        
-        # Now we construct the syntax tree top-down. Starting at matrix cell 
-        # [0][n-1] which is the root node of the tree:
-        for nonterminal in self.matrix[0][n-1]:
-
-            # If the nonterminal is a start symbol:
-            if nonterminal == self.grammar.start():
-                # Probability of whole tree:
-                tree_probability = self.matrix[0][n-1][nonterminal][3]  
-                # Recusively constructed tree:    
-                syntax_tree =  self.get_tree(0,n-1,nonterminal)   
-                
-                # Return the syntax tree as string representation:          
-                return (syntax_tree, tree_probability)
-             
+
+                # Skip cells that did not survive the coarse pass:
+                allowed_cell = None
+                if allowed is not None:
+                    allowed_cell = allowed[j-1][i]
+                    if not allowed_cell:
+                        continue
+
+                # Skip cells in which no nonterminal can be part of a parse of
+                # the whole sentence:
+                if feasibility is not None and not feasibility.cell_possible(i, n-i-j):
+                    self.skipped_cells += 1
+                    continue
+
+                self.fill_cell(i, j, n-i-j, allowed_cell, projection)
+
+            if self.max_span_labels is not None:
+                self.pruned_entries += self.prune_span(j, n)
+
+        if stats is not None:
+            stats.chart_seconds = time.time() - start_time
+
+        return self.chart
+
+
+#####################################################################
+#                            Fill Cells                             #
+#####################################################################
+
+    # Fills the cell of the word at position i with its lexical rules. r is
+    # the number of words right of the cell (None if it is not known yet).
+    def fill_lexical_cell(self, i, word, r, allowed_cell=None, projection=None):
+        cell = self.chart.rows[0][i]
+        # For every terminal add nonterminal respectively:
+        for lhs, prob in self.grammar.lexical_rules(word):
+            if projection is not None and (allowed_cell is None or projection[lhs] not in allowed_cell):
+                continue
+            cell.scores[lhs] = prob
+            cell.backs[lhs] = Chart.LEAF
+        self.finish_cell(cell, i, r, allowed_cell, projection)
+
+    # Fills the cell of span length j starting at i from all partitions of
+    # the span. r is the number of words right of the cell (None if it is not
+    # known yet). With statistics, the cell, its split points, the candidate
+    # edges and the edges that improve the cell are counted in self.stats.
+    def fill_cell(self, i, j, r, allowed_cell=None, projection=None):
+        rows = self.chart.rows
+        num_nts = self.chart.num_nts
+        binary = self.grammar.binary
+
+        cell = rows[j-1][i]
+        scores = cell.scores
+        backs = cell.backs
+
+        # Candidate edges are counted per list of rules, outside of the
+        # innermost loop. Improving edges are rare, so they are always counted:
+        stats = self.stats
+        counting = stats is not None
+        candidate_edges = 0
+        improving_edges = 0
+
+        for k in range(1, j):                      # k: partition of span
+            
+            nts1 = rows[k-1][i].scores             # nts1: first nonterminal symbols
+            nts2 = rows[j-k-1][i+k].scores         # nts2: second nonterminal symbols
+
+            if not nts2:
+                continue
+            
+            # For all nonterminals in nts1:
+            for nt1, nt1_probability in nts1.iteritems():
+                # All binary rules that have nt1 as their first child, indexed by the second child:
+                by_right = binary.get(nt1)
+                if by_right is None:
+                    continue
+
+                # Backpointer without the second child (see Chart.pack):
+                back_base = (k * num_nts + nt1) * num_nts
+
+                # Look up the pairs from whichever side is smaller:
+                if len(by_right) < len(nts2):
+                    pairs = ((nt2, rules) for nt2, rules in by_right.iteritems() if nt2 in nts2)
+                else:
+                    pairs = ((nt2, by_right[nt2]) for nt2 in nts2 if nt2 in by_right)
+
+                for nt2, rules in pairs:
+                    # Probability of second nonterminal on right hand side of production:
+                    nt2_probability = nts2[nt2]
+                    if counting:
+                        candidate_edges += len(rules)
+
+                    for lhs, prob in rules:
+                        # The probability of a subtree is computed by multiplying production rule probability,
+                        # probability of first nonterminal and second nonterminal:
+                        subtree_prob = prob * nt1_probability * nt2_probability
+
+                        # If the subtree probability exceeds the probability value already stored in
+                        # corresponding chart cell, then store the new, larger probability:
+                        old_prob = scores.get(lhs)
+                        if old_prob is None or subtree_prob > old_prob:
+                            if allowed_cell is not None and projection[lhs] not in allowed_cell:
+                                continue
+                            scores[lhs] = subtree_prob
+                            backs[lhs] = back_base + nt2
+                            improving_edges += 1
+
+        if counting:
+            stats.cells_visited += 1
+            stats.split_points += j - 1
+            stats.candidate_edges += candidate_edges
+            stats.improving_edges += improving_edges
+
+        self.finish_cell(cell, i, r, allowed_cell, projection)
+
+    # Applies the unary closure, the feasibility check and the pruning to a
+    # filled cell:
+    def finish_cell(self, cell, i, r, allowed_cell, projection):
+        if self.closure is not None:
+            self.apply_unary_closure(cell, allowed_cell, projection)
+
+        if self.feasibility is not None:
+            self.remove_infeasible(cell, i, r)
+
+        if self.pruning:
+            self.pruned_entries += self.prune_cell(cell)
+
+
+#####################################################################
+#                       Apply Unary Closure                         #
+#####################################################################
+
+    # Adds all nonterminals that can be reached from the entries of a cell by
+    # unary chains. The closure already contains the best chain between any
+    # two nonterminals, so the entries of the cell are only looked at once.
+    # The backpointer of a new entry points to the bottom of its chain.
+    def apply_unary_closure(self, cell, allowed_cell=None, projection=None):
+        scores = cell.scores
+        closure = self.closure
+
+        # Best new entries as lhs -> (probability, bottom of chain):
+        new_entries = {}
+        for child, child_prob in scores.iteritems():
+            ancestors = closure.get(child)
+            if ancestors is None:
+                continue
+            for lhs, chain_prob in ancestors:
+                prob = chain_prob * child_prob
+                if prob > scores.get(lhs, 0.0) and prob > new_entries.get(lhs, (0.0, None))[0]:
+                    new_entries[lhs] = (prob, child)
+
+        for lhs, (prob, child) in new_entries.iteritems():
+            if allowed_cell is not None and projection[lhs] not in allowed_cell:
+                continue
+            scores[lhs] = prob
+            cell.backs[lhs] = self.chart.pack_unary(child)
+
+
+#####################################################################
+#                         Remove Infeasible                         #
+#####################################################################
+
+    # Removes all entries of a cell whose nonterminal cannot have i words on
+    # its left and r words on its right in a complete parse. They could never
+    # be part of the final tree, so later cells do not need to combine them.
+    # If r is None (incremental parsing), only the left context is checked.
+    def remove_infeasible(self, cell, i, r):
+        left = self.feasibility.left_set(i)
+        scores = cell.scores
+        if r is None:
+            infeasible = [nt for nt in scores if nt not in left]
+        else:
+            right = self.feasibility.right_set(r)
+            infeasible = [nt for nt in scores if nt not in left or nt not in right]
+        for nt in infeasible:
+            del scores[nt]
+            del cell.backs[nt]
+
+
+#####################################################################
+#                           Statistics                              #
+#####################################################################
+
+    # Counts the entries of all cells of the chart of a sentence with n words
+    # (after pruning and feasibility):
+    def count_chart_entries(self, stats, n):
+        rows = self.chart.rows
+        for span in range(1, n+1):
+            for cell in rows[span-1][:n-span+1]:
+                entries = len(cell.scores)
+                stats.chart_entries += entries
+                if entries > stats.max_cell_entries:
+                    stats.max_cell_entries = entries
+
+    # Adds the numbers the parser keeps anyway to the statistics of a sentence:
+    def finish_stats(self, stats, n):
+        stats.sentences = 1
+        stats.words = n
+        stats.cells_skipped = self.skipped_cells
+        stats.pruned_entries = self.pruned_entries
+        stats.finish_sentence()
+
+
+#####################################################################
+#                           Parse Failed                            #
+#####################################################################
+
+    # Reports a failed parse. If pruning removed entries from the chart, the
+    # sentence might be in the language after all, so we say so explicitly.
+    def parse_failed(self):
+        if self.pruned_entries > 0:
+            self.pruning_failure = True
+            self.pruning_failures += 1
+            print "PARSING ERROR: No parse found after pruning {0} chart entries. Try a wider beam. \n".format(self.pruned_entries)
         else:
-            # Else: The nonterminal in not a start symbol. That means there
-            # is no possible parse for the input sentence.
             print "PARSING ERROR: Sentence not in language. \n"
+
+
+#####################################################################
+#                            Pruning                                #
+#####################################################################
+
+    # Applies the beam options to a single cell and returns the number of
+    # removed entries.
+    def prune_cell(self, cell):
+        scores = cell.scores
+        if not scores:
+            return 0
+
+        removed = []
+
+        # Relative beam: drop everything far below the best entry of the cell.
+        if self.beam_threshold is not None:
+            limit = max(scores.itervalues()) * self.beam_threshold
+            removed = [nt for nt, prob in scores.iteritems() if prob < limit]
+            for nt in removed:
+                del scores[nt]
+                del cell.backs[nt]
+
+        # Top-K: keep only the beam_size best entries.
+        if self.beam_size is not None and len(scores) > self.beam_size:
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            for nt in ranked[self.beam_size:]:
+                del scores[nt]
+                del cell.backs[nt]
+            return len(removed) + len(ranked) - self.beam_size
+
+        return len(removed)
+
+    # Keeps only the max_span_labels best nonterminals over all cells of the
+    # given span length (the score of a nonterminal is its best probability in
+    # any of these cells). Returns the number of removed entries.
+    def prune_span(self, span, n):
+        row = self.chart.rows[span-1][:n-span+1]
+
+        best = {}
+        for cell in row:
+            for nt, prob in cell.scores.iteritems():
+                if prob > best.get(nt, 0):
+                    best[nt] = prob
+
+        if len(best) <= self.max_span_labels:
+            return 0
+
+        ranked = sorted(best, key=best.get, reverse=True)
+        dropped = ranked[self.max_span_labels:]
+
+        removed = 0
+        for cell in row:
+            for nt in dropped:
+                if nt in cell.scores:
+                    del cell.scores[nt]
+                    del cell.backs[nt]
+                    removed += 1
+        return removed
                 
 #####################################################################
 #                            Get Tree                               #
 #####################################################################
 
-    # Recursive function that computes a tree for a given nonterminal
-    # and its matrix coordinates:        
+    # Returns the tree of a given nonterminal id, the start of its span i and
+    # the span length minus one j:
     def get_tree(self, i, j, symbol):
-        
-        # Position in matrix:
-        matrix_coordinates = self.matrix[i][j]
-        
-        # Recursive case:
-        # If there is not a zero in tuple position two (if there was, it would be a leaf node and the
-        # dictionary entry would look like this: ('the', 0, 0, 0.3), therefore we make that distinction)
-        if matrix_coordinates[symbol][1] != 0:
-        
-            # For debugging purposes:
-            assert len(matrix_coordinates[symbol]) == 4
-                
-            nts1 = matrix_coordinates[symbol][0]            # First position: first nonterminal
-            nts2 = matrix_coordinates[symbol][1]            # Second position: second nonterminal
-            k = matrix_coordinates[symbol][2]               # Third position: Teilungspunkt
-            
-            # Recursive function call to get both subtrees:
-            subtree_1 = self.get_tree(i , k-1, nts1)
-            subtree_2 = self.get_tree(i+k, j-k, nts2)
-            
-            # Return the tree that covers both subtrees:
-            return nltk.Tree(symbol, [subtree_1, subtree_2])
-        
-        else:
-            # Base case: Leaf node
-            
-            # For debugging purposes:
-            assert len(matrix_coordinates[symbol]) == 4
-            
-            # Iterate over matrix cells [i][0] (contain all the input terminal symbols):
-            for symbol in self.matrix[i][0]:
-                terminal_symbol = matrix_coordinates[symbol][0]
-            
-            # Return the leaf of the tree:   
-            return nltk.Tree(symbol, [terminal_symbol])
+        return build_tree(self.extract_derivation(i, j+1, symbol), self.words)
+
+    # Returns the derivation of a nonterminal id over the span of the given
+    # length starting at i as list of (label, start, end, number of children)
+    # in preorder (see ParseResult.py). The nodes are read from the packed
+    # backpointers with an explicit stack instead of recursion, so long
+    # right-branching parses cannot exceed Python's recursion limit.
+    def extract_derivation(self, i, span, symbol):
+        rows = self.chart.rows
+        nonterminals = self.grammar.nonterminals
+        nodes = []
+        stack = [(symbol, i, span)]
+
+        while stack:
+            symbol, i, span = stack.pop()
+            back = rows[span-1][i].backs[symbol]
+
+            # Unary chain: the chain's nodes come first, each with one child,
+            # then the chain's bottom symbol in the same cell.
+            if back < Chart.LEAF:
+                child = self.chart.unpack_unary(back)
+                for node in self.grammar.unary_chain(symbol, child)[:-1]:
+                    nodes.append((nonterminals[node], i, i+span, 1))
+                stack.append((child, i, span))
+
+            # The backpointer points to two children. The second one is pushed
+            # first, so the first one comes next in the list:
+            elif back != Chart.LEAF:
+                # Partition of the span (Teilungspunkt), first and second nonterminal:
+                k, nts1, nts2 = self.chart.unpack(back)
+                nodes.append((nonterminals[symbol], i, i+span, 2))
+                stack.append((nts2, i+k, span-k))
+                stack.append((nts1, i, k))
+
+            else:
+                # Leaf node. The input word is at position i:
+                nodes.append((nonterminals[symbol], i, i+1, 0))
 
-            
\ No newline at end of file
+        return nodes
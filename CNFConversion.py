@@ -25,27 +25,64 @@ import nltk.grammar
 
 # Converts a given grammar to Chomsky Normal Form so that there are only 
 # productions of the form A -> BC or A -> 'a'. All necessary conversion functions
-# get called inside the constructor.
+# get called inside the constructor. If remove_unit_rules is False, unit rules
+# (A -> B) are kept, for a parser that applies the unary closure at parse time
+# (see ProbCKYParser). separation chooses how terminals in longer rules are
+# replaced (see separate_grammar): "cartesian" or "preterminal". binarization
+# is the direction of the binarization ("right" or "left") and if
+# share_intermediates is set, rules with the same suffix (or prefix) share
+# their new nonterminals (see binarize).
 class CNF_Conversion(object):
 
-    def __init__(self, start_grammar):
+    # Possible values of the separation and binarization arguments:
+    SEPARATIONS = ("cartesian", "preterminal")
+    BINARIZATIONS = ("right", "left")
+
+    def __init__(self, start_grammar, remove_unit_rules=True, separation="cartesian",
+                 binarization="right", share_intermediates=False):
+
+        if separation not in self.SEPARATIONS:
+            raise ValueError("Unknown separation strategy: {0}".format(separation))
+        if binarization not in self.BINARIZATIONS:
+            raise ValueError("Unknown binarization direction: {0}".format(binarization))
+        self.separation = separation
+        self.binarization = binarization
+        self.share_intermediates = share_intermediates
 
         # Original grammar that is to be converted:
         self.start_grammar = start_grammar
 
+        # Prefix of the new preterminals for the "preterminal" separation
+        # (T_a for the terminal 'a'):
+        self.preterminal_prefix = "T_"
+
         # Separated grammar:
         self.separated_gram = self.separate_grammar(start_grammar)
 
         # Grammar after removing all unit rules:
-        self.unit_rule_free_gram = self.remove_all_unit_rules(self.separated_gram)
+        if remove_unit_rules:
+            self.unit_rule_free_gram = self.remove_all_unit_rules(self.separated_gram)
+        else:
+            self.unit_rule_free_gram = self.separated_gram
 
         # Global variables that are necessary for creating new nonterminals
         # (required for binarization):
         self.var_counter = 1
         self.var = "X"
+
+        # Maps the shared suffixes (or prefixes) to their new nonterminals:
+        self.intermediates = {}
         
         # Binarized grammar:
         self.binarized_gram = self.binarize(self.unit_rule_free_gram)
+
+        # Number of rules after every stage (see report):
+        self.stage_sizes = [
+            ("input", len(self.start_grammar.productions())),
+            ("separated", len(self.separated_gram.productions())),
+            ("unit rules removed" if remove_unit_rules else "unit rules kept", len(self.unit_rule_free_gram.productions())),
+            ("binarized", len(self.binarized_gram.productions())),
+        ]
         
 
 #####################################################################
@@ -54,8 +91,14 @@ class CNF_Conversion(object):
 
     # Separates grammar so that there are either only nonterminals
     # or only terminals on the right hand side of the production.
+    # With the "cartesian" separation, every terminal is replaced by every
+    # nonterminal that can produce it, which gives one new rule for every
+    # combination. With the "preterminal" separation, see separate_with_preterminals.
     def separate_grammar(self, grammar):
 
+        if self.separation == "preterminal":
+            return self.separate_with_preterminals(grammar)
+
         # List that will contain all the newly created grammar rules as tuples
         # (return value of function)
         tuple_grammar_list = []
@@ -124,6 +167,62 @@ class CNF_Conversion(object):
         return nltk.grammar.WeightedGrammar(grammar.start(), list_gram)
 
 
+#####################################################################
+#                   Separate With Preterminals                      #
+#####################################################################
+
+    # Replaces every terminal in a rule with at least two symbols on the right
+    # hand side by a new preterminal that only produces this terminal, e.g.
+    # E -> 'f' G 'h' [1.0] becomes E -> T_f G T_h [1.0], T_f -> 'f' [1.0] and
+    # T_h -> 'h' [1.0]. Every rule stays one rule with its probability and
+    # every terminal gets only one new rule, so the grammar grows linearly.
+    def separate_with_preterminals(self, grammar):
+
+        # Symbols that are already taken by the grammar:
+        taken = set()
+        for rule in grammar.productions():
+            taken.add(rule.lhs().symbol())
+            for symbol in rule.rhs():
+                if nltk.grammar.is_nonterminal(symbol):
+                    taken.add(symbol.symbol())
+
+        # Maps a terminal to its new preterminal:
+        preterminals = {}
+
+        list_gram = []
+        for rule in grammar.productions():
+
+            # Unary rules (unit rules and lexical rules) are kept:
+            if len(rule.rhs()) < 2:
+                list_gram.append(rule)
+                continue
+
+            new_rhs = []
+            for symbol in rule.rhs():
+                if nltk.grammar.is_terminal(symbol):
+                    if symbol not in preterminals:
+                        preterminals[symbol] = self.get_preterminal(symbol, taken)
+                        list_gram.append(nltk.grammar.WeightedProduction(preterminals[symbol], (symbol,), prob=1.0))
+                    symbol = preterminals[symbol]
+                new_rhs.append(symbol)
+
+            list_gram.append(nltk.grammar.WeightedProduction(rule.lhs(), new_rhs, prob=rule.prob()))
+
+        # Create NLTK grammar instance from list:
+        return nltk.grammar.WeightedGrammar(grammar.start(), list_gram)
+
+    # Creates the new preterminal for a terminal. If the name is already used
+    # by the grammar, a number is added:
+    def get_preterminal(self, terminal, taken):
+        name = self.preterminal_prefix + terminal
+        counter = 1
+        while name in taken:
+            name = "{0}{1}_{2}".format(self.preterminal_prefix, terminal, counter)
+            counter += 1
+        taken.add(name)
+        return nltk.grammar.Nonterminal(name)
+
+
 #####################################################################
 #                       Get Cartesian Product                       #
 #####################################################################
@@ -161,121 +260,244 @@ class CNF_Conversion(object):
 #                     Remove All Unit Rules                         #
 #####################################################################
 
-    # Function that iterates over all grammar rules, checks whether the grammar 
-    # contains unit rules and if it does, calls the remove_unit_rule function (defined below):
+    # Removes all unit rules (A -> B) from the grammar. Instead of following
+    # every chain of unit rules separately, we compute the unary closure once
+    # (see compute_unit_closure): for every nonterminal A the summed probability
+    # of all unit chains A -> ... -> B. Then every nonterminal A gets the
+    # non-unit rules of every B it reaches, weighted with the chain probability.
+    # e.g.: [S -> N [0.5], N -> B [1.0], B -> 'b' [1.0]] gives S -> 'b' [0.5]
+    # Rules that are created more than once (via different chains) are merged
+    # and their probabilities are summed, so the probabilities of every lhs
+    # still sum to 1.
     def remove_all_unit_rules(self, grammar):
 
-        # List that will contain the newly created rules later on:
-        new_rule_list = []
-        # List that will contain all the other rules from the grammar that we want to keep:
-        remaining_rules = []
+        # Maps a nonterminal to a list of (child, probability) pairs of its unit rules:
+        unit_rules = {}
+        # Maps a nonterminal to all its other (non-unit) rules:
+        other_rules = {}
+        # Order in which the lhs symbols first appear (to keep the output stable):
+        lhs_order = []
 
         # For every production in grammar:
         for production in grammar.productions():
+            lhs = production.lhs()
+            if lhs not in unit_rules and lhs not in other_rules:
+                lhs_order.append(lhs)
 
             # If the length of the rhs of the production is 1 and is a nonterminal
             # (therefore it has to be a unit rule):
-            if len(production.rhs()) == 1 & nltk.grammar.is_nonterminal(production.rhs()[0]) :
+            if len(production.rhs()) == 1 and nltk.grammar.is_nonterminal(production.rhs()[0]):
+                unit_rules.setdefault(lhs, []).append((production.rhs()[0], production.prob()))
+            else:
+                other_rules.setdefault(lhs, []).append(production)
 
-                list_of_rules = [production]
+        # Unary closure, computed once for the whole grammar:
+        closure = self.compute_unit_closure(unit_rules)
 
-                # Empty set that will be filled later on and used to
-                # check whether a nonterminal symbol has already been visited:
-                visited = set()
+        # List that will contain the new grammar rules:
+        new_rule_list = []
+
+        for lhs in lhs_order:
+            # Nonterminals without unit rules keep their rules:
+            if lhs not in unit_rules:
+                new_rule_list.extend(other_rules[lhs])
+                continue
+
+            # Maps the rhs of every new rule to its summed probability:
+            new_rules = {}
+            rhs_order = []
+            for symbol, chain_prob in closure[lhs]:
+                for rule in other_rules.get(symbol, ()):
+                    if rule.rhs() not in new_rules:
+                        new_rules[rule.rhs()] = 0.0
+                        rhs_order.append(rule.rhs())
+                    new_rules[rule.rhs()] += chain_prob * rule.prob()
+
+            for rhs in rhs_order:
+                new_rule_list.append(nltk.grammar.WeightedProduction(lhs, rhs, prob=new_rules[rhs]))
 
-                # Call the remove unit rule function for every unit rule in the grammar:
-                self.remove_unit_rule(production, list_of_rules, new_rule_list, visited)
-            else:
-                remaining_rules.append(production) 
-        
-        # Append the remaining rules from the original grammar:
-        new_rule_list = new_rule_list + remaining_rules    
-                
         # Create nltk grammar instance from list:
         new_gram = nltk.grammar.WeightedGrammar(grammar.start(), new_rule_list)
         return new_gram
     
 
 #####################################################################
-#                         Remove Unit Rule                          #
+#                       Compute Unit Closure                        #
 #####################################################################
 
-    # Function for removing a unit rule (gets called in remove_all_unit_rules).
-    # Takes four arguments:
-
-    # 1. rule = the unit rule
-
-    # 2. list_of_rules = a list that will append all unit rules that can be derived
-    # from another unit rule in corresponding order until a lexical rule is reached.
-    # e.g.: [S -> X, X -> Y, Y -> Z, Z -> 'z']
-
-    # 3. new_rule_list = a list that will contain all the newly created rules for
-    # this one particular chain of consecutive unit rules.
-
-    # 4. visited = a set that will help to recognize cycles in the rules that could
-    # go on recursively (eg. A -> B, B -> A). If we ignored those cycles the program
-    # would try to continue building the list_of_rules indefinitely and would eventually crash.
-
-    def remove_unit_rule(self, rule, list_of_rules, new_rule_list, visited):
+    # Computes the unary closure of the grammar. Takes the dictionary that maps a
+    # nonterminal to the (child, probability) pairs of its unit rules and returns
+    # a dictionary that maps every nonterminal with unit rules to a list of
+    # (nonterminal, probability) pairs: all nonterminals it reaches by unit chains
+    # (including itself) and the summed probability of all chains between them.
 
-        # Create unit rule dictionary:
-        unit_rule_dict = self.create_unit_rule_dict()
+    # The unit rules are split into strongly connected components (see
+    # unit_components), which come out children first. Without cycles, the
+    # closure of A is simply A itself plus the closures of its children,
+    # weighted with the rule probabilities, so every nonterminal is handled
+    # only once. Only inside a cycle (e.g. A -> B, B -> A) the chain
+    # probabilities between the members have to be solved for (see
+    # component_closure).
 
-        # First symbol on the rhs:
-        first_rhs_sym = rule.rhs()[0]
+    def compute_unit_closure(self, unit_rules):
 
-        # Only execute following steps if the nonterminal rule on lhs is not yet contained in the visited set:
-        if rule.lhs() not in visited:
+        # Summed chain probabilities, as dictionaries while computing:
+        closure = {}
 
-            # Add the current rule to the visited set to prevent cycles:
-            visited.add(rule.lhs())
+        for component in self.unit_components(unit_rules):
+            members = set(component)
 
-            # Recursive case:
-            # if the rhs of a rule consists of exactly one nonterminal symbol
-            # (because then it is a unit rule):
-            if len(rule.rhs()) == 1 & nltk.grammar.is_nonterminal(first_rhs_sym):
+            # Chain probabilities between the members of the component:
+            inner = self.component_closure(component, unit_rules)
 
+            # Every member reaches the other members (inner), and from each of
+            # them the closures of the children outside of the component:
+            for source in component:
+                reached = {}
+                for symbol, chain_prob in inner[source].iteritems():
+                    reached[symbol] = reached.get(symbol, 0.0) + chain_prob
+                    for child, prob in unit_rules.get(symbol, ()):
+                        if child in members:
+                            continue
+                        for target, target_prob in closure[child].iteritems():
+                            reached[target] = reached.get(target, 0.0) + chain_prob * prob * target_prob
+                closure[source] = reached
 
-                # For every value in the unit_rule_dictionary that has the first_rhs_sym as key:
-                for next_rule in unit_rule_dict[first_rhs_sym]:
+        # Only nonterminals with unit rules are needed:
+        return dict((symbol, closure[symbol].items()) for symbol in unit_rules)
 
-                    # Create a copy of list_of_rules:
-                    new_list_of_rule = list(list_of_rules)
 
-                    # Append rule from the dictionary to the list:
-                    new_list_of_rule.append(next_rule)
-
-                    # Now call same function recursively with following arguments:
-                    # the next rule in the dictionary as next_rule, the newly created copy
-                    # of the rule list as new_list_of_rule, the newly created rule list as
-                    # new_rule_list and a copy of the visited set as set(visited).
-                    self.remove_unit_rule(next_rule,new_list_of_rule, new_rule_list, set(visited))
-
-            else:
-                # Base case: The rule is a lexical rule.
-                # Here we generate the new grammar rules for every chain of unit rule productions.
-                # e.g. when we have [S -> N, N -> B, B -> 'b'] as list_of_rules,
-                # we need to create the rule S -> 'b', but NOT N -> 'b' because we will also
-                # have a list of rules [N -> B, B -> 'b'], therefore this new rule will be
-                # taken care of separately.
+#####################################################################
+#                        Component Closure                          #
+#####################################################################
 
-                # new lhs of the new rule will be the lhs symbol of the first list_of_rules element:
-                new_rule_lhs = list_of_rules[0].lhs()
-                # new rhs of the new rule will be the rhs symbol (which is a terminal) of the current rule:
-                new_rule_rhs = rule.rhs()
-                # new probability of the rule, initial value is 1 since that is the identity element for multiplication:
-                new_probability = 1
+    # Computes the summed chain probabilities between all members of one
+    # strongly connected component. Returns a dictionary that maps every member
+    # to a dictionary {member: chain probability}. If U is the matrix of unit
+    # rule probabilities inside the component, the chains of any length sum up
+    # to W = I + U + U^2 + ... = (I - U)^-1, which we get by Gauss-Jordan
+    # elimination. A component without a cycle is a single nonterminal, which
+    # only reaches itself.
+    def component_closure(self, component, unit_rules):
+
+        size = len(component)
+        position = dict((symbol, i) for i, symbol in enumerate(component))
+
+        if size == 1:
+            symbol = component[0]
+            # Only a rule A -> A makes a cycle of length one:
+            loop = sum(prob for child, prob in unit_rules.get(symbol, ()) if child == symbol)
+            if loop >= 1.0:
+                raise ValueError("Unit rule cycle with probability 1 at {0}".format(symbol))
+            return {symbol: {symbol: 1.0 / (1.0 - loop)}}
+
+        # matrix = [I - U | I]:
+        matrix = []
+        for i, symbol in enumerate(component):
+            row = [0.0] * (2 * size)
+            row[i] = 1.0
+            row[size + i] = 1.0
+            for child, prob in unit_rules.get(symbol, ()):
+                if child in position:
+                    row[position[child]] -= prob
+            matrix.append(row)
+
+        for column in range(size):
+            # Partial pivoting:
+            pivot_row = max(range(column, size), key=lambda r: abs(matrix[r][column]))
+            if abs(matrix[pivot_row][column]) < 1e-12:
+                raise ValueError("Unit rule cycle with probability 1 at {0}".format(component[column]))
+            matrix[column], matrix[pivot_row] = matrix[pivot_row], matrix[column]
+
+            pivot = matrix[column]
+            factor = 1.0 / pivot[column]
+            for k in range(2 * size):
+                pivot[k] *= factor
+
+            for r in range(size):
+                if r != column and matrix[r][column] != 0.0:
+                    row = matrix[r]
+                    factor = row[column]
+                    for k in range(column, 2 * size):
+                        row[k] -= factor * pivot[k]
+
+        inner = {}
+        for i, symbol in enumerate(component):
+            inverse_row = matrix[i][size:]
+            inner[symbol] = dict((component[j], inverse_row[j]) for j in range(size) if inverse_row[j] > 0.0)
+        return inner
 
-                # For every element(rule) in list_of_rules:
-                for entry in list_of_rules:
-                    # new probability is the new probability times the rule's original probability:
-                    new_probability *= entry.prob()
 
-                # Create a new NLTK rule:
-                new_rule = nltk.grammar.WeightedProduction(new_rule_lhs, new_rule_rhs,  prob=new_probability)
+#####################################################################
+#                          Unit Components                          #
+#####################################################################
 
-                # Store the newly created rule in the new_rule_list:
-                new_rule_list.append(new_rule)
+    # Splits the graph of unit rules into strongly connected components with
+    # Tarjan's algorithm (written without recursion, since unit chains can be
+    # long). Returns the components children first, i.e. every component comes
+    # after all components that can be reached from it.
+    def unit_components(self, unit_rules):
+
+        # All symbols of the graph (lhs and children of unit rules):
+        symbols = set(unit_rules)
+        for children in unit_rules.itervalues():
+            for child, prob in children:
+                symbols.add(child)
+
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+        counter = 0
+
+        for root in symbols:
+            if root in index:
+                continue
+
+            # Each frame: (symbol, iterator over its children)
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            frames = [(root, iter(unit_rules.get(root, ())))]
+
+            while frames:
+                symbol, children = frames[-1]
+                descended = False
+
+                for child, prob in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        frames.append((child, iter(unit_rules.get(child, ()))))
+                        descended = True
+                        break
+                    elif child in on_stack:
+                        lowlink[symbol] = min(lowlink[symbol], index[child])
+
+                if descended:
+                    continue
+
+                # All children are done:
+                frames.pop()
+                if frames:
+                    parent = frames[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[symbol])
+
+                if lowlink[symbol] == index[symbol]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == symbol:
+                            break
+                    components.append(component)
+
+        return components
 
 
 #####################################################################
@@ -289,6 +511,14 @@ class CNF_Conversion(object):
     # elements left.
     # e.g.: If we have a rule (S -> A B C D E), we will create the new rules in 
     # following manner: (S -> A X1), (X1 -> B X2), (X2 -> C X3), (X3 -> D E) 
+    # This is the "right" binarization, the "left" one works from the other end:
+    # (S -> X3 E), (X3 -> X2 D), (X2 -> X1 C), (X1 -> A B)
+    # Each new nonterminal stands for a fixed suffix (or prefix) of the rhs and
+    # has only one rule with probability 1. So if share_intermediates is set,
+    # all rules with the same suffix can use the same new nonterminal, e.g.
+    # (VP -> VVFIN NP PP) and (S -> NP NP PP) both use X1 -> NP PP. The
+    # probabilities do not change, but there are fewer new nonterminals and
+    # fewer binary rules.
     
     def binarize(self, grammar):
         
@@ -300,42 +530,10 @@ class CNF_Conversion(object):
 
             # If the length of the right hand side of the rule is at least 3:
             if len(rule.rhs()) > 2:
-
-                # Create list copy of the rhs of the rule:
-                rhs_list = list(rule.rhs())
-
-                # Prob of the first rule to be created is the current rule's prob:
-                next_prob = rule.prob()
-
-                # The next lhs of the new rule will be the current rule's lhs:
-                next_lhs = rule.lhs()
-
-                # While the length of the right hand side of the rule is at least three:
-                while len(rhs_list) > 2:
-                    
-                    # Call get_next_variable function to generate a new nonterminal:
-                    v = self.get_next_variable()
-
-                    # The new rule will have next_lhs as lhs. On the rhs will be a
-                    # tuple consisting of the first element of rhs_list and the new nonterminal:
-                    new_rule = nltk.grammar.WeightedProduction(next_lhs, (rhs_list[0], v), prob=float(next_prob))
-                    gram_rules_list.append(new_rule)
-
-                    # next_lhs for the next new rule will be the new nonterminal:
-                    next_lhs = v
-                    # Pop leftmost element from rhs_list (position [0]):
-                    rhs_list.pop(0)
-
-                    # Since we now create rules for completely new nonterminals, the probability will always be 1:
-                    next_prob = 1
-
-                    # If the length of the right hand side of the rule is exactly two:
-                    if len(rhs_list) == 2:
-                        # We do not need to generate another nonterminal - instead we use
-                        # the two last elements (nonterminals) of the rhs_list and add them to
-                        # the new rhs of the new rule:
-                        new_rule = nltk.grammar.WeightedProduction(next_lhs, (rhs_list[0], rhs_list[1]), prob=float(1.0))
-                        gram_rules_list.append(new_rule)
+                if self.binarization == "left":
+                    gram_rules_list.extend(self.binarize_left(rule))
+                else:
+                    gram_rules_list.extend(self.binarize_right(rule))
         
         # Append all original grammar rules that have a rhs that is smaller than 3 to the list:
         for rule in grammar.productions():
@@ -346,6 +544,96 @@ class CNF_Conversion(object):
         return nltk.grammar.WeightedGrammar(grammar.start(), gram_rules_list)
     
 
+#####################################################################
+#                     Binarize Right and Left                       #
+#####################################################################
+
+    # Returns the new rules for a rule with at least three symbols on the rhs,
+    # with the new nonterminals on the right (S -> A X1, X1 -> B X2, ...):
+    def binarize_right(self, rule):
+        new_rules = []
+
+        # Create list copy of the rhs of the rule:
+        rhs_list = list(rule.rhs())
+
+        # Prob of the first rule to be created is the current rule's prob:
+        next_prob = rule.prob()
+
+        # The next lhs of the new rule will be the current rule's lhs:
+        next_lhs = rule.lhs()
+
+        # While the length of the right hand side of the rule is at least three:
+        while len(rhs_list) > 2:
+
+            # The new nonterminal stands for everything after the first element:
+            v, is_new = self.get_intermediate(rhs_list[1:])
+
+            # The new rule will have next_lhs as lhs. On the rhs will be a
+            # tuple consisting of the first element of rhs_list and the new nonterminal:
+            new_rules.append(nltk.grammar.WeightedProduction(next_lhs, (rhs_list[0], v), prob=float(next_prob)))
+
+            # A shared nonterminal already has all of its rules:
+            if not is_new:
+                return new_rules
+
+            # next_lhs for the next new rule will be the new nonterminal:
+            next_lhs = v
+            # Pop leftmost element from rhs_list (position [0]):
+            rhs_list.pop(0)
+
+            # Since we now create rules for completely new nonterminals, the probability will always be 1:
+            next_prob = 1
+
+        # The last two elements of rhs_list form the rhs of the last rule:
+        new_rules.append(nltk.grammar.WeightedProduction(next_lhs, (rhs_list[0], rhs_list[1]), prob=float(1.0)))
+        return new_rules
+
+    # Same as binarize_right, but with the new nonterminals on the left
+    # (S -> X2 D, X2 -> X1 C, X1 -> A B):
+    def binarize_left(self, rule):
+        new_rules = []
+        rhs_list = list(rule.rhs())
+        next_prob = rule.prob()
+        next_lhs = rule.lhs()
+
+        while len(rhs_list) > 2:
+
+            # The new nonterminal stands for everything before the last element:
+            v, is_new = self.get_intermediate(rhs_list[:-1])
+
+            new_rules.append(nltk.grammar.WeightedProduction(next_lhs, (v, rhs_list[-1]), prob=float(next_prob)))
+
+            if not is_new:
+                return new_rules
+
+            next_lhs = v
+            # Pop rightmost element from rhs_list:
+            rhs_list.pop()
+            next_prob = 1
+
+        new_rules.append(nltk.grammar.WeightedProduction(next_lhs, (rhs_list[0], rhs_list[1]), prob=float(1.0)))
+        return new_rules
+
+
+#####################################################################
+#                         Get Intermediate                          #
+#####################################################################
+
+    # Returns the new nonterminal for a part of a rhs and whether it was just
+    # created. Without sharing, every call creates a new one.
+    def get_intermediate(self, symbols):
+        if not self.share_intermediates:
+            return (self.get_next_variable(), True)
+
+        key = tuple(symbols)
+        if key in self.intermediates:
+            return (self.intermediates[key], False)
+
+        v = self.get_next_variable()
+        self.intermediates[key] = v
+        return (v, True)
+
+
 #####################################################################
 #                         Get Next Variable                         #
 #####################################################################
@@ -396,32 +684,6 @@ class CNF_Conversion(object):
         return rule_dict
 
 
-#####################################################################
-#                    Create Unit Rule Dictionary                    #
-#####################################################################
-
-    # Creates a dictionary that maps a nonterminal symbol (key) to a list
-    # of all rules that have the nonterminal on its left hand side (value):
-    def create_unit_rule_dict(self):
-
-        rule_dict = {}
-
-        # For every rule in productions:
-        for rule in self.separated_gram.productions():
-            symbol = rule.lhs()
-
-            # If there is no dictionary entry yet:
-            if symbol not in rule_dict:
-                # Add the complete rule:
-                rule_dict[symbol] = [rule]
-
-            else:
-                # Else append the rule:
-                rule_dict[symbol].append(rule)
-
-        return rule_dict
-
-
 #####################################################################
 #                          Get Nonterminal                          #
 #####################################################################
@@ -442,3 +704,25 @@ class CNF_Conversion(object):
         return self.binarized_gram
 
 
+#####################################################################
+#                             Report                                #
+#####################################################################
+
+    # Returns the number of rules before and after every conversion stage and
+    # the number of nonterminals of the final grammar as printable lines.
+    def report(self):
+        lines = ["CNF conversion ({0} separation, {1} binarization{2}):".format(
+            self.separation, self.binarization, ", shared" if self.share_intermediates else "")]
+        previous = None
+        for stage, size in self.stage_sizes:
+            if previous is None:
+                lines.append("  {0:<20} {1:>10} rules".format(stage, size))
+            else:
+                lines.append("  {0:<20} {1:>10} rules ({2:+d})".format(stage, size, size - previous))
+            previous = size
+
+        nonterminals = set(rule.lhs() for rule in self.binarized_gram.productions())
+        lines.append("  {0:<20} {1:>10} ({2} new from binarization)".format("nonterminals", len(nonterminals), self.var_counter - 1))
+        return "\n".join(lines)
+
+
@@ -0,0 +1,156 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                        Chart Classes                            ##
+#####################################################################
+
+
+#####################################################################
+# File:                           Chart.py                          #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import sys
+
+# A single chart cell. Instead of a dictionary of 4-tuples that have to be
+# rebuilt whenever a better probability is found, a cell keeps two flat
+# dictionaries: scores maps a nonterminal id to its best probability and
+# backs maps it to one packed integer backpointer (see Chart.pack).
+class ChartCell(object):
+    __slots__ = ('scores', 'backs')
+
+    def __init__(self):
+        self.scores = {}
+        self.backs = {}
+
+
+# Triangular chart. Only the cells with i + span <= n exist: rows[span-1] holds
+# the cells for all start positions of this span length. The cells are
+# allocated once for the longest sentence seen so far and are only cleared
+# (not reallocated) when the next sentence is parsed.
+class Chart(object):
+
+    # Backpointer of a leaf (lexical) entry:
+    LEAF = -1
+    # Backpointers below LEAF point to the bottom of a unary chain in the
+    # same cell (see pack_unary).
+
+    def __init__(self, num_nts):
+        # Number of nonterminals, used for packing the backpointers:
+        self.num_nts = num_nts
+        self.rows = []
+        # Longest sentence the chart has been allocated for:
+        self.capacity = 0
+        # Length of the sentence currently stored in the chart:
+        self.length = 0
+
+
+#####################################################################
+#                             Reset                                 #
+#####################################################################
+
+    # Prepares the chart for a sentence of length n.
+    def reset(self, n):
+        if n > self.capacity:
+            # Allocate a bigger triangle. Old cells are kept and cleared below:
+            self.allocate(n)
+
+        # Only the cells that were used by the previous sentence need clearing:
+        for span in range(1, self.length+1):
+            row = self.rows[span-1]
+            for i in range(self.length-span+1):
+                row[i].scores.clear()
+                row[i].backs.clear()
+
+        self.length = n
+
+    # Adds one word to the end of the sentence in the chart (incremental
+    # parsing). The cells of the words before are kept as they are, only the
+    # cells of the new column (all spans that end at the new word) are
+    # allocated or cleared.
+    def extend(self):
+        n = self.length + 1
+        if n > self.capacity:
+            self.allocate(n)
+
+        for span in range(1, n+1):
+            cell = self.rows[span-1][n-span]
+            cell.scores.clear()
+            cell.backs.clear()
+
+        self.length = n
+
+    # Allocates the cells for sentences of length n:
+    def allocate(self, n):
+        for span in range(1, n+1):
+            if span > len(self.rows):
+                self.rows.append([])
+            row = self.rows[span-1]
+            for i in range(len(row), n-span+1):
+                row.append(ChartCell())
+        self.capacity = n
+
+
+#####################################################################
+#                          Cell Access                              #
+#####################################################################
+
+    # Returns the cell for the span of the given length starting at i:
+    def cell(self, i, span):
+        return self.rows[span-1][i]
+
+
+#####################################################################
+#                         Backpointers                              #
+#####################################################################
+
+    # Packs partition k, left child and right child into one integer:
+    def pack(self, k, left, right):
+        return (k * self.num_nts + left) * self.num_nts + right
+
+    # Inverse of pack. Returns the triple (k, left, right):
+    def unpack(self, back):
+        k, children = divmod(back, self.num_nts * self.num_nts)
+        left, right = divmod(children, self.num_nts)
+        return (k, left, right)
+
+    # Packs the bottom symbol of a unary chain into a (negative) backpointer:
+    def pack_unary(self, child):
+        return -child - 2
+
+    # Inverse of pack_unary:
+    def unpack_unary(self, back):
+        return -back - 2
+
+
+#####################################################################
+#                          Memory Usage                             #
+#####################################################################
+
+    # Measures the memory of all cells that belong to the current sentence.
+    # Returns a dictionary with the number of cells and entries, the overall
+    # number of bytes and the bytes per cell and per entry.
+    def memory_usage(self):
+        cells = 0
+        entries = 0
+        size = sys.getsizeof(self.rows)
+
+        for span in range(1, self.length+1):
+            row = self.rows[span-1]
+            size += sys.getsizeof(row)
+            for i in range(self.length-span+1):
+                cell = row[i]
+                cells += 1
+                entries += len(cell.scores)
+                size += sys.getsizeof(cell) + sys.getsizeof(cell.scores) + sys.getsizeof(cell.backs)
+                for prob in cell.scores.itervalues():
+                    size += sys.getsizeof(prob)
+                for back in cell.backs.itervalues():
+                    size += sys.getsizeof(back)
+
+        return {
+            "cells": cells,
+            "entries": entries,
+            "bytes": size,
+            "bytes_per_cell": size / float(cells) if cells else 0.0,
+            "bytes_per_entry": size / float(entries) if entries else 0.0,
+        }
@@ -0,0 +1,245 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                    Coarse-to-Fine Parsing                       ##
+#####################################################################
+
+
+#####################################################################
+# File:                           CoarseToFine.py                   #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import re
+import sys
+import nltk.grammar
+from CompiledGrammar import CompiledGrammar
+import CKYProbabilisticParser
+
+# Markovized labels created by NLTK's chomsky_normal_form, e.g. NP|<DT-JJ>:
+_MARKOV_RE = re.compile(r"^([^|]+)\|<.*>$")
+# Intermediate nonterminals created by CNF_Conversion.binarize, e.g. X12:
+_BINARIZE_RE = re.compile(r"^X\d+$")
+
+
+#####################################################################
+#                          Project Label                            #
+#####################################################################
+
+# Default projection of a fine label onto its coarse class: all markovized
+# intermediates of a category (A|<B-C>, A|<D-E>, ...) become A|<> and all
+# binarization intermediates (X1, X2, ...) become X. Everything else is kept.
+def project_label(label):
+    match = _MARKOV_RE.match(label)
+    if match:
+        return match.group(1) + "|<>"
+    if _BINARIZE_RE.match(label):
+        return "X"
+    return label
+
+
+# Runs a cheap CKY pass with a projected (coarse) grammar and decides which
+# (span, label) pairs the fine pass of ProbCKYParser is allowed to fill.
+# Every coarse rule gets the highest probability of all fine rules that
+# project onto it, so coarse inside and outside scores are upper bounds of
+# the fine ones. With a threshold of 0 only pairs that cannot be part of any
+# complete parse are removed and the fine parse stays exactly the same.
+class CoarseToFine(object):
+
+    # Takes the fine CompiledGrammar, the threshold, optionally a projection
+    # function (label string -> coarse label string), whether the fine
+    # parser applies the unary closure (then the coarse parser does as well)
+    # and the external lexicon of the fine parser (if any):
+    def __init__(self, grammar, threshold, projection=None, unary_closure=False, lexicon=None):
+        if projection is None:
+            projection = project_label
+        self.threshold = threshold
+
+        # Maps a fine NLTK symbol to its coarse counterpart:
+        def coarse(symbol):
+            if nltk.grammar.is_nonterminal(symbol):
+                return nltk.grammar.Nonterminal(projection(symbol.symbol()))
+            return symbol
+
+        rules = ((coarse(lhs), tuple(coarse(sym) for sym in rhs), prob) for lhs, rhs, prob in grammar.rules())
+        self.grammar = CompiledGrammar(coarse(grammar.nonterminals[grammar.start]), rules)
+
+        # projection[fine id] = coarse id:
+        self.projection = [self.grammar.nt_id(coarse(nt)) for nt in grammar.nonterminals]
+
+        # The lexicon has to be attached before the coarse parser is created,
+        # so that its span feasibility knows that the PoS tags are preterminals:
+        if lexicon is not None:
+            self.grammar.attach_lexicon(lexicon, projection)
+
+        self.parser = CKYProbabilisticParser.ProbCKYParser(self.grammar, unary_closure=unary_closure)
+
+        # Number of coarse (span, label) pairs of the last sentence that were
+        # found by the coarse pass and that survived the threshold:
+        self.candidates = 0
+        self.kept = 0
+
+
+#####################################################################
+#                          Allowed Labels                           #
+#####################################################################
+
+    # Parses the sentence with the coarse grammar. Returns None if there is no
+    # coarse parse, else a triangle allowed[span-1][i] that holds the set of
+    # coarse label ids that survived the threshold (or None for empty cells).
+    def allowed_labels(self, words):
+        n = len(words)
+        chart = self.parser.fill_chart(words)
+        rows = chart.rows
+        start = self.grammar.start
+
+        self.candidates = 0
+        self.kept = 0
+
+        if n == 0 or start not in rows[n-1][0].scores:
+            return None
+
+        outside = self.viterbi_outside(rows, n)
+        # Inside and outside scores are multiplied in a different order than
+        # the root score, so we allow for rounding errors:
+        limit = self.threshold * rows[n-1][0].scores[start] * (1 - 1e-9)
+
+        allowed = []
+        for span in range(1, n+1):
+            allowed_row = []
+            for i in range(n-span+1):
+                scores = rows[span-1][i].scores
+                self.candidates += len(scores)
+
+                # Keep a label if the best complete parse through it is good enough:
+                kept = set()
+                for nt, out_prob in outside[span-1][i].iteritems():
+                    score = scores[nt] * out_prob
+                    if score > 0 and score >= limit:
+                        kept.add(nt)
+
+                self.kept += len(kept)
+                allowed_row.append(kept or None)
+            allowed.append(allowed_row)
+
+        return allowed
+
+
+#####################################################################
+#                         Viterbi Outside                           #
+#####################################################################
+
+    # Computes the Viterbi outside score of every entry of the coarse chart:
+    # the probability of the best way to complete the entry to a parse of the
+    # whole sentence. Entries that cannot be completed get no outside score.
+    def viterbi_outside(self, rows, n):
+        binary = self.grammar.binary
+
+        outside = [[{} for i in range(n-span+1)] for span in range(1, n+1)]
+        outside[n-1][0][self.grammar.start] = 1.0
+
+        # Top-down, from the longest span to the shortest:
+        for span in range(n, 1, -1):
+            for i in range(n-span+1):
+                out_cell = outside[span-1][i]
+                if not out_cell:
+                    continue
+
+                # Entries at the bottom of unary chains get their outside
+                # scores from the chains' top symbols first:
+                if self.parser.closure is not None:
+                    self.unary_outside(rows[span-1][i].scores, out_cell)
+
+                for k in range(1, span):
+                    nts1 = rows[k-1][i].scores
+                    nts2 = rows[span-k-1][i+k].scores
+                    out1 = outside[k-1][i]
+                    out2 = outside[span-k-1][i+k]
+
+                    for nt1, nt1_probability in nts1.iteritems():
+                        by_right = binary.get(nt1)
+                        if by_right is None:
+                            continue
+
+                        for nt2, nt2_probability in nts2.iteritems():
+                            rules = by_right.get(nt2)
+                            if rules is None:
+                                continue
+
+                            for lhs, prob in rules:
+                                out_prob = out_cell.get(lhs)
+                                if out_prob is None:
+                                    continue
+
+                                # Outside score of the first child:
+                                score = out_prob * prob * nt2_probability
+                                if score > out1.get(nt1, 0):
+                                    out1[nt1] = score
+
+                                # Outside score of the second child:
+                                score = out_prob * prob * nt1_probability
+                                if score > out2.get(nt2, 0):
+                                    out2[nt2] = score
+
+        # The cells of length one were not visited by the loop above:
+        if self.parser.closure is not None:
+            for i in range(n):
+                if outside[0][i]:
+                    self.unary_outside(rows[0][i].scores, outside[0][i])
+
+        return outside
+
+    # Passes the outside scores of a cell down its unary chains. The closure
+    # contains the best chain between any two symbols, so one pass is enough.
+    def unary_outside(self, scores, out_cell):
+        closure = self.parser.closure
+        for child in scores:
+            for lhs, chain_prob in closure.get(child, ()):
+                out_prob = out_cell.get(lhs)
+                if out_prob is not None and out_prob * chain_prob > out_cell.get(child, 0):
+                    out_cell[child] = out_prob * chain_prob
+
+
+#####################################################################
+#                           Main Script                             #
+#####################################################################
+
+# Parses every sentence with and without the coarse pass (threshold 0, which
+# must not change any parse) and compares the results.
+# Command line arguments:
+# [0]: CoarseToFine.py
+# [1]: grammar file (in CNF, unit rules are allowed)
+# [2]: file with input sentences
+# [3]: optional BitPar lexicon for the lexical rules
+if __name__ == "__main__":
+    if len(sys.argv) in (3, 4):
+        import PCFGLoader
+        import BitparLexicon
+        start, rules = PCFGLoader.PCFGLoader().read(sys.argv[1])
+        lexicon = BitparLexicon.BitparLexicon(sys.argv[3]) if len(sys.argv) == 4 else None
+
+        # Both parsers need their own grammar, the lexicon changes its lexical rules:
+        fine = CKYProbabilisticParser.ProbCKYParser(CompiledGrammar(start, rules), unary_closure=True,
+                                                    lexicon=lexicon)
+        coarse = CKYProbabilisticParser.ProbCKYParser(CompiledGrammar(start, rules), unary_closure=True,
+                                                      lexicon=lexicon, coarse_threshold=0.0)
+
+        different = 0
+        input_file = open(sys.argv[2], 'r')
+        for line in input_file:
+            words = line.split()
+            expected = fine.prob_cky_parse(words)
+            result = coarse.prob_cky_parse(words)
+            same = (result is None and expected is None) or (result is not None and expected is not None and
+                                                             result[0] == expected[0] and result[1] == expected[1])
+            different += not same
+            print "{0} words: {1}".format(len(words), "same parse" if same else "DIFFERENT PARSE")
+        input_file.close()
+
+        print "{0} sentences with a different parse".format(different)
+        if different:
+            sys.exit(1)
+    else:
+        print "USAGE: python CoarseToFine.py pcfg input_file [lexicon] \n"
+        print "pcfg = A probabilistic context free grammar in CNF (unit rules are allowed). \n"
+        print "input_file = File that contains one sentence per line. \n"
+        print "lexicon = BitPar lexicon that provides the lexical rules of the input words. \n"
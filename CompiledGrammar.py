@@ -0,0 +1,316 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                    Compiled Grammar Class                       ##
+#####################################################################
+
+
+#####################################################################
+# File:                           CompiledGrammar.py                #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import hashlib
+import heapq
+import nltk.grammar
+
+# Integer-indexed version of a grammar in Chomsky normal form. It is built once
+# from the NLTK grammar so that the parser never has to touch NLTK objects inside
+# its inner loop: every nonterminal and terminal is mapped to a dense integer,
+# binary rules are indexed by the pair (left child, right child), lexical rules
+# are indexed by the word and all probabilities are stored right next to them.
+class CompiledGrammar(object):
+
+    # Takes the start symbol and an iterable of (lhs, rhs, probability) triples.
+    # Nonterminals have to be NLTK nonterminals, terminals are plain strings.
+    def __init__(self, start, rules):
+
+        # Symbol tables (id -> symbol and symbol -> id):
+        self.nonterminals = []
+        self.nt_index = {}
+        self.terminals = []
+        self.term_index = {}
+
+        # binary[left id][right id] = list of (lhs id, probability):
+        self.binary = {}
+        # lexical[word] = list of (lhs id, probability):
+        self.lexical = {}
+        # unary[child id] = list of (lhs id, probability). Unit rules are not
+        # part of CNF, so the CKY engine ignores them, but we keep them around:
+        self.unary = {}
+
+        # Number of rules that are neither binary, lexical nor unary:
+        self.skipped_rules = 0
+
+        # Unary closure, only computed when needed (see unary_closure):
+        self.closure = None
+        self.closure_next = None
+
+        # External lexicon (see attach_lexicon):
+        self.lexicon = None
+
+        self.start = self.nt_id(start)
+
+        for lhs, rhs, prob in rules:
+            self.add_rule(lhs, rhs, prob)
+
+        # The rule tables were collected as dictionaries to merge duplicate
+        # rules. The parser only iterates over them, so we turn them into lists:
+        self.freeze()
+
+
+#####################################################################
+#                         From Grammar                              #
+#####################################################################
+
+    # Builds a compiled grammar from an NLTK WeightedGrammar.
+    @classmethod
+    def from_grammar(cls, grammar):
+        rules = ((prod.lhs(), prod.rhs(), prod.prob()) for prod in grammar.productions())
+        return cls(grammar.start(), rules)
+
+
+#####################################################################
+#                      Serialization Tables                         #
+#####################################################################
+
+    # Returns the grammar as plain dictionaries, lists, strings and numbers,
+    # which can be written with marshal (see GrammarCache.py).
+    def to_tables(self):
+        return {
+            "start": self.start,
+            "nonterminals": [nt.symbol() for nt in self.nonterminals],
+            "terminals": self.terminals,
+            "binary": self.binary,
+            "lexical": self.lexical,
+            "unary": self.unary,
+            "skipped_rules": self.skipped_rules,
+        }
+
+    # Inverse of to_tables. Rebuilds the grammar without going through add_rule.
+    @classmethod
+    def from_tables(cls, tables):
+        grammar = cls.__new__(cls)
+        grammar.nonterminals = [nltk.grammar.Nonterminal(symbol) for symbol in tables["nonterminals"]]
+        grammar.nt_index = dict((nt, index) for index, nt in enumerate(grammar.nonterminals))
+        grammar.terminals = tables["terminals"]
+        grammar.term_index = dict((term, index) for index, term in enumerate(grammar.terminals))
+        grammar.binary = tables["binary"]
+        grammar.lexical = tables["lexical"]
+        grammar.unary = tables["unary"]
+        grammar.skipped_rules = tables["skipped_rules"]
+        grammar.start = tables["start"]
+        grammar.closure = None
+        grammar.closure_next = None
+        grammar.lexicon = None
+        return grammar
+
+
+#####################################################################
+#                         Symbol Tables                             #
+#####################################################################
+
+    # Returns the id of a nonterminal and creates a new one if necessary:
+    def nt_id(self, symbol):
+        index = self.nt_index.get(symbol)
+        if index is None:
+            index = len(self.nonterminals)
+            self.nt_index[symbol] = index
+            self.nonterminals.append(symbol)
+        return index
+
+    # Returns the id of a terminal and creates a new one if necessary:
+    def term_id(self, symbol):
+        index = self.term_index.get(symbol)
+        if index is None:
+            index = len(self.terminals)
+            self.term_index[symbol] = index
+            self.terminals.append(symbol)
+        return index
+
+
+#####################################################################
+#                            Add Rule                               #
+#####################################################################
+
+    # Stores a single rule in the matching table. If the same rule occurs
+    # more than once, only the most probable one is kept, since the Viterbi
+    # parse could never use the other ones anyway.
+    def add_rule(self, lhs, rhs, prob):
+        lhs_id = self.nt_id(lhs)
+
+        if len(rhs) == 2 and nltk.grammar.is_nonterminal(rhs[0]) and nltk.grammar.is_nonterminal(rhs[1]):
+            by_right = self.binary.setdefault(self.nt_id(rhs[0]), {})
+            rules = by_right.setdefault(self.nt_id(rhs[1]), {})
+
+        elif len(rhs) == 1 and nltk.grammar.is_terminal(rhs[0]):
+            self.term_id(rhs[0])
+            rules = self.lexical.setdefault(rhs[0], {})
+
+        elif len(rhs) == 1:
+            rules = self.unary.setdefault(self.nt_id(rhs[0]), {})
+
+        else:
+            self.skipped_rules += 1
+            return
+
+        if prob > rules.get(lhs_id, 0):
+            rules[lhs_id] = prob
+
+
+#####################################################################
+#                             Freeze                                #
+#####################################################################
+
+    # Converts the {lhs id: probability} dictionaries into lists of tuples:
+    def freeze(self):
+        for by_right in self.binary.itervalues():
+            for right in by_right:
+                by_right[right] = by_right[right].items()
+
+        for table in (self.lexical, self.unary):
+            for key in table:
+                table[key] = table[key].items()
+
+
+#####################################################################
+#                         External Lexicon                          #
+#####################################################################
+
+    # Attaches a lexicon provider (e.g. BitparLexicon) that is asked for the
+    # lexical rules of every input word. The rules of a word are only added
+    # when the word is parsed for the first time (see lexical_rules), so the
+    # grammar only grows with the vocabulary of the input. tag_map maps the
+    # PoS tags of the lexicon onto the symbols of this grammar (used by the
+    # coarse grammar of CoarseToFine). PoS tags that are not nonterminals of
+    # the grammar are ignored, since no rule could use them.
+    def attach_lexicon(self, lexicon, tag_map=None):
+        self.lexicon = lexicon
+        self.lexicon_tag_map = tag_map
+        # Words whose lexicon rules are already part of the lexical table:
+        self.lexicon_words = set()
+
+    # Returns the list of (lhs id, probability) pairs of a word:
+    def lexical_rules(self, word):
+        if self.lexicon is None or word in self.lexicon_words:
+            return self.lexical.get(word, ())
+
+        # Merge the rules of the lexicon with the lexical rules of the grammar
+        # (the most probable one wins, like in add_rule):
+        rules = dict(self.lexical.get(word, ()))
+        for tag, prob in self.lexicon.lookup(word):
+            if self.lexicon_tag_map is not None:
+                tag = self.lexicon_tag_map(tag)
+            lhs = self.nt_index.get(nltk.grammar.Nonterminal(tag))
+            if lhs is not None and prob > rules.get(lhs, 0):
+                rules[lhs] = prob
+
+        self.lexicon_words.add(word)
+        if rules:
+            self.lexical[word] = rules.items()
+        return self.lexical.get(word, ())
+
+
+#####################################################################
+#                             Rules                                 #
+#####################################################################
+
+    # Generator over all stored rules as (lhs, rhs, probability) triples
+    # with the original NLTK symbols.
+    def rules(self):
+        nts = self.nonterminals
+        for left, by_right in self.binary.iteritems():
+            for right, rule_list in by_right.iteritems():
+                for lhs, prob in rule_list:
+                    yield (nts[lhs], (nts[left], nts[right]), prob)
+
+        for word, rule_list in self.lexical.iteritems():
+            for lhs, prob in rule_list:
+                yield (nts[lhs], (word,), prob)
+
+        for child, rule_list in self.unary.iteritems():
+            for lhs, prob in rule_list:
+                yield (nts[lhs], (nts[child],), prob)
+
+
+#####################################################################
+#                          Unary Closure                            #
+#####################################################################
+
+    # Computes the Viterbi closure of the unary rules: for every nonterminal B
+    # all nonterminals A != B with A -> ... -> B and the probability of the best
+    # chain between them. Returns a dictionary that maps B to a list of
+    # (A, chain probability) pairs. For rebuilding the chains, closure_next
+    # maps (A, B) to the child of A in the best chain.
+    def unary_closure(self):
+        if self.closure is not None:
+            return self.closure
+
+        self.closure = {}
+        self.closure_next = {}
+
+        for bottom in self.unary:
+            # Best-first search upwards from bottom. All probabilities are at
+            # most 1, so a symbol has its best chain when it is popped first:
+            best = {bottom: 1.0}
+            agenda = [(-1.0, bottom)]
+            done = set()
+
+            while agenda:
+                neg_prob, symbol = heapq.heappop(agenda)
+                if symbol in done:
+                    continue
+                done.add(symbol)
+
+                for lhs, prob in self.unary.get(symbol, ()):
+                    chain_prob = -neg_prob * prob
+                    if chain_prob > best.get(lhs, 0.0):
+                        best[lhs] = chain_prob
+                        self.closure_next[(lhs, bottom)] = symbol
+                        heapq.heappush(agenda, (-chain_prob, lhs))
+
+            del best[bottom]
+            if best:
+                self.closure[bottom] = best.items()
+
+        return self.closure
+
+    # Returns the best unary chain from top down to bottom as list of ids
+    # (including both ends):
+    def unary_chain(self, top, bottom):
+        chain = [top]
+        while chain[-1] != bottom:
+            chain.append(self.closure_next[(chain[-1], bottom)])
+        return chain
+
+
+#####################################################################
+#                          Grammar Size                             #
+#####################################################################
+
+    # Returns the number of binary, lexical and unary rules:
+    def rule_counts(self):
+        binary = 0
+        for by_right in self.binary.itervalues():
+            for rules in by_right.itervalues():
+                binary += len(rules)
+
+        lexical = sum(len(rules) for rules in self.lexical.itervalues())
+        unary = sum(len(rules) for rules in self.unary.itervalues())
+
+        return (binary, lexical, unary)
+
+
+#####################################################################
+#                          Fingerprint                              #
+#####################################################################
+
+    # Returns a hash of all rules of the grammar (e.g. for ResultCache.py). The
+    # rules are sorted first, so the same grammar always gets the same
+    # fingerprint, no matter whether it was converted or loaded from a cache.
+    def fingerprint(self):
+        rules = sorted((repr(lhs), repr(rhs), repr(prob)) for lhs, rhs, prob in self.rules())
+        content_hash = hashlib.sha1(repr(self.nonterminals[self.start]))
+        for rule in rules:
+            content_hash.update(" ".join(rule))
+            content_hash.update("\n")
+        return content_hash.hexdigest()
@@ -0,0 +1,100 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                    Compiled Grammar Cache                       ##
+#####################################################################
+
+
+#####################################################################
+# File:                           GrammarCache.py                   #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import hashlib
+import marshal
+import os
+from CompiledGrammar import CompiledGrammar
+
+# Has to be increased whenever CNFConversion or CompiledGrammar change the
+# grammar they produce, so that old cache files are not used any more:
+CONVERTER_VERSION = 2
+
+# The cache file is stored next to the grammar file with this extension:
+CACHE_EXTENSION = ".cnfcache"
+
+
+#####################################################################
+#                            Cache Key                              #
+#####################################################################
+
+# Returns the cache key of a grammar file: a hash of its content, the
+# converter version and the name of the conversion variant (if any).
+def grammar_key(grammar_path, variant=""):
+    content_hash = hashlib.sha1()
+    grammar_file = open(grammar_path, 'rb')
+    for block in iter(lambda: grammar_file.read(1 << 20), ''):
+        content_hash.update(block)
+    grammar_file.close()
+    return "{0}-{1}-{2}".format(content_hash.hexdigest(), CONVERTER_VERSION, variant)
+
+
+# Returns the path of the cache file that belongs to a grammar file (and
+# conversion variant):
+def cache_path(grammar_path, variant=""):
+    if variant:
+        return "{0}.{1}{2}".format(grammar_path, variant, CACHE_EXTENSION)
+    return grammar_path + CACHE_EXTENSION
+
+
+#####################################################################
+#                               Load                                #
+#####################################################################
+
+# Loads the compiled grammar from the cache file with a single read. Returns
+# None if there is no cache file, if it is damaged or if it was written for
+# another grammar file content or converter version.
+def load(grammar_path, key, variant=""):
+    path = cache_path(grammar_path, variant)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        cache_file = open(path, 'rb')
+        data = cache_file.read()
+        cache_file.close()
+        tables = marshal.loads(data)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+
+    if not isinstance(tables, dict) or tables.get("key") != key:
+        return None
+
+    return CompiledGrammar.from_tables(tables)
+
+
+#####################################################################
+#                               Save                                #
+#####################################################################
+
+# Writes the compiled grammar into the cache file. The file is written under a
+# temporary name first, so that an interrupted run never leaves a broken cache.
+# Returns False if the file could not be written (e.g. read-only directory).
+def save(grammar_path, key, grammar, variant=""):
+    tables = grammar.to_tables()
+    tables["key"] = key
+
+    path = cache_path(grammar_path, variant)
+    temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+        cache_file = open(temp_path, 'wb')
+        marshal.dump(tables, cache_file)
+        cache_file.close()
+        if os.name == "nt" and os.path.exists(path):
+            # Windows cannot rename onto an existing file:
+            os.remove(path)
+        os.rename(temp_path, path)
+    except (IOError, OSError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+    return True
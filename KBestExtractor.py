@@ -0,0 +1,322 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                    Lazy K-Best Extraction                       ##
+#####################################################################
+
+
+#####################################################################
+# File:                           KBestExtractor.py                 #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import heapq
+from ParseResult import ParseResult
+
+
+# Extracts the k most probable trees from a filled chart of ProbCKYParser
+# (lazy k-best algorithm, Huang & Chiang 2005, algorithm 3). The chart is seen
+# as a hypergraph: a vertex is a nonterminal over a span, its incoming edges
+# are all ways to build it from vertices of the chart. A derivation of a
+# vertex is an edge plus the rank of the derivation used for every child, so
+# the next best derivations are found by increasing one rank at a time. The
+# derivations of a vertex are only computed when they are asked for, and the
+# edges of a vertex only when it is visited for the first time, so k trees
+# cost little more than the single best tree.
+#
+# With the unary closure, a nonterminal has two vertices per span: one for its
+# derivations that start with a binary or lexical rule and one for all its
+# derivations, which adds the best unit chains to the other nonterminals of
+# the cell (the same chains the parser uses). Derivations that only differ in
+# the unit chain between two nonterminals are therefore not enumerated.
+class KBestExtractor(object):
+
+    # Takes the CompiledGrammar of the parser and its unary closure table (or
+    # None without unary closure). The rule indices are built only once.
+    def __init__(self, grammar, closure=None):
+        self.grammar = grammar
+        self.closed = closure is not None
+
+        # Binary rules indexed by their lhs (lhs -> list of (left, right, probability)):
+        self.rules_by_lhs = {}
+        for left, by_right in grammar.binary.iteritems():
+            for right, rule_list in by_right.iteritems():
+                for lhs, prob in rule_list:
+                    self.rules_by_lhs.setdefault(lhs, []).append((left, right, prob))
+
+        # Unit chains indexed by their top (ancestor -> list of (bottom, chain probability)):
+        self.chains_below = {}
+        if closure is not None:
+            for child, ancestors in closure.iteritems():
+                for ancestor, prob in ancestors:
+                    self.chains_below.setdefault(ancestor, []).append((child, prob))
+
+        self.rows = None
+        self.words = []
+
+
+#####################################################################
+#                             K-Best                                #
+#####################################################################
+
+    # Returns the list of the (at most) k most probable parses of a filled
+    # chart as ParseResults (see ParseResult.py), most probable first. words
+    # is the sentence the chart was filled for.
+    def k_best(self, chart, words, k):
+        n = len(words)
+        self.rows = chart.rows
+        self.words = words
+
+        # Lexical probabilities of every position of the sentence:
+        self.lexical = [dict(self.grammar.lexical_rules(word)) for word in words]
+
+        # State of the vertices: the edges, the derivations found so far, the
+        # heap of candidate derivations, the candidates that were already
+        # pushed (as pairs of edge index and ranks) and the number of
+        # derivations whose successors were pushed:
+        self.edges = {}
+        self.derivations = {}
+        self.candidates = {}
+        self.seen = {}
+        self.expanded = {}
+
+        start = self.grammar.start
+        if n == 0 or start not in self.rows[n-1][0].scores:
+            return []
+
+        root = (start, 0, n, self.closed)
+        results = []
+        for rank in range(k):
+            derivation = self.kth_derivation(root, rank)
+            if derivation is None:
+                break
+            results.append(ParseResult(self.extract_derivation(root, rank), words, derivation[0]))
+        return results
+
+
+#####################################################################
+#                       Lazy Derivations                            #
+#####################################################################
+
+    # Returns the derivation of the given rank of a vertex as (probability,
+    # edge index, ranks of the children), or None if there are not that many.
+    # The derivations of the children that are needed first are requested on
+    # an explicit stack instead of by recursion, so deep trees do not exceed
+    # Python's recursion limit.
+    def kth_derivation(self, vertex, rank):
+        derivations = self.derivations.get(vertex)
+        if derivations is not None and rank < len(derivations):
+            return derivations[rank]
+
+        stack = [(vertex, rank)]
+        while stack:
+            needed = self.advance(*stack[-1])
+            if needed:
+                stack.extend(needed)
+            else:
+                stack.pop()
+
+        derivations = self.derivations[vertex]
+        if rank < len(derivations):
+            return derivations[rank]
+        return None
+
+    # Computes the derivations of a vertex up to the given rank (or all of
+    # them if there are fewer). Returns the list of (child, rank) pairs whose
+    # derivations are needed first, which is empty when the vertex is done.
+    def advance(self, vertex, rank):
+        if vertex not in self.derivations:
+            edges = self.edges.get(vertex)
+            if edges is None:
+                edges = self.edges[vertex] = self.incoming(vertex)
+            # The first candidates need the best derivations of all children
+            # (a child with a derivation has its best one):
+            derivations = self.derivations
+            needed = [(child, 0) for prob, children in edges for child in children
+                      if not derivations.get(child) and not self.known(child, 0)]
+            if needed:
+                return needed
+            self.visit(vertex)
+
+        derivations = self.derivations[vertex]
+        candidates = self.candidates[vertex]
+        while len(derivations) <= rank:
+            # The successors of the last derivation only become candidates
+            # when the next one is needed:
+            if self.expanded[vertex] < len(derivations):
+                needed = self.successor_needs(vertex, derivations[-1])
+                if needed:
+                    return needed
+                self.push_successors(vertex, derivations[-1])
+                self.expanded[vertex] = len(derivations)
+            if not candidates:
+                break
+            neg_prob, index, ranks = heapq.heappop(candidates)
+            derivations.append((-neg_prob, index, ranks))
+        return []
+
+    # Whether the derivation of the given rank of a vertex is known, i.e.
+    # computed or known not to exist:
+    def known(self, vertex, rank):
+        derivations = self.derivations.get(vertex)
+        if derivations is None:
+            return False
+        return rank < len(derivations) or (not self.candidates[vertex] and
+                                           self.expanded[vertex] == len(derivations))
+
+    # Creates the first candidates of a vertex that is visited for the first
+    # time: the best derivations of all its edges.
+    def visit(self, vertex):
+        edges = self.edges[vertex]
+        self.derivations[vertex] = []
+        self.seen[vertex] = set()
+        # Number of derivations whose successors were pushed:
+        self.expanded[vertex] = 0
+
+        # Same as derivation_prob with all ranks 0, but without its call for
+        # every edge:
+        derivations = self.derivations
+        seen = self.seen[vertex]
+        candidates = []
+        for index in range(len(edges)):
+            prob, children = edges[index]
+            ranks = (0,) * len(children)
+            seen.add((index, ranks))
+            for child in children:
+                child_derivations = derivations[child]
+                if not child_derivations:
+                    break
+                prob = prob * child_derivations[0][0]
+            else:
+                candidates.append((-prob, index, ranks))
+        heapq.heapify(candidates)
+        self.candidates[vertex] = candidates
+
+    # Returns the (child, rank) pairs that push_successors needs, but that
+    # are not known yet:
+    def successor_needs(self, vertex, derivation):
+        prob, index, ranks = derivation
+        children = self.edges[vertex][index][1]
+        seen = self.seen[vertex]
+
+        needed = []
+        for position in range(len(ranks)):
+            successor = ranks[:position] + (ranks[position] + 1,) + ranks[position+1:]
+            if (index, successor) not in seen and not self.known(children[position], successor[position]):
+                needed.append((children[position], successor[position]))
+        return needed
+
+    # Adds the derivations that use the next derivation of one of the
+    # children instead of the given derivation's one to the candidates:
+    def push_successors(self, vertex, derivation):
+        prob, index, ranks = derivation
+        edge = self.edges[vertex][index]
+        seen = self.seen[vertex]
+
+        for position in range(len(ranks)):
+            successor = ranks[:position] + (ranks[position] + 1,) + ranks[position+1:]
+            if (index, successor) in seen:
+                continue
+            seen.add((index, successor))
+            successor_prob = self.derivation_prob(edge, successor)
+            if successor_prob is not None:
+                heapq.heappush(self.candidates[vertex], (-successor_prob, index, successor))
+
+    # Probability of an edge with the given ranks for its children, or None
+    # if one of the children has not that many derivations. The derivations
+    # of the children have to be known (see advance). The factors are
+    # multiplied in the same order as in the parser, so the best derivation
+    # gets exactly the probability of the chart.
+    def derivation_prob(self, edge, ranks):
+        prob = edge[0]
+        for child, rank in zip(edge[1], ranks):
+            derivations = self.derivations[child]
+            if rank >= len(derivations):
+                return None
+            prob = prob * derivations[rank][0]
+        return prob
+
+
+#####################################################################
+#                          Incoming Edges                           #
+#####################################################################
+
+    # Returns the list of incoming edges of a vertex (nonterminal, start,
+    # span length, closed) as (rule probability, tuple of child vertices).
+    # Only nonterminals that are in the chart are used as children, so
+    # pruned entries stay pruned.
+    def incoming(self, vertex):
+        symbol, i, span, closed = vertex
+        rows = self.rows
+        edges = []
+
+        # All derivations: the ones of the nonterminal itself and the best unit
+        # chains down to the other nonterminals of the cell.
+        if closed:
+            edges.append((1.0, ((symbol, i, span, False),)))
+            scores = rows[span-1][i].scores
+            for child, chain_prob in self.chains_below.get(symbol, ()):
+                if child in scores:
+                    edges.append((chain_prob, ((child, i, span, False),)))
+
+        # Leaf: the lexical rule of the word.
+        elif span == 1:
+            prob = self.lexical[i].get(symbol)
+            if prob:
+                edges.append((prob, ()))
+
+        # Binary rules over all partitions of the span:
+        else:
+            rules = self.rules_by_lhs.get(symbol, ())
+            for k in range(1, span):
+                left_scores = rows[k-1][i].scores
+                right_scores = rows[span-k-1][i+k].scores
+                if not left_scores or not right_scores:
+                    continue
+                for left, right, prob in rules:
+                    if left in left_scores and right in right_scores:
+                        edges.append((prob, ((left, i, k, self.closed), (right, i+k, span-k, self.closed))))
+
+        return edges
+
+
+#####################################################################
+#                       Extract Derivation                          #
+#####################################################################
+
+    # Returns the derivation of the given rank of a vertex as list of (label,
+    # start, end, number of children) in preorder (see ParseResult.py). Like
+    # ProbCKYParser.extract_derivation, the nodes are read with an explicit
+    # stack instead of recursion.
+    def extract_derivation(self, vertex, rank):
+        nonterminals = self.grammar.nonterminals
+        nodes = []
+        stack = [(vertex, rank)]
+
+        while stack:
+            vertex, rank = stack.pop()
+            symbol, i, span, closed = vertex
+            prob, index, ranks = self.derivations[vertex][rank]
+            children = self.edges[vertex][index][1]
+
+            # Unit chain (or the nonterminal's own derivations): the chain's
+            # nodes come first, each with one child, then the derivation of
+            # its bottom symbol.
+            if closed:
+                bottom = children[0][0]
+                if bottom != symbol:
+                    for node in self.grammar.unary_chain(symbol, bottom)[:-1]:
+                        nodes.append((nonterminals[node], i, i+span, 1))
+                stack.append((children[0], ranks[0]))
+
+            # Binary edge. The second child is pushed first, so the first one
+            # comes next in the list:
+            elif children:
+                nodes.append((nonterminals[symbol], i, i+span, 2))
+                stack.append((children[1], ranks[1]))
+                stack.append((children[0], ranks[0]))
+
+            else:
+                # Leaf node. The input word is at position i:
+                nodes.append((nonterminals[symbol], i, i+1, 0))
+
+        return nodes
@@ -0,0 +1,310 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                         Output Writers                          ##
+#####################################################################
+
+
+#####################################################################
+# File:                           OutputWriters.py                  #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import json
+import struct
+import sys
+from ParseResult import ParseResult, from_tree
+
+
+# Writes parse results into an output file in one of several formats (see
+# FORMATS). The formatted results are collected and written in bulk, every
+# buffer_size sentences and on flush() and close(). A result is a ParseResult,
+# a (tree, probability) pair or None for a sentence without a parse.
+class OutputWriter(object):
+
+    # Whether the output file has to be opened in binary mode:
+    binary = False
+
+    def __init__(self, output_file, buffer_size=1000):
+        self.output_file = output_file
+        self.buffer_size = buffer_size
+        self.buffer = []
+        # Number of sentences written so far:
+        self.sentences = 0
+
+    # Writes the result of one sentence:
+    def write(self, result):
+        self.buffer.append(self.format(result))
+        self.finish_sentence()
+
+    # Writes the k-best results of one sentence (a list of results, most
+    # probable first, empty if there is no parse):
+    def write_k_best(self, results):
+        self.buffer.append(self.format_k_best(results))
+        self.finish_sentence()
+
+    # Counts the sentence and writes the buffer when it is full:
+    def finish_sentence(self):
+        self.sentences += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    # Writes everything in the buffer into the output file:
+    def flush(self):
+        if self.buffer:
+            self.output_file.write("".join(self.buffer))
+            self.buffer = []
+        self.output_file.flush()
+
+    # Writes the rest of the buffer. The output file is closed by the caller.
+    def close(self):
+        self.flush()
+
+    # Returns the output of one result:
+    def format(self, result):
+        raise NotImplementedError()
+
+    # Default for k-best results: every result on its own, followed by an
+    # empty line. A sentence without a parse gets the output of None.
+    def format_k_best(self, results):
+        if not results:
+            results = [None]
+        return "".join(self.format(result) for result in results) + "\n"
+
+
+#####################################################################
+#                          Text Writers                             #
+#####################################################################
+
+# The original format: the pretty-printed tree and the probability.
+# Sentences without a parse get the tree None and the probability 0.
+class TreeWriter(OutputWriter):
+
+    def format(self, result):
+        if result is None:
+            result = (None, 0.0)
+        return "{0} \t {1} \n".format(result[0], result[1])
+
+
+# One line per sentence: the tree as bracket string on a single line, a tab
+# and the probability. Sentences without a parse get the empty tree (()).
+class PennWriter(OutputWriter):
+
+    def format(self, result):
+        if result is None:
+            return "(())\t0.0\n"
+        result = parse_result(result)
+        return "{0}\t{1!r}\n".format(result.bracket_string(), result.probability)
+
+
+# JSON Lines: one object per sentence with its number (starting with 0), the
+# bracket string of the tree (null without a parse) and the probability. With
+# k-best parsing, the object has the list of all parses instead.
+class JsonLinesWriter(OutputWriter):
+
+    def format(self, result):
+        entry = {"sentence": self.sentences}
+        entry.update(json_parse(result))
+        return json.dumps(entry) + "\n"
+
+    def format_k_best(self, results):
+        return json.dumps({"sentence": self.sentences, "parses": [json_parse(result) for result in results]}) + "\n"
+
+
+# Returns the tree and probability of a result as dictionary for JSON:
+def json_parse(result):
+    if result is None:
+        return {"tree": None, "probability": 0.0}
+    result = parse_result(result)
+    return {"tree": decode_text(result.bracket_string()), "probability": result.probability}
+
+
+# Words and labels are byte strings in the encoding of the input files, but
+# JSON needs unicode. Strings that are valid UTF-8 are decoded as UTF-8, all
+# others as Latin-1 (the encoding of the BitPar lexicon), which can decode
+# every byte, so no word makes the output fail.
+def decode_text(text):
+    if isinstance(text, unicode):
+        return text
+    return text.decode(text_encoding(text))
+
+
+# Returns the encoding decode_text uses for a byte string:
+def text_encoding(text):
+    try:
+        text.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+#####################################################################
+#                        Binary Span Writer                         #
+#####################################################################
+
+# Start of every file of the binary span format:
+SPAN_MAGIC = "CKYSPANS"
+SPAN_VERSION = 1
+
+# Record types of the binary span format:
+LABEL_RECORD = 0
+PARSE_RECORD = 1
+END_RECORD = 2
+
+_HEADER = struct.Struct("<8sH")
+_LABEL = struct.Struct("<BIH")
+_PARSE = struct.Struct("<BdI")
+_END = struct.Struct("<B")
+_NODE = struct.Struct("<IHH")
+
+
+# Compact binary format without trees and words: every parse is the list of
+# its nodes in preorder as (label id, start, end), which is all that is needed
+# to rebuild the tree together with the input sentence. All numbers are little
+# endian. After the header (magic, version) follow records, each starting with
+# its type:
+#   label: id (uint32), length (uint16), name (as in the grammar). Comes
+#          before the first parse that uses the label.
+#   parse: probability (double), number of nodes (uint32), then every node as
+#          label id (uint32), start and end (uint16 each).
+#   end:   end of a sentence. Every sentence has its parses (none, one or k)
+#          followed by an end record.
+# read_spans reads the format back.
+class SpanWriter(OutputWriter):
+
+    binary = True
+
+    def __init__(self, output_file, buffer_size=1000):
+        OutputWriter.__init__(self, output_file, buffer_size)
+        # Maps a label to its id:
+        self.label_ids = {}
+        self.buffer.append(_HEADER.pack(SPAN_MAGIC, SPAN_VERSION))
+
+    def format(self, result):
+        if result is None:
+            return _END.pack(END_RECORD)
+        return self.format_parse(result) + _END.pack(END_RECORD)
+
+    def format_k_best(self, results):
+        return "".join(self.format_parse(result) for result in results) + _END.pack(END_RECORD)
+
+    # Returns the parse record of a result (and the records of its new labels):
+    def format_parse(self, result):
+        result = parse_result(result)
+        label_ids = self.label_ids
+        records = []
+
+        values = []
+        for label, start, end, arity in result.nodes:
+            label_id = label_ids.get(label)
+            if label_id is None:
+                label_id = label_ids[label] = len(label_ids)
+                name = str(label)
+                records.append(_LABEL.pack(LABEL_RECORD, label_id, len(name)) + name)
+            values.extend((label_id, start, end))
+
+        records.append(_PARSE.pack(PARSE_RECORD, result.probability, len(result.nodes)))
+        records.append(struct.pack("<" + "IHH" * len(result.nodes), *values))
+        return "".join(records)
+
+
+# Generator that reads a file of the binary span format and yields the
+# parses of every sentence as list of (probability, list of (label, start,
+# end)) pairs (an empty list for a sentence without a parse).
+def read_spans(input_file):
+    magic, version = _HEADER.unpack(input_file.read(_HEADER.size))
+    if magic != SPAN_MAGIC or version != SPAN_VERSION:
+        raise ValueError("Not a span file of version {0}".format(SPAN_VERSION))
+
+    labels = {}
+    parses = []
+    while True:
+        record_type = input_file.read(1)
+        if not record_type:
+            return
+        record_type = ord(record_type)
+
+        if record_type == LABEL_RECORD:
+            label_id, length = struct.unpack("<IH", input_file.read(_LABEL.size - 1))
+            labels[label_id] = input_file.read(length)
+        elif record_type == PARSE_RECORD:
+            probability, count = struct.unpack("<dI", input_file.read(_PARSE.size - 1))
+            values = struct.unpack("<" + "IHH" * count, input_file.read(_NODE.size * count))
+            spans = [(labels[values[index]], values[index+1], values[index+2]) for index in range(0, len(values), 3)]
+            parses.append((probability, spans))
+        elif record_type == END_RECORD:
+            yield parses
+            parses = []
+        else:
+            raise ValueError("Unknown record type {0}".format(record_type))
+
+
+#####################################################################
+#                         Create Writer                             #
+#####################################################################
+
+# All output formats by name:
+FORMATS = {
+    "tree": TreeWriter,
+    "penn": PennWriter,
+    "jsonl": JsonLinesWriter,
+    "spans": SpanWriter,
+}
+
+
+# Returns the writer of a format for an (already opened) output file:
+def create_writer(output_format, output_file, buffer_size=1000):
+    return FORMATS[output_format](output_file, buffer_size)
+
+
+# Returns a result as ParseResult (e.g. a parser without lazy_results returns
+# pairs of tree and probability):
+def parse_result(result):
+    if isinstance(result, ParseResult):
+        return result
+    return from_tree(result[0], result[1])
+
+
+#####################################################################
+#                           Main Script                             #
+#####################################################################
+
+# Writes a few results with every writer, among them sentences in Latin-1
+# and in UTF-8, and checks that the JSON lines and the span file can be read
+# back.
+if __name__ == "__main__":
+    import StringIO
+    import nltk
+
+    label = nltk.grammar.Nonterminal
+    nodes = [(label("S"), 0, 2, 2), (label("NE"), 0, 1, 0), (label("VVFIN"), 1, 2, 0)]
+    results = [ParseResult(nodes, ["Ak\xe9", "l\xe4uft"], 0.25), None,
+               ParseResult(nodes, ["Ak\xc3\xa9", "l\xc3\xa4uft"], 0.25),
+               (nltk.Tree(label("NE"), ["Ad\xe8chois"]), 0.5)]
+    expected_trees = [u"(S (NE Ak\xe9) (VVFIN l\xe4uft))", None, u"(S (NE Ak\xe9) (VVFIN l\xe4uft))",
+                      u"(NE Ad\xe8chois)"]
+
+    failures = 0
+    outputs = {}
+    for output_format in sorted(FORMATS):
+        output_file = StringIO.StringIO()
+        writer = create_writer(output_format, output_file)
+        for result in results:
+            writer.write(result)
+        writer.write_k_best(results[:1])
+        writer.close()
+        outputs[output_format] = output_file.getvalue()
+        print "{0}: {1} bytes".format(output_format, len(outputs[output_format]))
+
+    trees = [json.loads(line).get("tree") for line in outputs["jsonl"].splitlines()]
+    if trees[:4] != expected_trees:
+        print "WRONG JSON TREES: {0!r}".format(trees)
+        failures += 1
+
+    spans = list(read_spans(StringIO.StringIO(outputs["spans"])))
+    if len(spans) != 5 or spans[0][0][1] != [("S", 0, 2), ("NE", 0, 1), ("VVFIN", 1, 2)] or spans[1]:
+        print "WRONG SPANS: {0!r}".format(spans)
+        failures += 1
+
+    print "{0} failed checks".format(failures)
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,275 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                     Fast PCFG Text Loader                       ##
+#####################################################################
+
+
+#####################################################################
+# File:                           PCFGLoader.py                     #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import re
+import sys
+import time
+import nltk.grammar
+
+# The same regular expressions NLTK uses for reading PCFGs:
+_ARROW_RE = re.compile(r'\s* -> \s*', re.VERBOSE)
+_PROBABILITY_RE = re.compile(r'( \[ [\d\.]+ \] ) \s*', re.VERBOSE)
+_TERMINAL_RE = re.compile(r'( "[^"]+" | \'[^\']+\' ) \s*', re.VERBOSE)
+_DISJUNCTION_RE = re.compile(r'\| \s*', re.VERBOSE)
+_NONTERM_RE = re.compile(r'( [\w/][\w/^<>-]* ) \s*', re.VERBOSE)
+
+# Whole tokens for the fast path (a line that is already split at whitespace):
+_NONTERM_TOKEN_RE = re.compile(r'[\w/][\w/^<>-]*$')
+_PROBABILITY_TOKEN_RE = re.compile(r'\[[\d\.]+\]$')
+
+# Acceptable margin of error for the probability sum of a lhs (same as NLTK):
+EPSILON = 0.01
+
+
+# Streaming loader for grammars in the format "A -> B C [p]" (and "A -> 'a' [p]")
+# that preprocess_bitpar_grammar.py and NLTK write. It reads the grammar into
+# plain (lhs, rhs, probability) triples instead of WeightedProduction objects.
+# Lines in the simple one-rule-per-line format are split at whitespace, every
+# other line (disjunctions, unusual spacing, ...) is read exactly the way
+# NLTK reads it, so the result is the same rule for rule.
+class PCFGLoader(object):
+
+    def __init__(self):
+        # Every nonterminal object is only created once:
+        self.nonterminals = {}
+
+        # Statistics of the last call to read:
+        self.rules_loaded = 0
+        self.seconds = 0.0
+
+
+#####################################################################
+#                              Read                                 #
+#####################################################################
+
+    # Reads a grammar file and returns a pair of the start symbol and the
+    # list of (lhs, rhs, probability) triples. If check_sums is set, the
+    # probabilities of every lhs have to sum to 1 (like NLTK demands).
+    def read(self, grammar_path, check_sums=True):
+        start_time = time.time()
+
+        start = None
+        rules = []
+        continue_line = ''
+
+        grammar_file = open(grammar_path, 'r')
+        for linenum, line in enumerate(grammar_file):
+            line = continue_line + line.strip()
+            if line.startswith('#') or line == '':
+                continue
+            if line.endswith('\\'):
+                continue_line = line[:-1].rstrip() + ' '
+                continue
+            continue_line = ''
+
+            try:
+                if line[0] == '%':
+                    directive, args = line[1:].split(None, 1)
+                    if directive != 'start':
+                        raise ValueError('Bad directive')
+                    start, pos = self.parse_nonterminal(args, 0)
+                    if pos != len(args):
+                        raise ValueError('Bad argument to start directive')
+                else:
+                    rule = self.parse_simple_line(line)
+                    if rule is not None:
+                        rules.append(rule)
+                    else:
+                        rules.extend(self.parse_line(line))
+            except ValueError, e:
+                raise ValueError('Unable to parse line %s: %s\n%s' % (linenum+1, line, e))
+        grammar_file.close()
+
+        if not rules:
+            raise ValueError('No productions found!')
+        if not start:
+            start = rules[0][0]
+
+        if check_sums:
+            self.check_probabilities(rules)
+
+        self.rules_loaded = len(rules)
+        self.seconds = time.time() - start_time
+
+        return (start, rules)
+
+    # Number of rules the last call to read loaded per second:
+    def rules_per_second(self):
+        if self.seconds <= 0:
+            return 0.0
+        return self.rules_loaded / self.seconds
+
+
+#####################################################################
+#                           Parse Lines                             #
+#####################################################################
+
+    # Fast path for a line that contains exactly one rule with the tokens
+    # separated by whitespace. Returns None if the line looks different.
+    def parse_simple_line(self, line):
+        tokens = line.split()
+        if len(tokens) < 4 or tokens[1] != '->' or not _PROBABILITY_TOKEN_RE.match(tokens[-1]):
+            return None
+        if not _NONTERM_TOKEN_RE.match(tokens[0]):
+            return None
+
+        rhs = []
+        for token in tokens[2:-1]:
+            if _NONTERM_TOKEN_RE.match(token):
+                rhs.append(self.nonterminal(token))
+            elif len(token) > 2 and token[0] in '\'"' and token[-1] == token[0] and token[0] not in token[1:-1]:
+                rhs.append(token[1:-1])
+            else:
+                return None
+
+        prob = float(tokens[-1][1:-1])
+        if prob > 1.0:
+            raise ValueError('Production probability %f, should not be greater than 1.0' % (prob,))
+
+        return (self.nonterminal(tokens[0]), tuple(rhs), prob)
+
+    # General case: reads a line the same way NLTK's parse_production does and
+    # returns a list of rules (one for every disjunct).
+    def parse_line(self, line):
+        lhs, pos = self.parse_nonterminal(line, 0)
+
+        # Skip over the arrow.
+        match = _ARROW_RE.match(line, pos)
+        if not match:
+            raise ValueError('Expected an arrow')
+        pos = match.end()
+
+        probabilities = [0.0]
+        rhsides = [[]]
+        while pos < len(line):
+            match = _PROBABILITY_RE.match(line, pos)
+            if match:
+                pos = match.end()
+                probabilities[-1] = float(match.group(1)[1:-1])
+                if probabilities[-1] > 1.0:
+                    raise ValueError('Production probability %f, should not be greater than 1.0' % (probabilities[-1],))
+
+            elif line[pos] in '\'"':
+                match = _TERMINAL_RE.match(line, pos)
+                if not match:
+                    raise ValueError('Unterminated string')
+                rhsides[-1].append(match.group(1)[1:-1])
+                pos = match.end()
+
+            elif line[pos] == '|':
+                match = _DISJUNCTION_RE.match(line, pos)
+                probabilities.append(0.0)
+                rhsides.append([])
+                pos = match.end()
+
+            else:
+                nonterminal, pos = self.parse_nonterminal(line, pos)
+                rhsides[-1].append(nonterminal)
+
+        return [(lhs, tuple(rhs), prob) for rhs, prob in zip(rhsides, probabilities)]
+
+    # Reads a nonterminal at the given position, returns it and the new position:
+    def parse_nonterminal(self, string, pos):
+        match = _NONTERM_RE.match(string, pos)
+        if not match:
+            raise ValueError('Expected a nonterminal, found: ' + string[pos:])
+        return (self.nonterminal(match.group(1)), match.end())
+
+    # Returns the (shared) NLTK nonterminal for a symbol:
+    def nonterminal(self, symbol):
+        nonterminal = self.nonterminals.get(symbol)
+        if nonterminal is None:
+            nonterminal = nltk.grammar.Nonterminal(symbol)
+            self.nonterminals[symbol] = nonterminal
+        return nonterminal
+
+
+#####################################################################
+#                       Check Probabilities                         #
+#####################################################################
+
+    # Raises a ValueError if the probabilities of a lhs do not sum to 1:
+    def check_probabilities(self, rules):
+        sums = {}
+        for lhs, rhs, prob in rules:
+            sums[lhs] = sums.get(lhs, 0) + prob
+        for lhs, total in sums.iteritems():
+            if not ((1 - EPSILON) < total < (1 + EPSILON)):
+                raise ValueError("Productions for %r do not sum to 1" % lhs)
+
+
+#####################################################################
+#                          Helper Functions                         #
+#####################################################################
+
+# Returns True if all rules are either binary rules with two nonterminals or
+# lexical rules (the same check as is_in_cnf in main.py, but on triples).
+# If allow_unary is set, unit rules (A -> B) are accepted as well.
+def rules_in_cnf(rules, allow_unary=False):
+    for lhs, rhs, prob in rules:
+        if len(rhs) == 1 and (allow_unary or nltk.grammar.is_terminal(rhs[0])):
+            continue
+        if len(rhs) == 2 and nltk.grammar.is_nonterminal(rhs[0]) and nltk.grammar.is_nonterminal(rhs[1]):
+            continue
+        return False
+    return True
+
+
+# Creates an NLTK WeightedGrammar from the rules (necessary for CNF_Conversion):
+def to_weighted_grammar(start, rules):
+    productions = [nltk.grammar.WeightedProduction(lhs, rhs, prob=prob) for lhs, rhs, prob in rules]
+    return nltk.grammar.WeightedGrammar(start, productions)
+
+
+# Loads a grammar with both loaders and returns a list of all differences
+# (an empty list means that both loaders read exactly the same rules).
+def compare_with_nltk(grammar_path):
+    start, rules = PCFGLoader().read(grammar_path)
+    grammar = nltk.data.load("file:{0}".format(grammar_path), 'pcfg')
+    nltk_rules = [(prod.lhs(), prod.rhs(), prod.prob()) for prod in grammar.productions()]
+
+    differences = []
+    if start != grammar.start():
+        differences.append("start symbol: {0} != {1}".format(start, grammar.start()))
+    if len(rules) != len(nltk_rules):
+        differences.append("number of rules: {0} != {1}".format(len(rules), len(nltk_rules)))
+    for index, (rule, nltk_rule) in enumerate(zip(rules, nltk_rules)):
+        if rule != nltk_rule:
+            differences.append("rule {0}: {1} != {2}".format(index + 1, rule, nltk_rule))
+    return differences
+
+
+#####################################################################
+#                           Main Script                             #
+#####################################################################
+
+# Command line arguments:
+# [0]: PCFGLoader.py
+# [1]: grammar file
+# [2]: optional --compare (also load the grammar with NLTK and compare)
+if __name__ == "__main__":
+    if len(sys.argv) in (2, 3) and sys.argv[2:] in ([], ["--compare"]):
+        loader = PCFGLoader()
+        start, rules = loader.read(sys.argv[1])
+        print "Loaded {0} rules in {1:.2f} s ({2:.0f} rules/s)".format(loader.rules_loaded, loader.seconds, loader.rules_per_second())
+
+        if len(sys.argv) == 3:
+            differences = compare_with_nltk(sys.argv[1])
+            if differences:
+                print "Loaders differ:"
+                for difference in differences:
+                    print difference
+            else:
+                print "Both loaders read the same rules."
+    else:
+        print "USAGE: python PCFGLoader.py grammar_file [--compare] \n"
+        print "grammar_file = A probabilistic context free grammar in NLTK format. \n"
+        print "--compare = Also read the grammar with NLTK and compare both rule lists. \n"
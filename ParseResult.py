@@ -0,0 +1,137 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                        Lazy Parse Result                        ##
+#####################################################################
+
+
+#####################################################################
+# File:                           ParseResult.py                    #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+from nltk.tree import Tree
+
+
+# Result of a parse that only builds its nltk.Tree when it is asked for. The
+# derivation is kept as a flat list of nodes in preorder, every node as
+# (label, start, end, number of children), where a node without children is
+# the preterminal of the word at position start (see
+# ProbCKYParser.extract_derivation). The bracket string and the span list are
+# built directly from this list, so callers that only need those (or only the
+# probability) never allocate a tree.
+#
+# Like the (tree, probability) pairs of the parser, result[0] is the tree and
+# result[1] the probability, so a ParseResult can be used wherever such a pair
+# is expected.
+class ParseResult(object):
+
+    def __init__(self, nodes, words, probability):
+        self.nodes = nodes
+        self.words = tuple(words)
+        self.probability = probability
+        # The tree is built on the first call of tree():
+        self.built_tree = None
+
+    # Returns the nltk.Tree of the derivation:
+    def tree(self):
+        if self.built_tree is None:
+            self.built_tree = build_tree(self.nodes, self.words)
+        return self.built_tree
+
+    # Returns the tree as bracket string on a single line, e.g.
+    # (S (NP John) (VP (V saw) (NP Mary))). It is the same string NLTK prints
+    # for the tree if it fits on one line.
+    def bracket_string(self):
+        words = self.words
+        parts = []
+        # Number of children that are still missing for every open node:
+        remaining = []
+
+        for label, start, end, arity in self.nodes:
+            if arity > 0:
+                parts.append("({0!r} ".format(label))
+                remaining.append(arity)
+                continue
+
+            parts.append("({0!r} {1})".format(label, words[start]))
+            # Close all nodes whose last child this was:
+            while remaining:
+                remaining[-1] -= 1
+                if remaining[-1] > 0:
+                    parts.append(" ")
+                    break
+                remaining.pop()
+                parts.append(")")
+
+        return "".join(parts)
+
+    # Returns the list of all nodes as (label, start, end) in preorder. label
+    # is the name of the nonterminal, end is the position after the last word.
+    def spans(self):
+        return [(str(label), start, end) for label, start, end, arity in self.nodes]
+
+    # The built tree is not pickled (e.g. for the result cache or when the
+    # result is sent back from a worker process):
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["built_tree"] = None
+        return state
+
+    def __getitem__(self, index):
+        return (self.tree(), self.probability)[index]
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        return iter((self.tree(), self.probability))
+
+
+#####################################################################
+#                           Build Tree                              #
+#####################################################################
+
+# Builds the nltk.Tree of a list of nodes in preorder (see ParseResult)
+# without recursion. The nodes are handled last to first, so the subtrees of
+# all children of a node are already on the stack, the first child on top.
+def build_tree(nodes, words):
+    stack = []
+    for label, start, end, arity in reversed(nodes):
+        if arity == 0:
+            stack.append(Tree(label, [words[start]]))
+        else:
+            children = [stack.pop() for child in range(arity)]
+            stack.append(Tree(label, children))
+    return stack[0]
+
+
+# Returns the ParseResult of an nltk.Tree whose leaves are the words (e.g.
+# of a parser without lazy_results). The start of every node is the
+# number of words before it in preorder, the end is the end of its last
+# child, which is known once the nodes are handled last to first.
+def from_tree(tree, probability):
+    order = []
+    words = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if len(node) == 1 and not isinstance(node[0], Tree):
+            order.append((node.node, len(words), 0))
+            words.append(node[0])
+        else:
+            order.append((node.node, len(words), len(node)))
+            # The first child is handled next:
+            stack.extend(reversed(node))
+
+    nodes = [None] * len(order)
+    ends = []
+    for index in range(len(order)-1, -1, -1):
+        label, start, arity = order[index]
+        if arity == 0:
+            end = start + 1
+        else:
+            end = [ends.pop() for child in range(arity)][-1]
+        nodes[index] = (label, start, end, arity)
+        ends.append(end)
+
+    return ParseResult(nodes, words, probability)
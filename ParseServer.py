@@ -0,0 +1,441 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                       Local Parse Server                        ##
+#####################################################################
+
+
+#####################################################################
+# File:                           ParseServer.py                    #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+# Long-running parse server: the grammar is read and converted once (like in
+# main.py) and sentences are parsed on demand over HTTP on localhost, so
+# every request saves the NLTK import, the grammar loading and the CNF
+# conversion. Every HTTP connection is handled by its own thread, which puts
+# the sentences of the request into a bounded queue and waits for them.
+# Dispatcher threads take the sentences from the queue and parse them with a
+# pool of worker processes, each with its own ProbCKYParser (see
+# BatchParsing.py). If the queue is full, the request is rejected right away
+# (HTTP 503) instead of waiting without bound, a request with more sentences
+# than the queue can hold gets HTTP 413. A request that is not parsed within
+# the timeout gets HTTP 504, any other error of a request (e.g. of a worker)
+# HTTP 500 with the error in the body.
+#
+# Requests:
+#   POST /parse  body: one sentence per line (words separated by spaces)
+#                answer: {"results": [{"tree": ..., "probability": ...}, ...]}
+#                (the tree as bracket string, null if there is no parse)
+#   GET /stats   answer: number of requests and sentences, queue depth and
+#                the latency percentiles of the last requests
+#
+# The same file contains a test client (--client), which sends the sentences
+# of an input file and writes the results like main.py --output-format penn.
+
+import BaseHTTPServer
+import Queue
+import SocketServer
+import argparse
+import collections
+import json
+import signal
+import sys
+import threading
+import time
+import urllib2
+import BatchParsing
+import CNFConversion
+import OutputWriters
+import main
+
+# Number of the last requests whose latency is kept for the percentiles:
+LATENCY_WINDOW = 10000
+
+# Percentiles that are reported:
+PERCENTILES = (50, 90, 99)
+
+
+#####################################################################
+#                            Parse Queue                            #
+#####################################################################
+
+# Raised by ParseQueue.parse if a sentence of the request could not be
+# parsed (e.g. because its worker failed):
+class ParseError(Exception):
+    pass
+
+
+# Raised by ParseQueue.parse if the sentences of a request were not parsed
+# within the timeout:
+class ParseTimeout(ParseError):
+    pass
+
+
+# Bounded queue of sentences in front of the worker pool. Takes the parser
+# (whose grammar is sent to every worker once), the number of worker
+# processes, the most sentences that may wait at a time and the most seconds
+# a request waits for its results.
+class ParseQueue(object):
+
+    def __init__(self, parser, workers=1, max_queue=100, timeout=600):
+        self.pool = BatchParsing.create_pool(parser, workers)
+        self.jobs = Queue.Queue(max_queue)
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        # Statistics (changed by several threads, so guarded by the lock):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.sentences = 0
+        self.rejected = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.in_progress = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.start_time = time.time()
+
+        # One dispatcher per worker, so that every worker always has a sentence:
+        self.dispatchers = []
+        for number in range(workers):
+            dispatcher = threading.Thread(target=self.dispatch)
+            dispatcher.daemon = True
+            dispatcher.start()
+            self.dispatchers.append(dispatcher)
+
+    # Parses a list of sentences and returns their results in the same order,
+    # or None if the queue has no room for all of them. Raises ParseTimeout if
+    # the results are not there after the timeout and ParseError if one of
+    # the sentences failed. Called by the threads of the HTTP server.
+    def parse(self, sentences):
+        start_time = time.time()
+        results = [None] * len(sentences)
+        done = threading.Event()
+        # Number of sentences that are not parsed yet:
+        remaining = [len(sentences)]
+
+        # All sentences of a request are queued or none of them:
+        with self.lock:
+            if self.jobs.qsize() + len(sentences) > self.max_queue:
+                self.rejected += 1
+                return None
+            for index in range(len(sentences)):
+                self.jobs.put_nowait((sentences[index], index, results, remaining, done))
+
+        if sentences:
+            # The timer ends the wait after the timeout (in Python 2,
+            # Event.wait with a timeout polls, which would delay every answer):
+            timer = threading.Timer(self.timeout, done.set)
+            timer.daemon = True
+            timer.start()
+            done.wait()
+            timer.cancel()
+
+        with self.lock:
+            if remaining[0] > 0:
+                self.timed_out += 1
+                raise ParseTimeout("No results after {0:g} s".format(self.timeout))
+            errors = [result for result in results if isinstance(result, ParseError)]
+            if errors:
+                self.failed += 1
+                raise errors[0]
+            self.requests += 1
+            self.sentences += len(sentences)
+            self.latencies.append(time.time() - start_time)
+        return results
+
+    # Dispatcher thread: hands the queued sentences to the worker pool one
+    # at a time and reports every result to its request. If a sentence fails,
+    # its result is a ParseError and the dispatcher goes on with the next one.
+    def dispatch(self):
+        while True:
+            words, index, results, remaining, done = self.jobs.get()
+            with self.lock:
+                self.in_progress += 1
+            try:
+                result = self.pool.apply(BatchParsing.parse_job, ((index, words),))[1]
+            except Exception as error:
+                result = ParseError("Sentence {0} failed: {1!r}".format(index, error))
+            with self.lock:
+                results[index] = result
+                self.in_progress -= 1
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    done.set()
+
+    # Returns the statistics as dictionary (see print_stats):
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                "requests": self.requests,
+                "sentences": self.sentences,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "queue_depth": self.jobs.qsize(),
+                "in_progress": self.in_progress,
+                "max_queue": self.max_queue,
+                "uptime_seconds": time.time() - self.start_time,
+            }
+        for percentile in PERCENTILES:
+            stats["latency_p{0}_ms".format(percentile)] = 1000 * percentile_of(latencies, percentile)
+        return stats
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+# Returns the given percentile of a sorted list (0 for an empty list):
+def percentile_of(values, percentile):
+    if not values:
+        return 0.0
+    index = int(round(percentile / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+# Prints the statistics of a ParseQueue (or of a server, see --client):
+def print_stats(stats):
+    print ("SERVER STATISTICS: {0} requests, {1} sentences, {2} rejected, {3} failed, {4} timed out, "
+           "queue depth {5}/{6}, {7} in progress").format(
+        stats["requests"], stats["sentences"], stats["rejected"], stats["failed"], stats["timed_out"],
+        stats["queue_depth"], stats["max_queue"], stats["in_progress"])
+    print "Latency: " + ", ".join("p{0} {1:.1f} ms".format(percentile, stats["latency_p{0}_ms".format(percentile)])
+                                  for percentile in PERCENTILES)
+
+
+#####################################################################
+#                           HTTP Server                             #
+#####################################################################
+
+# Handles one HTTP request of the parse server:
+class ParseRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # An error while parsing or while writing the results is answered with
+    # HTTP 500 instead of dropping the connection:
+    def do_POST(self):
+        try:
+            self.handle_parse()
+        except Exception as error:
+            self.send_json(500, {"error": "Parsing failed: {0!r}".format(error)})
+
+    def handle_parse(self):
+        if self.path != "/parse":
+            self.send_json(404, {"error": "Unknown path {0}".format(self.path)})
+            return
+
+        length = int(self.headers.getheader("Content-Length") or 0)
+        sentences = [line.split() for line in self.rfile.read(length).splitlines() if line.strip()]
+
+        # A request that does not fit into the empty queue could never be parsed:
+        if len(sentences) > self.server.parse_queue.max_queue:
+            self.send_json(413, {"error": "More sentences than the parse queue can hold"})
+            return
+
+        try:
+            results = self.server.parse_queue.parse(sentences)
+        except ParseTimeout as error:
+            self.send_json(504, {"error": str(error)})
+            return
+        except ParseError as error:
+            self.send_json(500, {"error": str(error)})
+            return
+        if results is None:
+            self.send_json(503, {"error": "Parse queue is full"})
+            return
+        self.send_json(200, {"results": [OutputWriters.json_parse(result) for result in results]})
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.send_json(404, {"error": "Unknown path {0}".format(self.path)})
+            return
+        self.send_json(200, self.server.parse_queue.stats())
+
+    # Sends an answer with a JSON body:
+    def send_json(self, status, content):
+        body = json.dumps(content)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Requests are not logged one by one:
+    def log_message(self, format, *args):
+        pass
+
+
+# HTTP server with one thread per connection:
+class ParseServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, parse_queue):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ParseRequestHandler)
+        self.parse_queue = parse_queue
+
+
+#####################################################################
+#                           Test Client                             #
+#####################################################################
+
+# Sends the sentences of the input file to the server, batch_size sentences
+# per request from the given number of threads at once, and writes the
+# results into the output file (bracket string, tab, probability). Requests
+# that are rejected because the queue is full are sent again. If a request
+# fails otherwise, the error is printed and its sentences are written as
+# sentences without a parse. The trees are written in the encoding of their
+# input line (see OutputWriters.decode_text). Returns the statistics of the
+# server afterwards.
+def run_client(url, input_path, output_path, batch_size=1, concurrency=1):
+    input_file = open(input_path, 'r')
+    lines = [line for line in input_file if line.strip()]
+    input_file.close()
+
+    batches = [lines[start:start+batch_size] for start in range(0, len(lines), batch_size)]
+    results = [None] * len(batches)
+    next_batch = [0]
+    lock = threading.Lock()
+
+    def send_batches():
+        while True:
+            with lock:
+                number = next_batch[0]
+                next_batch[0] += 1
+            if number >= len(batches):
+                return
+            try:
+                results[number] = post_sentences(url, batches[number])
+            except Exception as error:
+                with lock:
+                    print "ERROR: Request with sentences {0} to {1} failed: {2}".format(
+                        number * batch_size + 1, number * batch_size + len(batches[number]), error)
+
+    threads = [threading.Thread(target=send_batches) for thread in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    output_file = open(output_path, 'w')
+    failed = 0
+    for number in range(len(batches)):
+        batch_results = results[number]
+        if batch_results is None:
+            failed += len(batches[number])
+            batch_results = [{"tree": None}] * len(batches[number])
+        for line, result in zip(batches[number], batch_results):
+            if result["tree"] is None:
+                output_file.write("(())\t0.0\n")
+            else:
+                tree = result["tree"].encode(OutputWriters.text_encoding(line))
+                output_file.write("{0}\t{1!r}\n".format(tree, result["probability"]))
+    output_file.close()
+    if failed:
+        print "WARNING: {0} sentences of failed requests were written without a parse \n".format(failed)
+
+    return json.load(urllib2.urlopen(url + "/stats"))
+
+
+# Sends one request with the given sentences and returns their results. A
+# full queue is retried after a short pause.
+def post_sentences(url, sentences):
+    while True:
+        try:
+            answer = urllib2.urlopen(url + "/parse", "\n".join(line.rstrip("\r\n") for line in sentences))
+            return json.load(answer)["results"]
+        except urllib2.HTTPError as error:
+            if error.code != 503:
+                raise
+            time.sleep(0.05)
+
+
+#####################################################################
+#                       Print Instructions                          #
+#####################################################################
+
+def print_instructions():
+    print "USAGE FOR THE SERVER: "
+    print "python ParseServer.py [--port P] [--workers N] [--max-queue Q] [--timeout T] [--no-cache]"
+    print "                      [--unary-closure] [--separation S] [--binarization D] [--share-intermediates]"
+    print "                      [--lexicon L] pcfg \n"
+    print "USAGE FOR THE TEST CLIENT: "
+    print "python ParseServer.py --client [--port P] [--batch-size B] [--concurrency C] input_file output_file \n"
+    print "pcfg = The grammar, read and converted like in main.py (see there for the grammar options). \n"
+    print "--port P = Port on localhost (default: 8642). \n"
+    print "--workers N = Number of worker processes that parse (default: 1). \n"
+    print "--max-queue Q = Most sentences that may wait for a worker (default: 100). Requests that do not fit "
+    print "are answered with HTTP 503. \n"
+    print "--timeout T = Most seconds a request waits for its results (default: 600), slower requests are answered "
+    print "with HTTP 504. \n"
+    print "--client = Send the sentences of input_file (one per line) to a running server, write the results into "
+    print "output_file (tree in brackets, a tab and the probability) and print the statistics of the server. \n"
+    print "--batch-size B = Sentences per request of the client (default: 1). \n"
+    print "--concurrency C = Number of requests the client sends at the same time (default: 1). \n"
+
+
+#####################################################################
+#                           Main Script                             #
+#####################################################################
+
+# Options:
+# --port: port on localhost
+# --workers: number of worker processes
+# --max-queue: size of the parse queue
+# --timeout: most seconds a request waits for its results
+# --no-cache, --unary-closure, --separation, --binarization,
+# --share-intermediates, --lexicon: grammar options as in main.py
+# --client: run the test client instead of the server
+# --batch-size, --concurrency: requests of the test client
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(add_help=False)
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--port", type=int, default=8642)
+    arg_parser.add_argument("--workers", type=int, default=1)
+    arg_parser.add_argument("--max-queue", type=int, default=100)
+    arg_parser.add_argument("--timeout", type=float, default=600)
+    arg_parser.add_argument("--no-cache", dest="cache", action="store_false")
+    arg_parser.add_argument("--unary-closure", action="store_true")
+    arg_parser.add_argument("--separation", choices=CNFConversion.CNF_Conversion.SEPARATIONS, default="cartesian")
+    arg_parser.add_argument("--binarization", choices=CNFConversion.CNF_Conversion.BINARIZATIONS, default="right")
+    arg_parser.add_argument("--share-intermediates", action="store_true")
+    arg_parser.add_argument("--lexicon")
+    arg_parser.add_argument("--client", action="store_true")
+    arg_parser.add_argument("--batch-size", type=int, default=1)
+    arg_parser.add_argument("--concurrency", type=int, default=1)
+    arguments, unknown = arg_parser.parse_known_args()
+
+    # Like in main.py, unit rules above the PoS tags of the lexicon stay:
+    if arguments.lexicon is not None:
+        arguments.unary_closure = True
+
+    if arguments.client and len(arguments.files) == 2 and not unknown:
+        url = "http://127.0.0.1:{0}".format(arguments.port)
+        print_stats(run_client(url, arguments.files[0], arguments.files[1], arguments.batch_size,
+                               arguments.concurrency))
+
+    elif not arguments.client and len(arguments.files) == 1 and not unknown:
+        parser = main.create_parser(arguments.files[0], arguments.cache, arguments.unary_closure,
+                                    arguments.separation, arguments.binarization,
+                                    arguments.share_intermediates, lexicon_path=arguments.lexicon)
+        parse_queue = ParseQueue(parser, arguments.workers, arguments.max_queue, arguments.timeout)
+        server = ParseServer(("127.0.0.1", arguments.port), parse_queue)
+        print "Parse server listening on http://127.0.0.1:{0} (Ctrl+C to stop)".format(arguments.port)
+        sys.stdout.flush()
+
+        # SIGTERM stops the server like Ctrl+C (the workers already exist and
+        # keep the default handler, so terminating the pool still works):
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            print_stats(parse_queue.stats())
+            parse_queue.close()
+
+    else:
+        print_instructions()
@@ -0,0 +1,90 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                       Parse Statistics                          ##
+#####################################################################
+
+
+#####################################################################
+# File:                           ParseStats.py                     #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+# Sentences are grouped by length in steps of this many words:
+LENGTH_STEP = 10
+
+
+# Counters and timers of the python chart engine (see ProbCKYParser with
+# stats=True). The parser creates one object per parsed sentence, add()
+# sums them up for a batch. The counters separate the two causes of a slow
+# parse: the number of split points grows with the sentence length, the
+# number of candidate edges per split point with the fan-out of the grammar.
+class ParseStats(object):
+
+    # Names of all counters and timers (in the order they are printed):
+    COUNTERS = ("sentences", "words", "cells_visited", "cells_skipped", "split_points", "candidate_edges",
+                "improving_edges", "chart_entries", "pruned_entries", "tree_nodes")
+    TIMERS = ("lexical_seconds", "chart_seconds", "tree_seconds")
+
+    def __init__(self):
+        for name in self.COUNTERS + self.TIMERS:
+            setattr(self, name, 0)
+        # Most entries in a single cell:
+        self.max_cell_entries = 0
+
+        # Sentence length group -> [sentences, chart fill time, split points,
+        # candidate edges] (see LENGTH_STEP):
+        self.by_length = {}
+
+    # Adds the counters of another ParseStats object (e.g. of one sentence):
+    def add(self, other):
+        for name in self.COUNTERS + self.TIMERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.max_cell_entries = max(self.max_cell_entries, other.max_cell_entries)
+
+        for group, values in other.by_length.iteritems():
+            totals = self.by_length.setdefault(group, [0, 0.0, 0, 0])
+            for index in range(len(values)):
+                totals[index] += values[index]
+
+    # Records a finished sentence under its length group:
+    def finish_sentence(self):
+        group = self.words // LENGTH_STEP
+        self.by_length[group] = [1, self.lexical_seconds + self.chart_seconds, self.split_points,
+                                 self.candidate_edges]
+
+
+#####################################################################
+#                             Printing                              #
+#####################################################################
+
+    # Prints the totals, the averages and a table per sentence length:
+    def print_stats(self):
+        sentences = self.sentences
+        print "PARSE STATISTICS: {0} parsed sentences, {1} words".format(sentences, self.words)
+        if sentences == 0:
+            return
+
+        print "Time: {0:.3f} s lexical fill, {1:.3f} s chart fill, {2:.3f} s tree extraction".format(
+            self.lexical_seconds, self.chart_seconds, self.tree_seconds)
+        print "Cells: {0} visited, {1} skipped as infeasible, {2} entries at the end ({3:.1f} per visited cell, at most {4})".format(
+            self.cells_visited, self.cells_skipped, self.chart_entries, ratio(self.chart_entries, self.cells_visited),
+            self.max_cell_entries)
+        print "Edges: {0} split points, {1} candidate edges ({2:.1f} per split point), {3} improved a cell ({4:.1f}%)".format(
+            self.split_points, self.candidate_edges, ratio(self.candidate_edges, self.split_points),
+            self.improving_edges, 100.0 * ratio(self.improving_edges, self.candidate_edges))
+        print "Other: {0} pruned entries, {1} tree nodes".format(self.pruned_entries, self.tree_nodes)
+
+        # Per length group: the split points per sentence show the effect of
+        # the length, the edges per split point the fan-out of the grammar.
+        print "{0:>10} {1:>10} {2:>14} {3:>16} {4:>16}".format("words", "sentences", "fill s/sent",
+                                                             "splits/sent", "edges/split")
+        for group in sorted(self.by_length):
+            count, seconds, split_points, edges = self.by_length[group]
+            length_range = "{0}-{1}".format(group * LENGTH_STEP, (group + 1) * LENGTH_STEP - 1)
+            print "{0:>10} {1:>10} {2:>14.4f} {3:>16.1f} {4:>16.1f}".format(
+                length_range, count, ratio(seconds, count), ratio(split_points, count), ratio(edges, split_points))
+
+
+# Quotient that is 0 for an empty denominator:
+def ratio(numerator, denominator):
+    return numerator / float(denominator) if denominator else 0.0
@@ -0,0 +1,143 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                   Sentence Result Cache                         ##
+#####################################################################
+
+
+#####################################################################
+# File:                           ResultCache.py                    #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import collections
+import cPickle
+import os
+
+# Has to be increased whenever the format of the cache file changes:
+CACHE_VERSION = 1
+
+
+# Keeps the parse results of sentences, so that a sentence that was already
+# parsed with the same grammar does not have to be parsed again. The key of a
+# result is the grammar fingerprint (see ProbCKYParser.fingerprint) together
+# with the tuple of the words, so one cache (and one cache file) can be used
+# for several grammars. The least recently used results are evicted when the
+# cache holds more than max_entries results or more than max_words words in
+# all its sentences (None means no limit). If path is given, the results are
+# loaded from this file and save() writes them back.
+class ResultCache(object):
+
+    def __init__(self, max_entries=10000, max_words=None, path=None):
+        self.max_entries = max_entries
+        self.max_words = max_words
+        self.path = path
+
+        # Maps (fingerprint, words) to the cached value, least recently used first:
+        self.entries = collections.OrderedDict()
+        self.words = 0
+
+        # Statistics:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path is not None:
+            self.load()
+
+
+#####################################################################
+#                          Get and Put                              #
+#####################################################################
+
+    # Returns a pair of a flag whether the sentence is in the cache and its
+    # value. A hit makes the sentence the most recently used one.
+    def get(self, fingerprint, words):
+        key = (fingerprint, tuple(words))
+        if key not in self.entries:
+            self.misses += 1
+            return (False, None)
+
+        self.hits += 1
+        value = self.entries.pop(key)
+        self.entries[key] = value
+        return (True, value)
+
+    # Adds the value of a sentence and evicts old entries if necessary:
+    def put(self, fingerprint, words, value):
+        key = (fingerprint, tuple(words))
+        if key in self.entries:
+            del self.entries[key]
+        else:
+            self.words += len(key[1])
+        self.entries[key] = value
+        self.evict()
+
+    # Removes the least recently used entries until both limits are kept:
+    def evict(self):
+        while self.entries and ((self.max_entries is not None and len(self.entries) > self.max_entries) or
+                                (self.max_words is not None and self.words > self.max_words)):
+            key, value = self.entries.popitem(last=False)
+            self.words -= len(key[1])
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+
+#####################################################################
+#                          Load and Save                            #
+#####################################################################
+
+    # Reads the entries of the cache file. A missing, damaged or outdated
+    # file simply gives an empty cache.
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            cache_file = open(self.path, 'rb')
+            version, entries = cPickle.load(cache_file)
+            cache_file.close()
+        except (IOError, EOFError, ValueError, TypeError, cPickle.UnpicklingError):
+            return
+        if version != CACHE_VERSION:
+            return
+
+        for key, value in entries:
+            self.entries[key] = value
+            self.words += len(key[1])
+        self.evict()
+
+    # Writes all entries into the cache file (least recently used first, so
+    # that the order survives). Like GrammarCache.save, the file is written
+    # under a temporary name first. Returns False if it could not be written.
+    def save(self):
+        if self.path is None:
+            return False
+
+        temp_path = "{0}.{1}.tmp".format(self.path, os.getpid())
+        try:
+            cache_file = open(temp_path, 'wb')
+            cPickle.dump((CACHE_VERSION, self.entries.items()), cache_file, cPickle.HIGHEST_PROTOCOL)
+            cache_file.close()
+            if os.name == "nt" and os.path.exists(self.path):
+                # Windows cannot rename onto an existing file:
+                os.remove(self.path)
+            os.rename(temp_path, self.path)
+        except (IOError, OSError):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+        return True
+
+
+#####################################################################
+#                            Statistics                             #
+#####################################################################
+
+    # Prints the number of hits, misses and evictions:
+    def print_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / lookups if lookups else 0.0
+        print "RESULT CACHE: {0} hits, {1} misses ({2:.1f}% hits), {3} evictions, {4} entries".format(
+            self.hits, self.misses, hit_rate, self.evictions, len(self.entries))
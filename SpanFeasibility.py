@@ -0,0 +1,317 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                   Span-Length Feasibility                       ##
+#####################################################################
+
+
+#####################################################################
+# File:                           SpanFeasibility.py                #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import heapq
+
+# Length that stands for "unbounded" (or "impossible" as a minimum):
+INFINITY = float("inf")
+
+
+# Precomputes for every nonterminal of a CompiledGrammar how long its yield
+# can be and how many words can stand left and right of it in a complete
+# parse. A nonterminal A can only be part of a parse of a sentence with n words
+# in the cell that starts at i and spans j words if
+#   min_left[A] <= i <= max_left[A] and min_right[A] <= n-i-j <= max_right[A]
+# e.g. the intermediates of a right binarization (S -> A X1) always have a
+# word to their left, so they are never needed at position 0. The parser uses
+# this to drop entries that cannot be part of a parse of the whole sentence
+# and to skip cells in which no nonterminal fits. All bounds are exact or
+# conservative, so the most probable parse never changes.
+class SpanFeasibility(object):
+
+    def __init__(self, grammar):
+        num_nts = len(grammar.nonterminals)
+        self.num_nts = num_nts
+
+        # All rules as (lhs, children) pairs, lexical rules only as lhs:
+        self.rules = []
+        for left, by_right in grammar.binary.iteritems():
+            for right, rule_list in by_right.iteritems():
+                for lhs, prob in rule_list:
+                    self.rules.append((lhs, (left, right)))
+        for child, rule_list in grammar.unary.iteritems():
+            for lhs, prob in rule_list:
+                self.rules.append((lhs, (child,)))
+
+        self.preterminals = set()
+        for rule_list in grammar.lexical.itervalues():
+            for lhs, prob in rule_list:
+                self.preterminals.add(lhs)
+
+        # With an external lexicon, every nonterminal without rules of its own
+        # may turn out to be a PoS tag (see CompiledGrammar.attach_lexicon):
+        if getattr(grammar, "lexicon", None) is not None:
+            has_rules = set(lhs for lhs, children in self.rules)
+            for nt in range(num_nts):
+                if nt not in has_rules:
+                    self.preterminals.add(nt)
+
+        self.min_yield = self.compute_min_yield()
+        # Only rules whose children can all produce something can be used:
+        self.rules = [(lhs, children) for lhs, children in self.rules
+                      if all(self.min_yield[child] < INFINITY for child in children)]
+        self.max_yield = self.compute_max_yield()
+
+        self.min_left, self.min_right = self.compute_min_context(grammar.start)
+        self.max_left, self.max_right = self.compute_max_context(grammar.start)
+
+        # Sets of the nonterminals that fit a left (or right) context of a
+        # given length and whether a cell fits any nonterminal at all. They
+        # only depend on the lengths, so they are kept for all sentences:
+        self.left_sets = []
+        self.right_sets = []
+        self.cells = {}
+
+
+#####################################################################
+#                           Yield Lengths                           #
+#####################################################################
+
+    # Shortest yield of every nonterminal (INFINITY if it cannot produce
+    # any sentence). The values only decrease, so we repeat until nothing
+    # changes anymore.
+    def compute_min_yield(self):
+        min_yield = [INFINITY] * self.num_nts
+        for nt in self.preterminals:
+            min_yield[nt] = 1
+
+        changed = True
+        while changed:
+            changed = False
+            for lhs, children in self.rules:
+                length = sum(min_yield[child] for child in children)
+                if length < min_yield[lhs]:
+                    min_yield[lhs] = length
+                    changed = True
+
+        return min_yield
+
+    # Longest yield of every nonterminal (INFINITY if unbounded). Recursion
+    # through a binary rule makes the yield unbounded, recursion through unit
+    # rules only does not. The strongly connected components of the rule
+    # graph come children first, so every rule leaving a component already
+    # knows the lengths of its children.
+    def compute_max_yield(self):
+        max_yield = [0] * self.num_nts
+        rules_of = {}
+        for lhs, children in self.rules:
+            rules_of.setdefault(lhs, []).append(children)
+
+        # Every nonterminal is a node, also the ones without rules:
+        edges = dict((nt, []) for nt in range(self.num_nts))
+        for lhs, rule_list in rules_of.iteritems():
+            edges[lhs] = [child for children in rule_list for child in children]
+
+        for component in strongly_connected_components(edges):
+            members = set(component)
+            unbounded = False
+            longest = 0
+
+            for nt in component:
+                if nt in self.preterminals:
+                    longest = max(longest, 1)
+                for children in rules_of.get(nt, ()):
+                    if any(child in members for child in children):
+                        # Unit rules inside the component do not change the length:
+                        if len(children) > 1:
+                            unbounded = True
+                        continue
+                    longest = max(longest, sum(max_yield[child] for child in children))
+
+            for nt in component:
+                max_yield[nt] = INFINITY if unbounded else longest
+
+        return max_yield
+
+
+#####################################################################
+#                          Context Lengths                          #
+#####################################################################
+
+    # Fewest words left and right of every nonterminal in a complete parse
+    # (shortest paths from the start symbol, INFINITY if unreachable). In a
+    # rule A -> B C, B has the words of C on its right and C has the words of
+    # B on its left.
+    def compute_min_context(self, start):
+        contexts = []
+        for side in (0, 1):
+            distance = [INFINITY] * self.num_nts
+            distance[start] = 0
+            agenda = [(0, start)]
+            edges = self.context_edges(side, self.min_yield)
+
+            while agenda:
+                length, nt = heapq.heappop(agenda)
+                if length > distance[nt]:
+                    continue
+                for child, weight in edges.get(nt, ()):
+                    if length + weight < distance[child]:
+                        distance[child] = length + weight
+                        heapq.heappush(agenda, (length + weight, child))
+
+            contexts.append(distance)
+        return contexts
+
+    # Most words left and right of every nonterminal in a complete parse
+    # (longest paths from the start symbol). A cycle that adds words makes the
+    # context unbounded. The components are handled parents first.
+    def compute_max_context(self, start):
+        edges = dict((nt, [child for child, weight in children]) for nt, children in self.context_edges(0, self.max_yield).iteritems())
+        components = strongly_connected_components(edges)
+        components.reverse()
+
+        contexts = []
+        for side in (0, 1):
+            weighted_edges = self.context_edges(side, self.max_yield)
+            longest = [None] * self.num_nts
+            longest[start] = 0
+
+            for component in components:
+                members = set(component)
+
+                # Everything that flows in from the parents:
+                value = None
+                for nt in component:
+                    if longest[nt] is not None:
+                        value = max(value, longest[nt])
+                if value is None:
+                    # Not reachable from the start symbol:
+                    continue
+
+                for nt in component:
+                    for child, weight in weighted_edges.get(nt, ()):
+                        if child in members and weight > 0:
+                            value = INFINITY
+
+                for nt in component:
+                    longest[nt] = value
+
+                for nt in component:
+                    for child, weight in weighted_edges.get(nt, ()):
+                        if child not in members:
+                            longest[child] = max(longest[child], value + weight)
+
+            contexts.append([INFINITY if length is None else length for length in longest])
+
+        # Unreachable nonterminals are already excluded by the minimum:
+        return contexts
+
+    # Returns the edges parent -> (child, number of words the rule adds to
+    # the context of the child) for the left (side 0) or right (side 1)
+    # context, with the sibling lengths taken from yields.
+    def context_edges(self, side, yields):
+        edges = {}
+        for lhs, children in self.rules:
+            if len(children) == 1:
+                edges.setdefault(lhs, []).append((children[0], 0))
+            elif side == 0:
+                edges.setdefault(lhs, []).append((children[0], 0))
+                edges.setdefault(lhs, []).append((children[1], yields[children[0]]))
+            else:
+                edges.setdefault(lhs, []).append((children[0], yields[children[1]]))
+                edges.setdefault(lhs, []).append((children[1], 0))
+        return edges
+
+
+#####################################################################
+#                          Cell Queries                             #
+#####################################################################
+
+    # Set of all nonterminals that can have exactly i words on their left:
+    def left_set(self, i):
+        while len(self.left_sets) <= i:
+            length = len(self.left_sets)
+            self.left_sets.append(frozenset(nt for nt in range(self.num_nts)
+                                            if self.min_left[nt] <= length <= self.max_left[nt]))
+        return self.left_sets[i]
+
+    # Set of all nonterminals that can have exactly r words on their right:
+    def right_set(self, r):
+        while len(self.right_sets) <= r:
+            length = len(self.right_sets)
+            self.right_sets.append(frozenset(nt for nt in range(self.num_nts)
+                                             if self.min_right[nt] <= length <= self.max_right[nt]))
+        return self.right_sets[r]
+
+    # Returns False if no nonterminal fits a cell with i words on its left
+    # and r words on its right:
+    def cell_possible(self, i, r):
+        possible = self.cells.get((i, r))
+        if possible is None:
+            possible = not self.left_set(i).isdisjoint(self.right_set(r))
+            self.cells[(i, r)] = possible
+        return possible
+
+
+#####################################################################
+#                     Strongly Connected Components                 #
+#####################################################################
+
+# Tarjan's algorithm without recursion. Takes a dictionary that maps a node to
+# the list of its children and returns the list of components, children first
+# (every component comes after all components that can be reached from it).
+def strongly_connected_components(edges):
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    counter = 0
+
+    nodes = set(edges)
+    for children in edges.itervalues():
+        nodes.update(children)
+
+    for root in nodes:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        frames = [(root, iter(edges.get(root, ())))]
+
+        while frames:
+            node, children = frames[-1]
+            descended = False
+
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    frames.append((child, iter(edges.get(child, ()))))
+                    descended = True
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+
+            if descended:
+                continue
+
+            frames.pop()
+            if frames:
+                parent = frames[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+
+    return components
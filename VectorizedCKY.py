@@ -0,0 +1,276 @@
+#####################################################################
+##                    Probabilistic CKY Parser                     ##
+##                  Vectorized NumPy Chart Engine                  ##
+#####################################################################
+
+
+#####################################################################
+# File:                           VectorizedCKY.py                  #
+# Author:                         Aline Castendiek                  #
+#####################################################################
+
+import numpy
+from ParseResult import ParseResult
+
+# Alternative chart engine for ProbCKYParser. The chart is stored as a dense
+# array of log probabilities (span x start x nonterminal) and two integer
+# backpointer arrays (best rule and best partition of the span). All binary
+# rules are applied to all partitions of a span at once as one array
+# operation, so the cost per cell no longer depends on Python loops over
+# nonterminals and productions. Pays off for grammars with many nonterminals.
+class VectorizedCKY(object):
+
+    # Takes a CompiledGrammar, the pruning options of ProbCKYParser, for
+    # coarse-to-fine parsing the list that maps fine ids to coarse ids and
+    # optionally the SpanFeasibility of the grammar:
+    def __init__(self, grammar, beam_size=None, beam_threshold=None, max_span_labels=None, projection=None,
+                 feasibility=None):
+        self.grammar = grammar
+
+        # Context length bounds of every nonterminal (see SpanFeasibility.py):
+        self.feasibility = None
+        if feasibility is not None:
+            self.feasibility = tuple(numpy.array(bounds, dtype=numpy.float64) for bounds in
+                                     (feasibility.min_left, feasibility.max_left, feasibility.min_right, feasibility.max_right))
+        self.skipped_cells = 0
+
+        self.projection = None
+        if projection is not None:
+            self.projection = numpy.array(projection, dtype=numpy.int32)
+
+        self.beam_size = beam_size
+        self.max_span_labels = max_span_labels
+        # The relative beam is applied to log probabilities:
+        self.log_beam = None
+        if beam_threshold is not None:
+            self.log_beam = numpy.log(beam_threshold) if beam_threshold > 0 else -numpy.inf
+        self.pruning = beam_size is not None or beam_threshold is not None
+        self.pruned_entries = 0
+
+        rules = []
+        for left, by_right in grammar.binary.iteritems():
+            for right, rule_list in by_right.iteritems():
+                for lhs, prob in rule_list:
+                    if prob > 0:
+                        rules.append((lhs, left, right, prob))
+
+        # Sort the rules by their lhs, so that the best rule for each
+        # nonterminal can be found with a single segmented reduction:
+        rules.sort()
+
+        self.rule_lhs = numpy.array([rule[0] for rule in rules], dtype=numpy.int32)
+        self.rule_left = numpy.array([rule[1] for rule in rules], dtype=numpy.int32)
+        self.rule_right = numpy.array([rule[2] for rule in rules], dtype=numpy.int32)
+        self.rule_logp = numpy.log(numpy.array([rule[3] for rule in rules], dtype=numpy.float64))
+
+        # Start positions of the lhs segments and the lhs of every segment:
+        if len(rules) > 0:
+            self.segment_starts = numpy.flatnonzero(numpy.r_[True, self.rule_lhs[1:] != self.rule_lhs[:-1]])
+        else:
+            self.segment_starts = numpy.zeros(0, dtype=numpy.int64)
+        self.segment_lhs = self.rule_lhs[self.segment_starts]
+        self.segment_lengths = numpy.diff(numpy.r_[self.segment_starts, len(rules)])
+
+        self.chart = None
+        self.back_rule = None
+        self.back_split = None
+        self.words = []
+
+
+#####################################################################
+#                         Vectorized Parse                          #
+#####################################################################
+
+    # Fills the chart for the input sentence and returns a pair of the most
+    # likely tree and its probability, or None if there is no parse. allowed
+    # restricts the chart to the output of the coarse pass (see CoarseToFine.py).
+    def parse(self, words, allowed=None):
+        n = len(words)
+        num_nts = len(self.grammar.nonterminals)
+        num_rules = len(self.rule_lhs)
+        self.words = words
+        self.pruned_entries = 0
+        self.skipped_cells = 0
+
+        # chart[span-1, start, nonterminal] = best log probability:
+        self.chart = numpy.full((n, n, num_nts), -numpy.inf)
+        # Index of the best binary rule and partition of the span:
+        self.back_rule = numpy.full((n, n, num_nts), -1, dtype=numpy.int32)
+        self.back_split = numpy.zeros((n, n, num_nts), dtype=numpy.int32)
+
+        # Lexical rules:
+        for i in range(n):
+            for lhs, prob in self.grammar.lexical_rules(words[i]):
+                if prob > 0:
+                    self.chart[0, i, lhs] = numpy.log(prob)
+            if allowed is not None:
+                self.restrict(self.chart[0, i], allowed[0][i])
+            if self.feasibility is not None:
+                self.chart[0, i][~self.feasible_mask(i, n-i-1)] = -numpy.inf
+            if self.pruning:
+                self.pruned_entries += self.prune_cell(self.chart[0, i])
+        if self.max_span_labels is not None and n > 0:
+            self.pruned_entries += self.prune_span(1, n)
+
+        if num_rules > 0:
+            rule_index = numpy.arange(num_rules)
+
+            for span in range(2, n+1):
+                # All partitions of the span at once:
+                splits = numpy.arange(1, span)
+
+                for i in range(n-span+1):
+                    # Skip cells that did not survive the coarse pass:
+                    if allowed is not None and not allowed[span-1][i]:
+                        continue
+
+                    # Skip cells in which no nonterminal can be part of a parse
+                    # of the whole sentence:
+                    feasible = None
+                    if self.feasibility is not None:
+                        feasible = self.feasible_mask(i, n-i-span)
+                        if not feasible.any():
+                            self.skipped_cells += 1
+                            continue
+
+                    # left[s] and right[s] are the cells of partition splits[s]:
+                    left = self.chart[splits-1, i]
+                    right = self.chart[span-splits-1, i+splits]
+
+                    # Score of every rule for every partition:
+                    scores = self.rule_logp + left[:, self.rule_left] + right[:, self.rule_right]
+
+                    # Best partition per rule:
+                    best_split = scores.argmax(axis=0)
+                    best = scores[best_split, rule_index]
+
+                    # Best rule per lhs:
+                    segment_best = numpy.maximum.reduceat(best, self.segment_starts)
+                    found = segment_best > -numpy.inf
+                    if not found.any():
+                        continue
+
+                    cell = self.chart[span-1, i]
+                    cell[self.segment_lhs[found]] = segment_best[found]
+                    if allowed is not None:
+                        self.restrict(cell, allowed[span-1][i])
+                    if feasible is not None:
+                        cell[~feasible] = -numpy.inf
+
+                    # The winning rules are the ones that reach the maximum of
+                    # their segment. Reversed, so that the first one wins a tie:
+                    winners = numpy.flatnonzero((best == numpy.repeat(segment_best, self.segment_lengths)) & (best > -numpy.inf))[::-1]
+                    self.back_rule[span-1, i, self.rule_lhs[winners]] = winners
+                    self.back_split[span-1, i, self.rule_lhs[winners]] = splits[best_split[winners]]
+
+                    if self.pruning:
+                        self.pruned_entries += self.prune_cell(cell)
+
+                if self.max_span_labels is not None:
+                    self.pruned_entries += self.prune_span(span, n)
+
+        start = self.grammar.start
+        if n == 0 or self.chart[n-1, 0, start] == -numpy.inf:
+            return None
+
+        return ParseResult(self.extract_derivation(0, n, start), words, float(numpy.exp(self.chart[n-1, 0, start])))
+
+
+#####################################################################
+#                            Restrict                               #
+#####################################################################
+
+    # Removes all entries of a cell whose coarse label is not allowed:
+    def restrict(self, cell, allowed_cell):
+        if not allowed_cell:
+            cell[:] = -numpy.inf
+            return
+        keep = numpy.in1d(self.projection, list(allowed_cell))
+        cell[~keep] = -numpy.inf
+
+
+#####################################################################
+#                          Feasible Mask                            #
+#####################################################################
+
+    # Returns a boolean array that is True for all nonterminals that can have
+    # i words on their left and r words on their right in a complete parse:
+    def feasible_mask(self, i, r):
+        min_left, max_left, min_right, max_right = self.feasibility
+        return (min_left <= i) & (max_left >= i) & (min_right <= r) & (max_right >= r)
+
+
+#####################################################################
+#                            Pruning                                #
+#####################################################################
+
+    # Applies the beam options to one cell (a view into the chart) and
+    # returns the number of removed entries.
+    def prune_cell(self, cell):
+        found = numpy.flatnonzero(cell > -numpy.inf)
+        if found.size == 0:
+            return 0
+        removed = 0
+
+        if self.log_beam is not None:
+            limit = cell[found].max() + self.log_beam
+            dropped = found[cell[found] < limit]
+            cell[dropped] = -numpy.inf
+            removed += dropped.size
+            found = found[cell[found] > -numpy.inf]
+
+        if self.beam_size is not None and found.size > self.beam_size:
+            ranked = numpy.argsort(-cell[found], kind="mergesort")
+            dropped = found[ranked[self.beam_size:]]
+            cell[dropped] = -numpy.inf
+            removed += dropped.size
+
+        return removed
+
+    # Keeps only the max_span_labels best nonterminals over all cells of
+    # the given span length. Returns the number of removed entries.
+    def prune_span(self, span, n):
+        row = self.chart[span-1, :n-span+1]
+        best = row.max(axis=0)
+        found = numpy.flatnonzero(best > -numpy.inf)
+        if found.size <= self.max_span_labels:
+            return 0
+
+        ranked = numpy.argsort(-best[found], kind="mergesort")
+        dropped = found[ranked[self.max_span_labels:]]
+        removed = int((row[:, dropped] > -numpy.inf).sum())
+        row[:, dropped] = -numpy.inf
+        return removed
+
+
+#####################################################################
+#                        Extract Derivation                         #
+#####################################################################
+
+    # Returns the derivation of a nonterminal id covering the span of the
+    # given length starting at position i as list of nodes in preorder (see
+    # ParseResult.py). An explicit stack is used instead of recursion, so
+    # long sentences cannot exceed the recursion limit.
+    def extract_derivation(self, i, span, symbol):
+        nonterminals = self.grammar.nonterminals
+        nodes = []
+        stack = [(symbol, i, span)]
+
+        while stack:
+            symbol, i, span = stack.pop()
+            label = nonterminals[symbol]
+
+            # Leaf node:
+            if span == 1:
+                nodes.append((label, i, i+1, 0))
+                continue
+
+            # Look up the best rule and partition. The second child is pushed
+            # first, so the first one comes next in the list:
+            rule = self.back_rule[span-1, i, symbol]
+            k = int(self.back_split[span-1, i, symbol])
+            nodes.append((label, i, i+span, 2))
+            stack.append((int(self.rule_right[rule]), i+k, span-k))
+            stack.append((int(self.rule_left[rule]), i, k))
+
+        return nodes
@@ -23,7 +23,17 @@
 
 
 import CKYProbabilisticParser
+import AStarParser
 import CNFConversion
+import BatchParsing
+import GrammarCache
+import PCFGLoader
+import BitparLexicon
+import ResultCache
+import ParseStats
+import OutputWriters
+from CompiledGrammar import CompiledGrammar
+import argparse
 import sys
 import nltk.grammar
 
@@ -44,65 +54,344 @@ def is_in_cnf(grammar):
 
 
 #####################################################################
-#                       Parsing Process                             #
+#                          Create Parser                            #
 #####################################################################
 
-# Command line arguments: 
-# [0]: main.py
-# [1]: probabilistic context free grammar
-# [2]: file with input sentences
-# [3]: output file 
-if len(sys.argv) == 4:
-    
-    # Read in grammar from command line:
-    filepath = "file:{0}".format(sys.argv[1])
+# Reads in the grammar, converts it to CNF if necessary and returns the parser.
+# If use_cache is set, the converted and compiled grammar is stored next to the
+# grammar file (see GrammarCache.py) and later runs load it from there, which
+# skips reading the grammar file and the whole conversion.
+# If unary_closure is set, unit rules are not removed from the grammar, the
+# parser applies the unary closure while parsing instead. separation is the
+# terminal separation strategy of CNF_Conversion, binarization its direction
+# and share_intermediates lets rules share their new nonterminals. If report
+# is set, the number of rules after every conversion stage is printed; the
+# grammar is then always converted (and the cache refreshed), since a cached
+# grammar has no conversion stages to report.
+# lexicon_path is an optional indexed BitPar lexicon (see BitparLexicon.py)
+# that provides the lexical rules of the input words while parsing. If
+# astar_heuristic is given, the A* parser with this outside estimate is
+# returned instead of the CKY parser (see AStarParser.py). result_cache is an
+# optional ResultCache for the CKY parser. If stats is set, the CKY parser
+# collects parse statistics (see ParseStats.py).
+def create_parser(grammar_path, use_cache=True, unary_closure=False, separation="cartesian",
+                  binarization="right", share_intermediates=False, report=False, lexicon_path=None,
+                  astar_heuristic=None, result_cache=None, stats=False):
+
+    lexicon = None
+    if lexicon_path is not None:
+        lexicon = BitparLexicon.BitparLexicon(lexicon_path)
+
+    # Every conversion variant is cached separately:
+    variant_parts = []
+    if unary_closure:
+        variant_parts.append("unary")
+    if separation != "cartesian":
+        variant_parts.append(separation)
+    if binarization != "right":
+        variant_parts.append(binarization)
+    if share_intermediates:
+        variant_parts.append("shared")
+    variant = "-".join(variant_parts)
+
+    if use_cache:
+        cache_key = GrammarCache.grammar_key(grammar_path, variant)
+        # The report needs the conversion, so the cached grammar is not used:
+        compiled_gram = None if report else GrammarCache.load(grammar_path, cache_key, variant)
+        if compiled_gram is not None:
+            return new_parser(compiled_gram, unary_closure, lexicon, astar_heuristic, result_cache, stats)
+
+    # Read in grammar from command line. The PCFGLoader reads the same rules as
+    # nltk.data.load, but much faster and without building NLTK productions:
+    start, rules = PCFGLoader.PCFGLoader().read(grammar_path)
+
+    if PCFGLoader.rules_in_cnf(rules, unary_closure):
+        # Compile the grammar for the parser directly from the rules:
+        compiled_gram = CompiledGrammar(start, rules)
+        if report:
+            print "The grammar is already in CNF, there is no conversion to report. \n"
 
-    grammar = nltk.data.load(filepath, 'pcfg')
-    parser = None
-    
-    # If the grammar is not in CNF, we want to create a CNF-Conversion object:
-    if not is_in_cnf(grammar):
-        cnf_instance = CNFConversion.CNF_Conversion(grammar)
-        # Get grammar and save it:
-        cnf_converted_gram = cnf_instance.get_grammar()
-        
-        # Create parser object for newly converted gram:
-        parser = CKYProbabilisticParser.ProbCKYParser(cnf_converted_gram)
-        
     else:
-        # Else create the parser using the original grammar:
-        parser = CKYProbabilisticParser.ProbCKYParser(grammar) 
-    
-    # Open and read input file:
-    input_file = open(sys.argv[2], 'r')
-    parse_list = []
-    # Split every sentence in input and add it to a list that contains all sentences:
-    for sentence in input_file:
-        parse_list.append(sentence.split())
-    
-    # Create and open the file that will contain the results:
-    output_file = open(sys.argv[3], 'w')
-    # Parse every sentence in parse_list and write the result into output file:
-    for parse_sentence in parse_list:
-        # print "Parse_sentence :", parse_sentence
-        result = parser.prob_cky_parse(parse_sentence)
-        #print "Result: ", result
-        output_file.write("{0} \t {1} \n".format(result[0], result[1]))
-        
-    output_file.close()
+        # If the grammar is not in CNF, we want to create a CNF-Conversion object:
+        grammar = PCFGLoader.to_weighted_grammar(start, rules)
+        cnf_instance = CNFConversion.CNF_Conversion(grammar, remove_unit_rules=not unary_closure, separation=separation,
+                                                    binarization=binarization, share_intermediates=share_intermediates)
+        if report:
+            print cnf_instance.report()
+        # Get grammar and compile it for the parser:
+        compiled_gram = CompiledGrammar.from_grammar(cnf_instance.get_grammar())
+
+    if use_cache and not GrammarCache.save(grammar_path, cache_key, compiled_gram, variant):
+        print "WARNING: Could not write grammar cache {0} \n".format(GrammarCache.cache_path(grammar_path, variant))
+
+    return new_parser(compiled_gram, unary_closure, lexicon, astar_heuristic, result_cache, stats)
+
+
+# Returns the parser for a compiled grammar:
+def new_parser(compiled_gram, unary_closure, lexicon, astar_heuristic, result_cache=None, stats=False):
+    if astar_heuristic is not None:
+        return AStarParser.AStarParser(compiled_gram, astar_heuristic, unary_closure=unary_closure, lexicon=lexicon)
+    # The trees are only built if the output format needs them (see OutputWriters.py):
+    return CKYProbabilisticParser.ProbCKYParser(compiled_gram, unary_closure=unary_closure, lexicon=lexicon,
+                                                result_cache=result_cache, stats=stats, lazy_results=True)
+
+
+#####################################################################
+#                       Finish Result Cache                         #
+#####################################################################
+
+# Writes the result cache back into its file (if it has one) and prints its
+# statistics:
+def finish_result_cache(result_cache):
+    if result_cache.path is not None and not result_cache.save():
+        print "WARNING: Could not write result cache {0} \n".format(result_cache.path)
+    result_cache.print_stats()
+
+
+#####################################################################
+#                          Read Sentences                           #
+#####################################################################
+
+# Generator that reads the input line by line and yields the tokenized
+# sentences. readline is used instead of iterating over the file, because
+# the file iterator reads ahead, which would delay the first results when
+# the input comes from a pipe.
+def read_sentences(input_file):
+    for sentence in iter(input_file.readline, ''):
+        yield sentence.split()
+
+
+#####################################################################
+#                          Parse Stream                             #
+#####################################################################
+
+# Parses the input sentence by sentence and writes every result as soon as it
+# is ready. "-" stands for stdin or stdout. Only the current sentences are
+# kept in memory, so the input can be arbitrarily large. With k_best, the
+# k_best most likely trees of every sentence are written. The parse statistics
+# are added to parse_stats (if given). output_format is the name of the
+# output writer (see OutputWriters.py).
+def parse_stream(parser, input_path, output_path, workers, k_best=None, parse_stats=None, output_format="tree"):
+    input_file = sys.stdin if input_path == "-" else open(input_path, 'r')
+
+    if output_path == "-":
+        output_file = sys.stdout
+        # The parser prints its error messages, they must not end up in the results:
+        sys.stdout = sys.stderr
+    else:
+        output_file = open(output_path, 'wb' if OutputWriters.FORMATS[output_format].binary else 'w')
+
+    # Every result is written as soon as it is ready, so that the output can
+    # be read while the input is parsed:
+    writer = OutputWriters.create_writer(output_format, output_file)
+    worker_stats = {}
+    for result in BatchParsing.parse_stream(parser, read_sentences(input_file), workers, stats=worker_stats, k_best=k_best,
+                                            parse_stats=parse_stats):
+        if k_best is not None:
+            writer.write_k_best(result)
+        else:
+            writer.write(result)
+        writer.flush()
+    writer.close()
+
+    if input_file is not sys.stdin:
+        input_file.close()
+    if output_file is not sys.__stdout__:
+        output_file.close()
+
+    return worker_stats
 
 
 #####################################################################
 #                       Print Instructions                          #
 #####################################################################
 
-else:  
+def print_instructions():
     print "USAGE FOR PARSING: "     
-    print "python main.py pcfg input_file output_file \n"
+    print "python main.py [--workers N] [--stream] [--no-cache] [--unary-closure] [--separation S]"
+    print "               [--binarization D] [--share-intermediates] [--conversion-report] [--lexicon L]"
+    print "               [--astar] [--heuristic H] [--k-best K] [--result-cache] [--result-cache-file F]"
+    print "               [--result-cache-size N] [--result-cache-words W] [--stats] [--output-format F]"
+    print "               pcfg input_file output_file \n"
     print "pcfg = A probabilistic context free grammar. All rules have to be of this form: nonterminal -> symbols [float value], "
     print "so that they have exactly one nonterminal symbol on the left hand side and at least one symbol on the right hand side. "
     print "Terminal symbols must be represented with single quotation marks. The probability value of the rule must be written " 
     print "in square brackets. Any additional characters might cause problems for NLTK. \n"
     print               "input_file = File to be parsed that contains one sentence per line. Words will be tokenized by spaces. \n"
     print               "output_file = File in which the trees and their probabilities will be written. \n"
-    
\ No newline at end of file
+    print               "--workers N = Parse with N worker processes (default: 1). The grammar is converted only once. \n"
+    print               "--stream = Parse sentences while they are read and write every result immediately. In this mode "
+    print               "input_file and output_file can be - for stdin and stdout. \n"
+    print               "--no-cache = Do not use the converted grammar cache. By default the converted grammar is stored in "
+    print               "pcfg.cnfcache and reused as long as the grammar file does not change. \n"
+    print               "--unary-closure = Keep the unit rules of the grammar and apply their closure while parsing. "
+    print               "The unary nodes then appear in the trees. \n"
+    print               "--separation S = How terminals in rules with more than one symbol are replaced during the CNF "
+    print               "conversion. cartesian (default): by every nonterminal that produces them, which creates one rule "
+    print               "for every combination. preterminal: by one new preterminal per terminal (e.g. T_a -> 'a'), "
+    print               "which keeps the converted grammar small. \n"
+    print               "--binarization D = Direction of the binarization: right (default, S -> A X1, X1 -> B C) "
+    print               "or left (S -> X1 C, X1 -> A B). \n"
+    print               "--share-intermediates = Rules with the same suffix (or prefix for left binarization) share the "
+    print               "new nonterminals of the binarization, which gives fewer nonterminals and binary rules. \n"
+    print               "--conversion-report = Print the number of rules after every conversion stage (the grammar "
+    print               "is converted even if it is in the grammar cache). \n"
+    print               "--lexicon L = BitPar lexicon that provides the lexical rules of the input words while parsing "
+    print               "(see preprocess_bitpar_grammar.py --index-lexicon). Only the rules of the words that occur in "
+    print               "the input are loaded. Implies --unary-closure, so that unit rules above the PoS tags still apply. \n"
+    print               "--astar = Parse with the A* parser, which finds the same best parse as the CKY parser, but stops "
+    print               "as soon as it is found instead of filling the whole chart. \n"
+    print               "--heuristic H = Outside estimate of the A* parser: span (default, needs NumPy), grammar or none. \n"
+    print               "--k-best K = Write the K most likely trees of every sentence (most probable first), followed by "
+    print               "an empty line. Not available with --astar. \n"
+    print               "--result-cache = Keep the results of parsed sentences in memory, so that repeated sentences are "
+    print               "not parsed again. The number of hits and misses is printed at the end. Not available with --astar. \n"
+    print               "--result-cache-file F = Like --result-cache, but the results are also loaded from and saved to "
+    print               "the file F, so that they are kept across runs. Results of other grammars in F stay valid. \n"
+    print               "--result-cache-size N = Keep at most N results, the least recently used ones are evicted "
+    print               "(default: 10000). \n"
+    print               "--result-cache-words W = Keep at most W words in all cached sentences together. \n"
+    print               "--stats = Count the work of the parser (chart cells, split points, candidate edges, chart "
+    print               "entries) and time its phases, and print the totals over all sentences at the end. Sentences "
+    print               "taken from the result cache are not counted. Not available with --astar. \n"
+    print               "--output-format F = Format of the output file: tree (default, the pretty-printed tree and its "
+    print               "probability), penn (the tree in brackets on one line, a tab and the probability), jsonl (one "
+    print               "JSON object per sentence with the bracketed tree and the probability) or spans (compact binary "
+    print               "format with the labels and spans of all nodes, see OutputWriters.py). \n"
+
+
+#####################################################################
+#                       Parsing Process                             #
+#####################################################################
+
+# Command line arguments: 
+# [0]: main.py
+# [1]: probabilistic context free grammar
+# [2]: file with input sentences
+# [3]: output file 
+# Options:
+# --workers: number of worker processes
+# --stream: parse while reading and write results immediately
+# --no-cache: always read and convert the grammar
+# --unary-closure: keep unit rules and apply the unary closure while parsing
+# --separation: terminal separation strategy of the CNF conversion
+# --binarization: direction of the binarization
+# --share-intermediates: share the new nonterminals of the binarization
+# --conversion-report: print the rule counts of the CNF conversion stages
+# --lexicon: indexed BitPar lexicon for the lexical rules (implies --unary-closure)
+# --astar: parse with the A* parser
+# --heuristic: outside estimate of the A* parser
+# --k-best: number of trees per sentence
+# --result-cache: keep the results of parsed sentences
+# --result-cache-file: file for the result cache (implies --result-cache)
+# --result-cache-size, --result-cache-words: size limits of the result cache
+# --stats: collect and print parse statistics
+# --output-format: format of the output file
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(add_help=False)
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("--workers", type=int, default=1)
+    arg_parser.add_argument("--stream", action="store_true")
+    arg_parser.add_argument("--no-cache", dest="cache", action="store_false")
+    arg_parser.add_argument("--unary-closure", action="store_true")
+    arg_parser.add_argument("--separation", choices=CNFConversion.CNF_Conversion.SEPARATIONS, default="cartesian")
+    arg_parser.add_argument("--binarization", choices=CNFConversion.CNF_Conversion.BINARIZATIONS, default="right")
+    arg_parser.add_argument("--share-intermediates", action="store_true")
+    arg_parser.add_argument("--conversion-report", action="store_true")
+    arg_parser.add_argument("--lexicon")
+    arg_parser.add_argument("--astar", action="store_true")
+    arg_parser.add_argument("--heuristic", choices=AStarParser.AStarParser.HEURISTICS, default="span")
+    arg_parser.add_argument("--k-best", type=int)
+    arg_parser.add_argument("--result-cache", action="store_true")
+    arg_parser.add_argument("--result-cache-file")
+    arg_parser.add_argument("--result-cache-size", type=int, default=10000)
+    arg_parser.add_argument("--result-cache-words", type=int)
+    arg_parser.add_argument("--stats", action="store_true")
+    arg_parser.add_argument("--output-format", choices=sorted(OutputWriters.FORMATS), default="tree")
+    arguments, unknown = arg_parser.parse_known_args()
+
+    # The lexical rules of the lexicon are only known while parsing, so unit
+    # rules above the PoS tags cannot be removed from the grammar beforehand:
+    if arguments.lexicon is not None:
+        arguments.unary_closure = True
+
+    # The A* parser stops at the best tree, it cannot enumerate the others:
+    if arguments.k_best is not None and (arguments.astar or arguments.k_best < 1):
+        unknown.append("--k-best")
+
+    result_cache = None
+    if arguments.result_cache or arguments.result_cache_file is not None:
+        if arguments.astar:
+            unknown.append("--result-cache")
+        else:
+            result_cache = ResultCache.ResultCache(arguments.result_cache_size, arguments.result_cache_words,
+                                                   arguments.result_cache_file)
+
+    # Statistics are only collected by the CKY parser:
+    parse_stats = None
+    if arguments.stats:
+        if arguments.astar:
+            unknown.append("--stats")
+        else:
+            parse_stats = ParseStats.ParseStats()
+
+    if len(arguments.files) == 3 and not unknown and arguments.stream:
+
+        parser = create_parser(arguments.files[0], arguments.cache, arguments.unary_closure,
+                               arguments.separation, arguments.binarization,
+                               arguments.share_intermediates, arguments.conversion_report, arguments.lexicon,
+                               arguments.heuristic if arguments.astar else None, result_cache, arguments.stats)
+        worker_stats = parse_stream(parser, arguments.files[1], arguments.files[2], arguments.workers, arguments.k_best,
+                                    parse_stats, arguments.output_format)
+
+        if arguments.workers > 1:
+            BatchParsing.print_worker_stats(worker_stats)
+        if result_cache is not None:
+            finish_result_cache(result_cache)
+        if parse_stats is not None:
+            parse_stats.print_stats()
+
+    elif len(arguments.files) == 3 and not unknown:
+
+        parser = create_parser(arguments.files[0], arguments.cache, arguments.unary_closure,
+                               arguments.separation, arguments.binarization,
+                               arguments.share_intermediates, arguments.conversion_report, arguments.lexicon,
+                               arguments.heuristic if arguments.astar else None, result_cache, arguments.stats)
+    
+        # Open and read input file:
+        input_file = open(arguments.files[1], 'r')
+        parse_list = []
+        # Split every sentence in input and add it to a list that contains all sentences:
+        for sentence in input_file:
+            parse_list.append(sentence.split())
+        input_file.close()
+
+        # Parse every sentence in parse_list (longest sentences first if there is more
+        # than one worker). The results come back in the original order:
+        results, worker_stats = BatchParsing.parse_batch(parser, parse_list, arguments.workers, arguments.k_best,
+                                                         parse_stats)
+    
+        # Create and open the file that will contain the results:
+        writer_class = OutputWriters.FORMATS[arguments.output_format]
+        output_file = open(arguments.files[2], 'wb' if writer_class.binary else 'w')
+        # Write every result into output file (the writer writes them in bulk):
+        writer = writer_class(output_file)
+        for result in results:
+            if arguments.k_best is not None:
+                writer.write_k_best(result)
+            else:
+                writer.write(result)
+        writer.close()
+        
+        output_file.close()
+
+        if arguments.workers > 1:
+            BatchParsing.print_worker_stats(worker_stats)
+        if result_cache is not None:
+            finish_result_cache(result_cache)
+        if parse_stats is not None:
+            parse_stats.print_stats()
+
+    else:  
+        print_instructions()
@@ -15,7 +15,10 @@
 #####################################################################
 
 import CKYProbabilisticParser
-import sys
+import BatchParsing
+import ParseStats
+import OutputWriters
+import argparse
 import nltk.grammar 
 
 #####################################################################
@@ -94,57 +97,81 @@ def create_wsj_grammar(no_of_sentences):
 
 
 #####################################################################
-#                            Main Function                          #
+#                       Print Instructions                          #
 #####################################################################
 
-# Command line arguments: 
-# [0]: wsj_main.py
-# [1]: number of desired sentences 
-# [2]: any chosen output file
-if len(sys.argv) == 3:
-
-    # Call function to create a grammar object for any number of sentences:
-    wsj_grammar = create_wsj_grammar(int(sys.argv[1]))
-    input_sent = wsj_grammar[1]             # Object index 1 contains the input sentences  
-    grammar = wsj_grammar[0]                # Object index 0 contains correspondent grammar
-
-    #print grammar
-    #print input_sent
-
-    # Set parser to None in the beginning (just in case):
-    #parser = None
-
-    # Create parser object for newly created grammar:
-    parser = CKYProbabilisticParser.ProbCKYParser(grammar) 
-
-    parse_list = []
-
-    # Split every sentence in input and add it to a list that contains all sentences:
-    for sentence in input_sent:
-        parse_list.append(sentence.split())
-
-    # Create and open a file:
-    output_file = open(sys.argv[2], 'w')
-    # Parse every sentence in parse_list and write the result into output file:
-    for parse_sentence in parse_list:
-        #print "parse_sentence :", parse_sentence
-        result = parser.prob_cky_parse(parse_sentence)
-        #result[0].draw()
-        #print "result: ", result
-        #print "Type of result: ", type(result)
-
-        # Formatting results (result[0] is the tree, result[1] is its probability):
-        output_file.write("{0} \t {1} \n".format(result[0], result[1]))
-    output_file.close()
-
-# Print instructions:
-else:
-    print "USAGE: wsj_main.py number_of_sentences output_file \n"
+def print_instructions():
+    print "USAGE: wsj_main.py [--workers N] [--stats] [--output-format F] number_of_sentences output_file \n"
     print "number_of_sentences: Desired number of input sentences that should be parsed. \n"
     print "output_file: Choose a file name, that file will be created and contain the result. \n"
+    print "--workers N: Parse with N worker processes (default: 1). The grammar is created only once. \n"
+    print "--stats: Count the work of the parser and time its phases, and print the totals at the end. \n"
+    print "--output-format F: Format of the output file: tree (default), penn, jsonl or spans (see main.py). \n"
     print "IMPORTANT INFORMATION: For the programm to run properly, you will need to download the Wall Street Journal from NLTK. \n"
     print "To obtain the Wall Street Journal, please execute following steps: \n" 
     print "1. Open your python command line. \n"
     print "2. Type 'import nltk' \n"
     print "3. Type 'nltk.download()' \n"
     print "4. The NLTK Downloader will open. Under Corpora, choose the appropriate corpus and click download."
+
+
+#####################################################################
+#                            Main Function                          #
+#####################################################################
+
+# Command line arguments: 
+# [0]: wsj_main.py
+# [1]: number of desired sentences 
+# [2]: any chosen output file
+# Options:
+# --workers: number of worker processes
+# --stats: collect and print parse statistics
+# --output-format: format of the output file
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(add_help=False)
+    arg_parser.add_argument("arguments", nargs="*")
+    arg_parser.add_argument("--workers", type=int, default=1)
+    arg_parser.add_argument("--stats", action="store_true")
+    arg_parser.add_argument("--output-format", choices=sorted(OutputWriters.FORMATS), default="tree")
+    options, unknown = arg_parser.parse_known_args()
+
+    if len(options.arguments) == 2 and not unknown:
+
+        # Call function to create a grammar object for any number of sentences:
+        wsj_grammar = create_wsj_grammar(int(options.arguments[0]))
+        input_sent = wsj_grammar[1]             # Object index 1 contains the input sentences  
+        grammar = wsj_grammar[0]                # Object index 0 contains correspondent grammar
+
+        # Create parser object for newly created grammar:
+        parser = CKYProbabilisticParser.ProbCKYParser(grammar, stats=options.stats, lazy_results=True)
+
+        parse_list = []
+
+        # Split every sentence in input and add it to a list that contains all sentences:
+        for sentence in input_sent:
+            parse_list.append(sentence.split())
+
+        # Parse every sentence in parse_list (longest sentences first if there is more
+        # than one worker). The results come back in the original order:
+        parse_stats = ParseStats.ParseStats() if options.stats else None
+        results, worker_stats = BatchParsing.parse_batch(parser, parse_list, options.workers, parse_stats=parse_stats)
+
+        # Create and open a file:
+        writer_class = OutputWriters.FORMATS[options.output_format]
+        output_file = open(options.arguments[1], 'wb' if writer_class.binary else 'w')
+        # Write every result into output file (the writer writes them in bulk):
+        writer = writer_class(output_file)
+        for result in results:
+            writer.write(result)
+        writer.close()
+        output_file.close()
+
+        if options.workers > 1:
+            BatchParsing.print_worker_stats(worker_stats)
+        if parse_stats is not None:
+            parse_stats.print_stats()
+
+    # Print instructions:
+    else:
+        print_instructions()